@@ -0,0 +1,147 @@
+"""
+async_pipeline.py
+asyncio runner for chained process pipelines (decode -> process -> encode).
+
+Popen chains waited on one by one hang when a later stage dies: the decoder
+blocks forever on a full pipe and the script never notices. This runner
+launches every stage of a pipeline, connects them with enlarged OS pipes
+(pipe_buffers.py; the frames never pass through Python) and supervises them:
+
+  * a stage exiting non-zero terminates all other stages at once,
+  * cancelling the task (Ctrl+C, a sibling pipeline failing) terminates them too,
+  * a pipeline whose pipes move no data for `stall_timeout` seconds is killed.
+    Progress is read from the kernel's per-process I/O counters (/proc/<pid>/io);
+    where those are not available stall detection is off.
+
+Several run_pipeline() calls can share one event loop, each releasing its
+processes as soon as it fails; enhance_with_cuda_stream.py runs its
+--parallel-segments pipelines that way.
+"""
+
+import asyncio
+import os
+import subprocess
+
+from pipe_buffers import set_pipe_size
+
+PIPE_SIZE = 64 << 20        # capped at pipe-max-size
+STALL_TIMEOUT = 120.0       # seconds without any pipe traffic
+POLL_INTERVAL = 1.0
+TERMINATE_GRACE = 5.0
+
+
+class PipelineError(RuntimeError):
+    """A pipeline failed; `returncodes` has one entry per stage (negative = killed by signal)."""
+
+    def __init__(self, message, returncodes):
+        super().__init__(message)
+        self.returncodes = returncodes
+
+
+def io_progress(pid):
+    """Bytes read + written by `pid` so far, or None when /proc/<pid>/io is not readable."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return int(fields["rchar"]) + int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+async def _stop(procs, grace=TERMINATE_GRACE):
+    """Terminate every still running stage, kill whatever ignores SIGTERM."""
+    running = [p for p in procs if p.returncode is None]
+    for p in running:
+        try:
+            p.terminate()
+        except ProcessLookupError:
+            pass
+    if not running:
+        return
+    _, pending = await asyncio.wait([asyncio.ensure_future(p.wait()) for p in running], timeout=grace)
+    for p in running:
+        if p.returncode is None:
+            try:
+                p.kill()
+            except ProcessLookupError:
+                pass
+    if pending:
+        await asyncio.wait(pending)
+
+
+async def _spawn(stages):
+    procs = []
+    upstream = subprocess.DEVNULL
+    read_end = None
+    try:
+        for i, cmd in enumerate(stages):
+            read_end = write_end = None
+            if i < len(stages) - 1:
+                read_end, write_end = os.pipe()
+                set_pipe_size(write_end, PIPE_SIZE)
+            try:
+                procs.append(await asyncio.create_subprocess_exec(
+                    *cmd, stdin=upstream, stdout=write_end))
+            finally:
+                # the children own their ends now; ours must go so EOF and SIGPIPE propagate
+                if upstream is not subprocess.DEVNULL:
+                    os.close(upstream)
+                upstream = None
+                if write_end is not None:
+                    os.close(write_end)
+            upstream, read_end = read_end, None
+    except BaseException:
+        if read_end is not None:
+            os.close(read_end)
+        await _stop(procs)
+        raise
+    return procs
+
+
+async def run_pipeline(stages, stall_timeout=STALL_TIMEOUT, label="pipeline"):
+    """Run `stages` (list of argv lists) chained stdout -> stdin; return their exit codes.
+
+    Raises PipelineError when a stage fails or the pipeline stalls; every
+    stage has exited by the time this returns or raises.
+    """
+    procs = await _spawn(stages)
+    waits = {asyncio.ensure_future(p.wait()): i for i, p in enumerate(procs)}
+    pending = set(waits)
+    last_total, last_change = None, asyncio.get_running_loop().time()
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=POLL_INTERVAL,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                rc = task.result()
+                if rc != 0:
+                    await _stop(procs)
+                    rcs = [p.returncode for p in procs]
+                    raise PipelineError(f"{label}: stage {waits[task]} ({stages[waits[task]][0]}) "
+                                        f"exited with {rc}", rcs)
+            if not stall_timeout or not pending:
+                continue
+            counters = [io_progress(p.pid) for p in procs if p.returncode is None]
+            if any(c is None for c in counters):
+                continue
+            total = sum(counters)
+            now = asyncio.get_running_loop().time()
+            if total != last_total:
+                last_total, last_change = total, now
+            elif now - last_change > stall_timeout:
+                await _stop(procs)
+                raise PipelineError(f"{label}: no pipe progress for {stall_timeout:.0f}s",
+                                    [p.returncode for p in procs])
+    except asyncio.CancelledError:
+        await _stop(procs)
+        raise
+    return [p.returncode for p in procs]
+
+
+def run_stages(stages, stall_timeout=STALL_TIMEOUT, label="pipeline"):
+    """Blocking wrapper: exit codes of the stages; a failed pipeline reports its codes instead of raising."""
+    try:
+        return asyncio.run(run_pipeline(stages, stall_timeout, label))
+    except PipelineError as e:
+        print(f"[ERROR] {e}")
+        return e.returncodes
@@ -0,0 +1,141 @@
+"""
+decoder_select.py
+Pick the decoder arguments for a source instead of hardcoding -hwaccel cuda.
+
+The first time a codec / pixel format / resolution is seen on a machine,
+every hwaccel this ffmpeg build offers (cuda, qsv, vaapi, d3d11va, ...) and
+multi-threaded software decoding are each timed on a short sample of the
+source. Choices that fail are dropped, the fastest working one wins and is
+remembered in a small JSON cache, so later jobs start immediately. A node
+without a GPU therefore decodes on the CPU with frame threading instead of
+failing on -hwaccel cuda. A source ffprobe cannot read (or no ffprobe at
+all) has no cache key and goes straight to software decoding, unbenchmarked.
+
+Frames always come back in system memory (no -hwaccel_output_format), which
+is what the raw-pipe enhancers need anyway.
+
+    decoder_args(path)         -> input options to put before "-i path"
+    DECODER=software|cuda|...     force a choice (skips the benchmark)
+    DECODER_CACHE=/path.json      cache location (default ~/.cache/yt_enhance_decoders.json)
+"""
+
+import functools
+import json
+import os
+import platform
+import subprocess
+import time
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "yt_enhance_decoders.json")
+SAMPLE_FRAMES = 120     # long enough to amortize hwaccel init
+# hwaccels worth trying, in order of preference when timings tie
+HWACCELS = ("cuda", "qsv", "vaapi", "d3d11va", "dxva2", "videotoolbox")
+# libavcodec caps automatic frame threads at 16; more rarely helps a single decode
+MAX_THREADS = 16
+
+
+@functools.lru_cache(maxsize=None)
+def available_hwaccels(ffmpeg=FFMPEG):
+    try:
+        p = subprocess.run([ffmpeg, "-hide_banner", "-hwaccels"], capture_output=True, text=True)
+    except OSError:
+        return ()
+    names = {line.strip() for line in p.stdout.splitlines()[1:] if line.strip()}
+    return tuple(h for h in HWACCELS if h in names)
+
+
+def software_args(threads=None):
+    threads = threads or min(MAX_THREADS, os.cpu_count() or 1)
+    return ["-threads", str(threads), "-thread_type", "frame+slice"]
+
+
+def candidate_args(name):
+    return software_args() if name == "software" else ["-hwaccel", name]
+
+
+@functools.lru_cache(maxsize=None)
+def stream_key(path):
+    """Cache key for the decode cost of `path`: host, codec, pixel format and size."""
+    cmd = [
+        FFPROBE, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,pix_fmt,width,height", "-of", "json", path
+    ]
+    try:
+        p = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError:
+        # no ffprobe: no cache key; select_decoder falls back to software decoding
+        return None
+    if p.returncode != 0:
+        return None
+    s = json.loads(p.stdout)["streams"][0]
+    return f"{platform.node()}|{s.get('codec_name')}|{s.get('pix_fmt')}|{s.get('width')}x{s.get('height')}"
+
+
+def time_decode(path, args, frames=SAMPLE_FRAMES):
+    """Seconds to decode `frames` frames with these input options, or None if it fails."""
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin", *args, "-i", path,
+           "-map", "0:v:0", "-frames:v", str(frames), "-f", "null", "-"]
+    t0 = time.perf_counter()
+    try:
+        p = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    # at -loglevel error anything printed means the hwaccel did not work cleanly
+    if p.returncode != 0 or p.stderr.strip():
+        return None
+    return time.perf_counter() - t0
+
+
+def _load(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(cache_path, data):
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp = cache_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, cache_path)
+
+
+def select_decoder(path, cache_path=None):
+    """Name of the fastest working decoder for `path` ("cuda", ..., or "software")."""
+    forced = os.environ.get("DECODER")
+    if forced:
+        return forced
+    cache_path = cache_path or os.environ.get("DECODER_CACHE", DEFAULT_CACHE)
+    key = stream_key(path)
+    if key is None:
+        # unprobeable source (or no ffprobe): nothing to cache the benchmark under, so don't run one
+        return "software"
+    hwaccels = available_hwaccels()
+    cache = _load(cache_path)
+    if key in cache and cache[key]["decoder"] in hwaccels + ("software",):
+        return cache[key]["decoder"]
+
+    timings = {}
+    for name in hwaccels + ("software",):
+        seconds = time_decode(path, candidate_args(name))
+        if seconds is not None:
+            timings[name] = seconds
+    if not timings:
+        # nothing decoded the sample cleanly; plain software decode gives the clearest error later
+        return "software"
+    best = min(timings, key=timings.get)
+    print(f"[INFO] Decoder for {key}: {best} "
+          f"({', '.join(f'{n} {SAMPLE_FRAMES / t:.0f} fps' for n, t in sorted(timings.items()))})")
+    cache[key] = dict(decoder=best, fps={n: round(SAMPLE_FRAMES / t, 1) for n, t in timings.items()})
+    _save(cache_path, cache)
+    return best
+
+
+@functools.lru_cache(maxsize=None)
+def decoder_args(path):
+    """Input options (before -i) selecting the decoder for `path`; chosen once per process and file."""
+    return tuple(candidate_args(select_decoder(path)))
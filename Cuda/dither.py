@@ -0,0 +1,131 @@
+"""
+dither.py
+Precomputed, tileable dither textures for the CPU enhancement path.
+
+The kernels hash every pixel of every frame (xorshift32) to get their jitter.
+That is free on the GPU but on the CPU it is the most expensive part of the
+math. A DitherBank builds a handful of small tileable textures once; each frame
+picks one texture and a cyclic offset from its seed and adds it to the frame
+through a tiled broadcast view, so no full-frame noise plane is generated.
+
+Kinds:
+    xorshift  the kernels' per-pixel hash (no bank, reference behaviour)
+    white     hashed white noise textures (same distribution as xorshift)
+    blue      high-pass shaped noise: energy pushed to high spatial frequencies,
+              which breaks banding with less visible grain and is cheaper for the
+              encoder than white noise of the same amplitude
+
+All textures are uniform in [-0.5, 0.5) and get scaled by the dither amplitude,
+exactly like the kernels' `rnd * dither_amp`. Compare kinds with
+param_sweep.py --dither-kind xorshift,white,blue.
+"""
+
+import numpy as np
+
+DITHER_KINDS = ("xorshift", "white", "blue")
+TEXTURE_SIZE = 128
+TEXTURE_COUNT = 16
+
+
+def _to_uniform(values):
+    """Rank-transform to a uniform distribution in [-0.5, 0.5), keeping the spatial ordering."""
+    flat = values.ravel()
+    ranks = np.empty(flat.size, dtype=np.float32)
+    ranks[np.argsort(flat, kind="stable")] = np.arange(flat.size, dtype=np.float32)
+    return ((ranks + 0.5) / flat.size - 0.5).reshape(values.shape).astype(np.float32)
+
+
+def blue_noise_texture(size, rng):
+    """Tileable blue-ish noise: white noise shaped by a radial high-pass in the FFT domain.
+
+    The FFT is periodic, so the result tiles without seams.
+    """
+    white = rng.random((size, size))
+    spectrum = np.fft.fft2(white - white.mean())
+    fy = np.fft.fftfreq(size)[:, None]
+    fx = np.fft.fftfreq(size)[None, :]
+    radius = np.sqrt(fx * fx + fy * fy)
+    shaped = np.real(np.fft.ifft2(spectrum * (radius / radius.max()) ** 2))
+    return _to_uniform(shaped)
+
+
+def white_noise_texture(size, rng):
+    return _to_uniform(rng.random((size, size)))
+
+
+def _tiles(dst, size):
+    """View the top-left multiple-of-`size` block of `dst` as (rows, size, cols, size, ...) without copying."""
+    h, w = dst.shape[:2]
+    hf, wf = h - h % size, w - w % size
+    if hf == 0 or wf == 0:
+        return None, hf, wf
+    body = dst[:hf, :wf].view()
+    # assigning .shape raises instead of silently copying if a view is impossible
+    body.shape = (hf // size, size, wf // size, size) + dst.shape[2:]
+    return body, hf, wf
+
+
+class DitherBank:
+    """A set of precomputed textures plus the per-frame selection rule."""
+
+    def __init__(self, kind="blue", size=TEXTURE_SIZE, count=TEXTURE_COUNT, seed=0x5EED):
+        if kind not in ("white", "blue"):
+            raise ValueError(f"unsupported dither texture kind: {kind}")
+        rng = np.random.default_rng(seed)
+        make = blue_noise_texture if kind == "blue" else white_noise_texture
+        self.kind = kind
+        self.size = size
+        self.textures = np.stack([make(size, rng) for _ in range(count)])
+
+    def texture_for(self, seed, y0=0):
+        """Pick a texture and a cyclic (dy, dx) offset from the frame seed.
+
+        `y0` shifts the texture for a row tile that starts at frame row `y0`.
+        """
+        n = (int(seed) * 2654435761) & 0xFFFFFFFF
+        n ^= n >> 16
+        tex = self.textures[n % len(self.textures)]
+        dy = ((n >> 4) - y0) % self.size
+        dx = (n >> 12) % self.size
+        return np.roll(tex, (dy, dx), axis=(0, 1))
+
+    def add(self, dst, seed, amplitude, weights=None, y0=0):
+        """Add `amplitude * texture` (times per-channel `weights`) to float32 `dst` in place.
+
+        `dst` is (H, W) or (H, W, C), optionally a row tile starting at frame row `y0`;
+        the texture is tiled over it by broadcasting.
+        """
+        tex = self.texture_for(seed, y0) * np.float32(amplitude)
+        if dst.ndim == 3:
+            w = np.ones(dst.shape[2], dtype=np.float32) if weights is None else np.asarray(weights, np.float32)
+            tex = tex[:, :, None] * w
+        s = self.size
+        body, hf, wf = _tiles(dst, s)
+        if body is not None:
+            body += tex[None, :, None, :]
+        h, w_ = dst.shape[:2]
+        # right strip (all rows) and bottom strip (body columns) that do not fill a whole tile
+        if wf < w_:
+            reps = (-(-h // s), 1) + (1,) * (dst.ndim - 2)
+            dst[:, wf:] += np.tile(tex[:, :w_ - wf], reps)[:h]
+        if hf < h and wf:
+            reps = (1, wf // s) + (1,) * (dst.ndim - 2)
+            dst[hf:, :wf] += np.tile(tex[:h - hf], reps)
+        return dst
+
+    def plane(self, h, w, seed, amplitude=1.0):
+        """Full (H, W) jitter plane, for callers that need one (and for inspection)."""
+        out = np.zeros((h, w), dtype=np.float32)
+        return self.add(out, seed, amplitude)
+
+
+_banks = {}
+
+
+def get_bank(kind):
+    """Shared bank per kind (textures are built once per process); None for 'xorshift'."""
+    if kind == "xorshift":
+        return None
+    if kind not in _banks:
+        _banks[kind] = DitherBank(kind)
+    return _banks[kind]
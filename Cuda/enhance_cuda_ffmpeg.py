@@ -1,27 +1,31 @@
 
+import argparse
+import os
 import sys
 import subprocess
-import shlex
 import json
-import math
 import numpy as np
 from tqdm import tqdm
 
-# Try to import pycuda
+# Try to import pycuda; without it the NumPy port of the kernel (enhance_math.py) is used
 try:
     import pycuda.autoinit
     import pycuda.driver as cuda
     from pycuda.compiler import SourceModule
+    HAVE_CUDA = True
 except Exception as e:
-    print("ERROR: pycuda import failed. Install pycuda and ensure CUDA drivers are available.")
-    raise e
+    print(f"WARNING: pycuda import failed ({e}); using the CPU implementation of the kernel.")
+    HAVE_CUDA = False
 
-if len(sys.argv) < 3:
-    print("Usage: python enhance_cuda_ffmpeg.py input.mov output.mp4")
-    sys.exit(1)
-
-INPUT = sys.argv[1]
-OUTPUT = sys.argv[2]
+import enhance_math
+from frame_cache import FrameCache, pipe_frames
+from filtergraph_fastpath import add_filtergraph_args, compile_filtergraph, run_filtergraph
+from decoder_select import decoder_args
+from frame_dedup import FrameDeduper
+from pipe_buffers import set_pipe_size
+from preview import add_preview_args, proxy_size, render_preview
+from segment_checkpoint import SegmentManifest, probe_frame_count, seek_args, DEFAULT_SEGMENT_FRAMES
+from time_range import add_range_args, output_args, run_range
 
 # ---------- Helper: ffprobe to get metadata ----------
 def ffprobe_get_stream_info(path):
@@ -43,20 +47,14 @@ def ffprobe_get_stream_info(path):
     pix_fmt = s.get("pix_fmt", "")
     return dict(width=w, height=h, fps=fps, sar=sar, pix_fmt=pix_fmt)
 
-info = ffprobe_get_stream_info(INPUT)
-W, H, FPS = info['width'], info['height'], info['fps']
-print(f"Probed: {W}x{H} @ {FPS:.3f} fps, sar={info['sar']}, src_pix_fmt={info['pix_fmt']}")
-
 # ---------- CUDA kernel: enhance + tiny dither for banding prevention ----------
 cuda_kernel = r"""
 #include <stdint.h>
 
 // input and output are uint16_t per component (RGB48: R,G,B each 16-bit)
 extern "C" {
-__global__ void enhance_kernel(unsigned short *img_in, unsigned short *img_out, int width, int height, float sharpen_strength, float contrast_boost, unsigned int seed) {
-    int x = blockIdx.x * blockDim.x + threadIdx.x;
-    int y = blockIdx.y * blockDim.y + threadIdx.y;
-    if (x >= width || y >= height) return;
+// sharpen + contrast + clamp for one pixel (no dither); rgb receives the result in [0, 65535]
+__device__ void enhance_pixel(const unsigned short *img_in, int width, int height, int x, int y, float sharpen_strength, float contrast_boost, float *rgb) {
     int idx = (y * width + x) * 3;
 
     // load as floats in [0, 65535]
@@ -104,123 +102,530 @@ __global__ void enhance_kernel(unsigned short *img_in, unsigned short *img_out,
     if (gg > 65535.0f) gg = 65535.0f;
     if (bb > 65535.0f) bb = 65535.0f;
 
+    rgb[0] = rr;
+    rgb[1] = gg;
+    rgb[2] = bb;
+}
+
+// add the per-frame dither to an enhanced pixel and store it; frame_y is the pixel's row in the frame
+__device__ void store_dithered(unsigned short *img_out, int idx, const float *rgb, int width, int x, int frame_y, unsigned int seed) {
     // Simple blue-noise-ish dithering to avoid blocks: add tiny pseudorandom jitter in [-4,4]
     // xorshift32
-    unsigned int n = seed ^ (y*width + x);
+    unsigned int n = seed ^ (frame_y*width + x);
     n ^= n << 13; n ^= n >> 17; n ^= n << 5;
     float jitter = ((float)(n & 0xFF) / 255.0f - 0.5f) * 8.0f; // [-4,4]
 
     // Apply jitter scaled down to 10-bit quantization step (16-bit->10-bit step=64)
-    rr += jitter;
-    gg += jitter;
-    bb += jitter;
-
     // Save
-    img_out[idx + 0] = (unsigned short) (rr + 0.5f);
-    img_out[idx + 1] = (unsigned short) (gg + 0.5f);
-    img_out[idx + 2] = (unsigned short) (bb + 0.5f);
-}
+    img_out[idx + 0] = (unsigned short) (rgb[0] + jitter + 0.5f);
+    img_out[idx + 1] = (unsigned short) (rgb[1] + jitter + 0.5f);
+    img_out[idx + 2] = (unsigned short) (rgb[2] + jitter + 0.5f);
 }
-"""
 
-mod = SourceModule(cuda_kernel)
-enhance_kernel = mod.get_function("enhance_kernel")
+// height/row_offset: the rows in img_in and the frame row of the first one (row tiles; 0 for whole frames)
+__global__ void enhance_kernel(unsigned short *img_in, unsigned short *img_out, int width, int height, float sharpen_strength, float contrast_boost, unsigned int seed, int row_offset) {
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= width || y >= height) return;
+    float rgb[3];
+    enhance_pixel(img_in, width, height, x, y, sharpen_strength, contrast_boost, rgb);
+    store_dithered(img_out, (y * width + x) * 3, rgb, width, x, y + row_offset, seed);
+}
 
-# ---------- Setup FFmpeg decode process (rawvideo rgb48le) ----------
-# We choose rgb48le (uint16 per channel) so we keep high bit depth in the pipeline.
-ffmpeg_dec_cmd = [
-    "ffmpeg",
-    "-y",
-    "-hwaccel", "cuda",           # use cuda hwaccel if available (helps with some formats)
-    "-i", INPUT,
-    "-f", "rawvideo",
-    "-pix_fmt", "rgb48le",        # 48-bit RGB (16bpc) -> numpy dtype uint16
-    "-vsync", "0",
-    "-vcodec", "rawvideo",
-    "-",                          # pipe out
-]
-
-dec_proc = subprocess.Popen(ffmpeg_dec_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**8)
+// --dedup: enhance_kernel in two steps, so a repeated frame only reruns dither_kernel on the kept base
+__global__ void base_kernel(unsigned short *img_in, float *base, int width, int height, float sharpen_strength, float contrast_boost) {
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= width || y >= height) return;
+    enhance_pixel(img_in, width, height, x, y, sharpen_strength, contrast_boost, base + (y * width + x) * 3);
+}
 
-# ---------- Setup FFmpeg encode process (NVENC HEVC 10-bit 4:4:4, CBR) ----------
-# We'll feed rgb48le frames back: ffmpeg will convert from rgb48le to yuv444p10le for the encoder.
-# Use hevc_nvenc with profile main444-10 (10-bit 4:4:4).
-bitrate = "80M"   # adjust as you like (CBR)
-maxrate = bitrate
-bufsize = "160M"
-ffmpeg_enc_cmd = [
-    "ffmpeg",
-    "-y",
-    "-f", "rawvideo",
-    "-pix_fmt", "rgb48le",
-    "-s", f"{W}x{H}",
-    "-r", f"{FPS:.6f}",
-    "-i", "-",                     # read our processed raw frames from stdin
-    # Request NVENC encode in 10-bit 4:4:4
-    "-c:v", "hevc_nvenc",
-    "-profile:v", "main444-10",
-    "-pix_fmt", "yuv444p10le",
-    "-rc", "cbr",
-    "-b:v", bitrate,
-    "-maxrate", maxrate,
-    "-bufsize", bufsize,
-    # Tune options (change according to your GPU & ffmpeg build)
-    "-rc-lookahead", "20",
-    "-preset", "p7",               # NVENC preset (p1 fastest ... p7 slower/higher quality); change as desired
-    OUTPUT
-]
-enc_proc = subprocess.Popen(ffmpeg_enc_cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-
-# Frame sizes for rgb48le
-frame_bytes = W * H * 3 * 2  # 3 channels * 2 bytes per channel (uint16)
-
-# Create GPU buffers
-# we'll allocate two GPU buffers sized for one frame in uint16
-frame_nbytes = frame_bytes
-d_in = cuda.mem_alloc(frame_nbytes)
-d_out = cuda.mem_alloc(frame_nbytes)
+__global__ void dither_kernel(float *base, unsigned short *img_out, int width, int height, unsigned int seed) {
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= width || y >= height) return;
+    int idx = (y * width + x) * 3;
+    store_dithered(img_out, idx, base + idx, width, x, y, seed);
+}
+}
+"""
 
 # Tiling/block config
 block_x = 16
 block_y = 16
-grid_x = (W + block_x - 1) // block_x
-grid_y = (H + block_y - 1) // block_y
+
+# Row tiles (--tile-rows): frames larger than this are enhanced in tiles by default
+TILE_AUTO_PIXELS = 4096 * 2160
+DEFAULT_TILE_ROWS = 256
 
 # Parameters for kernel
 sharpen_strength = np.float32(0.8)   # tune: 0.0..2.0
 contrast_boost = np.float32(1.05)    # small contrast boost
 
-# Read frames loop
-frame_count = 0
-try:
-    # Optionally show progress if input file has known duration; we skip here and just stream.
+# Encoder rate control
+bitrate = "80M"   # adjust as you like (CBR)
+maxrate = bitrate
+bufsize = "160M"
+
+
+def frame_seed(frame_index):
+    """Per-frame dither seed; depends only on the absolute frame index so a resumed run matches."""
+    return np.uint32((frame_index * 2654435761) & 0xFFFFFFFF)
+
+
+# ---------- Setup FFmpeg decode process (rawvideo rgb48le) ----------
+def build_decode_cmd(input_path, start_frame=0, fps=30.0, end_frame=None):
+    # We choose rgb48le (uint16 per channel) so we keep high bit depth in the pipeline.
+    return [
+        "ffmpeg",
+        "-y",
+        *decoder_args(input_path),    # fastest working hwaccel, else threaded software decode
+        *seek_args(start_frame, fps),  # input-side seek when resuming
+        "-i", input_path,
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb48le",        # 48-bit RGB (16bpc) -> numpy dtype uint16
+        "-vsync", "0",
+        "-vcodec", "rawvideo",
+        *output_args(start_frame, end_frame),  # stop exactly at a requested range end
+        "-",                          # pipe out
+    ]
+
+
+# ---------- Setup FFmpeg encode process (NVENC HEVC 10-bit 4:4:4, CBR) ----------
+def encoder_args():
+    # Request NVENC encode in 10-bit 4:4:4
+    return [
+        "-c:v", "hevc_nvenc",
+        "-profile:v", "main444-10",
+        "-pix_fmt", "yuv444p10le",
+        "-rc", "cbr",
+        "-b:v", bitrate,
+        "-maxrate", maxrate,
+        "-bufsize", bufsize,
+        # Tune options (change according to your GPU & ffmpeg build)
+        "-rc-lookahead", "20",
+        "-preset", "p7",               # NVENC preset (p1 fastest ... p7 slower/higher quality); change as desired
+    ]
+
+
+def build_encode_cmd(output_path, W, H, FPS):
+    # We'll feed rgb48le frames back: ffmpeg will convert from rgb48le to yuv444p10le for the encoder.
+    # Use hevc_nvenc with profile main444-10 (10-bit 4:4:4).
+    return [
+        "ffmpeg",
+        "-y",
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb48le",
+        "-s", f"{W}x{H}",
+        "-r", f"{FPS:.6f}",
+        "-i", "-",                     # read our processed raw frames from stdin
+        *encoder_args(),
+        output_path
+    ]
+
+
+class CudaEnhancer:
+    """Holds the compiled kernel and one pair of device buffers sized for a frame."""
+
+    def __init__(self, W, H, dedup=False, rows=None):
+        mod = SourceModule(cuda_kernel)
+        self.kernel = mod.get_function("enhance_kernel")
+        self.W, self.H = W, H
+        # Frame sizes for rgb48le
+        self.frame_bytes = W * H * 3 * 2  # 3 channels * 2 bytes per channel (uint16)
+        # Create GPU buffers
+        # we'll allocate two GPU buffers sized for one frame (or one tile window of `rows` rows) in uint16
+        buffer_bytes = W * (rows or H) * 3 * 2
+        self.d_in = cuda.mem_alloc(buffer_bytes)
+        self.d_out = cuda.mem_alloc(buffer_bytes)
+        self.grid = ((W + block_x - 1) // block_x, (H + block_y - 1) // block_y, 1)
+        self.dedup = FrameDeduper() if dedup else None
+        if self.dedup is not None:
+            # the pre-dither result of the last unique frame stays on the GPU (float32 RGB)
+            self.base_kernel = mod.get_function("base_kernel")
+            self.dither_kernel = mod.get_function("dither_kernel")
+            self.d_base = cuda.mem_alloc(W * H * 3 * 4)
+            self.have_base = False
+
+    def process(self, raw, frame_index):
+        # Convert raw to numpy uint16 (little-endian); raw may also be a frame-cache memmap view
+        frame = np.frombuffer(raw, dtype=np.uint16).reshape((self.H, self.W, 3))
+        if self.dedup is None:
+            # Upload to GPU
+            cuda.memcpy_htod(self.d_in, frame)
+            # Launch kernel
+            self.kernel(self.d_in, self.d_out, np.int32(self.W), np.int32(self.H),
+                        sharpen_strength, contrast_boost, frame_seed(frame_index), np.int32(0),
+                        block=(block_x, block_y, 1), grid=self.grid)
+        else:
+            # a repeated frame keeps its sharpen/contrast result on the GPU and is only re-dithered:
+            # no upload and no neighbourhood pass (is_duplicate runs on every frame to register it)
+            if not self.dedup.is_duplicate(frame) or not self.have_base:
+                cuda.memcpy_htod(self.d_in, frame)
+                self.base_kernel(self.d_in, self.d_base, np.int32(self.W), np.int32(self.H),
+                                 sharpen_strength, contrast_boost, block=(block_x, block_y, 1), grid=self.grid)
+                self.have_base = True
+            self.dither_kernel(self.d_base, self.d_out, np.int32(self.W), np.int32(self.H),
+                               frame_seed(frame_index), block=(block_x, block_y, 1), grid=self.grid)
+        # Download
+        out_frame = np.empty_like(frame)
+        cuda.memcpy_dtoh(out_frame, self.d_out)
+        return out_frame
+
+    def process_window(self, window, win_y0, y0, y1, frame_index, out):
+        """Enhance frame rows [y0, y1) into `out` from `window`, the rows [win_y0, win_y0 + len(window)).
+
+        The window carries the halo rows the 3x3 neighbourhood needs.
+        """
+        n = window.shape[0]
+        cuda.memcpy_htod(self.d_in, window)
+        grid = ((self.W + block_x - 1) // block_x, (n + block_y - 1) // block_y, 1)
+        self.kernel(self.d_in, self.d_out, np.int32(self.W), np.int32(n),
+                    sharpen_strength, contrast_boost, frame_seed(frame_index), np.int32(win_y0),
+                    block=(block_x, block_y, 1), grid=grid)
+        # download only the interior rows
+        cuda.memcpy_dtoh(out, int(self.d_out) + (y0 - win_y0) * self.W * 6)
+        return out
+
+
+class CpuEnhancer:
+    """Same interface as CudaEnhancer, running enhance_math's port of enhance_kernel."""
+
+    def __init__(self, W, H, dedup=False, dither_kind="xorshift", rows=None):
+        self.W, self.H = W, H
+        self.frame_bytes = W * H * 3 * 2
+        self.dither_kind = dither_kind
+        self.dedup = FrameDeduper() if dedup else None
+        self.base = None
+        self.scratch = np.empty((rows or H, W, 3), dtype=np.float32)
+        self.out = np.empty((rows or H, W, 3), dtype=np.uint16)
+
+    def process(self, raw, frame_index):
+        frame = np.frombuffer(raw, dtype=np.uint16).reshape((self.H, self.W, 3))
+        # a repeated frame keeps its sharpen/contrast result and is only re-dithered
+        # (is_duplicate runs on every frame, so the first one is registered too)
+        duplicate = self.dedup is not None and self.dedup.is_duplicate(frame)
+        if not duplicate or self.base is None:
+            self.base = enhance_math.rgb48_base(frame, sharpen_strength, contrast_boost)
+        # returns a reused buffer: the caller writes it out before the next frame
+        return enhance_math.rgb48_finish(self.base, frame_seed(frame_index), out=self.out,
+                                         dither_kind=self.dither_kind, scratch=self.scratch)
+
+    def process_window(self, window, win_y0, y0, y1, frame_index, out):
+        """Row-tile version of process(); see CudaEnhancer.process_window."""
+        base = enhance_math.rgb48_base(window, sharpen_strength, contrast_boost)
+        rows = base[y0 - win_y0:y1 - win_y0]
+        return enhance_math.rgb48_finish(rows, frame_seed(frame_index), out=out,
+                                         dither_kind=self.dither_kind, scratch=rows, y0=y0)
+
+
+def make_enhancer(W, H, options, rows=None):
+    """CudaEnhancer when pycuda works (and --cpu is not given), else CpuEnhancer.
+
+    `rows` sizes the buffers for row-tile windows instead of whole frames.
+    """
+    if HAVE_CUDA and not options.cpu:
+        return CudaEnhancer(W, H, dedup=options.dedup, rows=rows)
+    return CpuEnhancer(W, H, dedup=options.dedup, dither_kind=options.dither_kind, rows=rows)
+
+
+def tile_rows_for(info, options):
+    """Rows per tile for this source: --tile-rows, or automatic above 4K; 0 means whole frames."""
+    rows = getattr(options, "tile_rows", None)
+    if rows is None:
+        rows = DEFAULT_TILE_ROWS if info['width'] * info['height'] > TILE_AUTO_PIXELS else 0
+    return rows if 0 < rows < info['height'] else 0
+
+
+def read_rows(stream, buf):
+    """Fill `buf` from `stream`; False at end of stream."""
+    if buf.size == 0:
+        return True
+    view = memoryview(buf).cast("B")
+    n = 0
+    while n < len(view):
+        r = stream.readinto(view[n:])
+        if not r:
+            return False
+        n += r
+    return True
+
+
+def run_tiled(input_path, output_path, info, options, tile_rows, start_frame=0, end_frame=None):
+    """Like run_linear, but frames are read, enhanced and written in row tiles.
+
+    Each tile of `tile_rows` rows is enhanced from a window with one halo row
+    above and below (the kernel's 3x3 neighbourhood), so the result is the same
+    as a whole-frame run while only a window of tile_rows + 2 rows is in memory.
+    """
+    enhancer = make_enhancer(info['width'], info['height'], options, rows=tile_rows + 2)
+    print(f"Row tiles: {tile_rows} rows ({info['width'] * 6 * (tile_rows + 2) / 2**20:.1f} MiB window)")
     with tqdm(desc="Frames processed", unit="fr") as pbar:
+        frame_count, dec_ret, enc_ret = tiled_pass(input_path, output_path, info, enhancer, tile_rows,
+                                                   start_frame, end_frame, pbar)
+    print(f"Done. Frames processed: {frame_count}. ffmpeg decode exit code: {dec_ret}, encoder exit: {enc_ret}")
+    return dec_ret == 0 and enc_ret == 0 and frame_count > 0
+
+
+def tiled_pass(input_path, output_path, info, enhancer, tile_rows, start_frame, end_frame, pbar):
+    """Row-tile enhance frames [start_frame, end_frame) into `output_path` with `enhancer`.
+
+    Returns (frames written, decoder exit code, encoder exit code).
+    """
+    W, H, FPS = info['width'], info['height'], info['fps']
+    row_bytes = W * 3 * 2
+    window = np.empty((tile_rows + 2, W, 3), dtype=np.uint16)
+    out = np.empty((tile_rows, W, 3), dtype=np.uint16)
+
+    dec_proc = subprocess.Popen(build_decode_cmd(input_path, start_frame, FPS, end_frame),
+                                stdout=subprocess.PIPE, bufsize=0)
+    set_pipe_size(dec_proc.stdout, row_bytes * tile_rows)
+    enc_proc = subprocess.Popen(build_encode_cmd(output_path, W, H, FPS), stdin=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, bufsize=0)
+    set_pipe_size(enc_proc.stdin, row_bytes * tile_rows)
+
+    frame_count = 0
+    try:
         while True:
-            raw = dec_proc.stdout.read(frame_bytes)
-            if not raw or len(raw) < frame_bytes:
+            # window holds frame rows [win_y0, win_y0 + filled)
+            win_y0, filled = 0, min(H, tile_rows + 1)
+            if not read_rows(dec_proc.stdout, window[:filled]):
                 break
-            # Convert raw to numpy uint16 (little-endian)
-            frame = np.frombuffer(raw, dtype=np.uint16).reshape((H, W, 3))
-            # Upload to GPU
-            cuda.memcpy_htod(d_in, frame)
-            # Launch kernel
-            seed = np.uint32((frame_count * 2654435761) & 0xFFFFFFFF)
-            enhance_kernel(d_in, d_out, np.int32(W), np.int32(H), sharpen_strength, contrast_boost, seed,
-                           block=(block_x, block_y, 1), grid=(grid_x, grid_y, 1))
-            # Download
-            out_frame = np.empty_like(frame)
-            cuda.memcpy_dtoh(out_frame, d_out)
-            # Write processed frame to encoder stdin
-            enc_proc.stdin.write(out_frame.tobytes())
+            for y0 in range(0, H, tile_rows):
+                y1 = min(H, y0 + tile_rows)
+                enhancer.process_window(window[:filled], win_y0, y0, y1,
+                                        start_frame + frame_count, out[:y1 - y0])
+                enc_proc.stdin.write(out[:y1 - y0].data)
+                if y1 == H:
+                    break
+                # keep rows y1-1 and y1 as the next window's top halo and first row
+                keep = win_y0 + filled - (y1 - 1)
+                window[:keep] = window[filled - keep:filled]
+                win_y0 = y1 - 1
+                more = min(H, y1 + tile_rows + 1) - (win_y0 + keep)
+                if not read_rows(dec_proc.stdout, window[keep:keep + more]):
+                    raise RuntimeError("decoder stopped in the middle of a frame")
+                filled = keep + more
             frame_count += 1
             pbar.update(1)
-finally:
-    dec_proc.stdout.close()
-    dec_proc.stderr.close()
-    enc_proc.stdin.close()
-    enc_proc.stderr.close()
-
-# wait for processes to finish
-enc_proc.wait()
-dec_ret = dec_proc.wait()
-print(f"Done. Frames processed: {frame_count}. ffmpeg decode exit code: {dec_ret}, encoder exit: {enc_proc.returncode}")
+    except BaseException:
+        dec_proc.kill()
+        raise
+    finally:
+        dec_proc.stdout.close()
+        enc_proc.stdin.close()
+        dec_proc.wait()
+        enc_proc.wait()
+    return frame_count, dec_proc.returncode, enc_proc.returncode
+
+
+def decoded_frames(input_path, info, cache=None, start_frame=0, end_frame=None):
+    """Iterator of (H, W, 3) uint16 frames from `start_frame`, served from the frame cache when enabled.
+
+    `end_frame` only bounds the decoder; cached iteration has to be stopped by the caller.
+    """
+    W, H, FPS = info['width'], info['height'], info['fps']
+
+    def decode(start=0):
+        return pipe_frames(build_decode_cmd(input_path, start, FPS, end_frame), (H, W, 3), np.uint16)
+
+    # a resumed run only uses the cache if it already holds the whole source; otherwise seek
+    if cache is not None and (start_frame == 0 or cache.lookup(input_path, "rgb48le", W, H) is not None):
+        return cache.iter_frames(input_path, "rgb48le", W, H, decode, start=start_frame)
+    return decode(start_frame)
+
+
+def run_linear(input_path, output_path, info, options, cache=None, start_frame=0, end_frame=None):
+    """Enhance frames [start_frame, end_frame) (default: all) into `output_path`; True on success."""
+    W, H, FPS = info['width'], info['height'], info['fps']
+    enhancer = make_enhancer(W, H, options)
+    # a cached source must not be populated from a partial decode
+    frames = decoded_frames(input_path, info, cache if end_frame is None else None, start_frame, end_frame)
+    enc_proc = subprocess.Popen(build_encode_cmd(output_path, W, H, FPS),
+                                stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Read frames loop
+    frame_count = 0
+    dec_ret = 0
+    try:
+        # Optionally show progress if input file has known duration; we skip here and just stream.
+        with tqdm(desc="Frames processed", unit="fr") as pbar:
+            for frame in frames:
+                # absolute frame index, so a range gets the same dither seeds as a full run
+                out_frame = enhancer.process(frame, start_frame + frame_count)
+                # Write processed frame to encoder stdin
+                enc_proc.stdin.write(out_frame.data)
+                frame_count += 1
+                pbar.update(1)
+    except RuntimeError as e:
+        print(f"Decode error: {e}")
+        dec_ret = 1
+    finally:
+        frames.close()
+        enc_proc.stdin.close()
+        enc_proc.stderr.close()
+
+    # wait for processes to finish
+    enc_proc.wait()
+    if enhancer.dedup is not None:
+        print(f"Duplicate frames: {enhancer.dedup.summary()}")
+    print(f"Done. Frames processed: {frame_count}. ffmpeg decode exit code: {dec_ret}, encoder exit: {enc_proc.returncode}")
+    return dec_ret == 0 and enc_proc.returncode == 0 and frame_count > 0
+
+
+def run_resumable(input_path, output_path, info, segment_frames, options, cache=None, tile_rows=0):
+    """Segmented run: one encoder per segment, manifest updated after each one.
+
+    With `tile_rows` every segment is enhanced in row tiles (tiled_pass), with
+    its own decoder seeked to the segment start, instead of whole frames.
+    """
+    W, H, FPS = info['width'], info['height'], info['fps']
+    total = probe_frame_count(input_path)
+    params = dict(sharpen=float(sharpen_strength), contrast=float(contrast_boost),
+                  bitrate=bitrate, pix_fmt="rgb48le")
+    manifest = SegmentManifest(output_path, input_path, total, FPS, segment_frames, params).load_or_init()
+    runs = manifest.pending_runs()
+    done_before = len(manifest.data["segments"])
+    print(f"Resumable run: {manifest.segment_count} segments of {segment_frames} frames, "
+          f"{done_before} already complete")
+
+    if not runs:
+        enhancer = None
+    elif tile_rows:
+        enhancer = make_enhancer(W, H, options, rows=tile_rows + 2)
+        print(f"Row tiles: {tile_rows} rows per window")
+    else:
+        enhancer = make_enhancer(W, H, options)
+    with tqdm(total=total, initial=done_before * segment_frames, desc="Frames processed", unit="fr") as pbar:
+        if tile_rows:
+            run_tiled_segments(input_path, info, manifest, runs, enhancer, tile_rows, pbar)
+        else:
+            for first, last in runs:
+                start_frame = manifest.segment_range(first)[0]
+                frames = decoded_frames(input_path, info, cache, start_frame)
+                try:
+                    for index in range(first, last + 1):
+                        seg_start, seg_count = manifest.segment_range(index)
+                        tmp_file = manifest.segment_file(index) + ".part.mp4"
+                        enc_proc = subprocess.Popen(build_encode_cmd(tmp_file, W, H, FPS),
+                                                    stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                        written = 0
+                        try:
+                            for frame_index in range(seg_start, seg_start + seg_count):
+                                frame = next(frames, None)
+                                if frame is None:
+                                    break
+                                enc_proc.stdin.write(enhancer.process(frame, frame_index).data)
+                                written += 1
+                                pbar.update(1)
+                        finally:
+                            enc_proc.stdin.close()
+                        enc_ret = enc_proc.wait()
+                        if written == 0:
+                            # probed frame count was too high: nothing left to decode
+                            if os.path.exists(tmp_file):
+                                os.remove(tmp_file)
+                            manifest.truncate(seg_start)
+                            break
+                        if enc_ret != 0:
+                            raise RuntimeError(f"encoder failed on segment {index}")
+                        manifest.mark_done(index, tmp_file, frame_seed(seg_start), written)
+                        if written < seg_count:
+                            break
+                finally:
+                    frames.close()
+
+    if not manifest.complete:
+        raise RuntimeError("not all segments were produced; re-run with --resume to continue")
+    manifest.concat(output_path)
+    manifest.cleanup()
+    print(f"Done. {manifest.segment_count} segments joined into {output_path}")
+
+
+def run_tiled_segments(input_path, info, manifest, runs, enhancer, tile_rows, pbar):
+    """run_resumable's segment loop for row tiles: one tiled_pass per pending segment."""
+    for first, last in runs:
+        for index in range(first, last + 1):
+            seg_start, seg_count = manifest.segment_range(index)
+            tmp_file = manifest.segment_file(index) + ".part.mp4"
+            written, dec_ret, enc_ret = tiled_pass(input_path, tmp_file, info, enhancer, tile_rows,
+                                                   seg_start, seg_start + seg_count, pbar)
+            if written == 0 and dec_ret == 0:
+                # probed frame count was too high: nothing left to decode
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                manifest.truncate(seg_start)
+                return
+            if dec_ret != 0 or enc_ret != 0:
+                raise RuntimeError(f"segment {index} failed (decoder exit {dec_ret}, encoder exit {enc_ret})")
+            manifest.mark_done(index, tmp_file, frame_seed(seg_start), written)
+            if written < seg_count:
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CUDA detail enhancement through an ffmpeg rgb48le pipe")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--resume", action="store_true",
+                        help="write checkpointed segments and continue an interrupted run")
+    parser.add_argument("--segment-frames", type=int, default=DEFAULT_SEGMENT_FRAMES,
+                        help="frames per checkpoint segment (with --resume)")
+    parser.add_argument("--frame-cache", action="store_true",
+                        help="read/write decoded frames through the shared frame cache (see frame_cache.py)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="reuse the enhancement of bit-identical consecutive frames (static content)")
+    parser.add_argument("--cpu", action="store_true", help="use the NumPy kernel even if pycuda works")
+    parser.add_argument("--dither-kind", default="xorshift", choices=("xorshift", "white", "blue"),
+                        help="dither source for the CPU kernel (see dither.py)")
+    parser.add_argument("--tile-rows", type=int, default=None,
+                        help=f"enhance in row tiles of N rows to bound memory (0 = whole frames; "
+                             f"default {DEFAULT_TILE_ROWS} above 4K, whole frames otherwise)")
+    add_preview_args(parser)
+    add_filtergraph_args(parser)
+    add_range_args(parser)
+    args = parser.parse_args()
+    cache = FrameCache.from_env(force=args.frame_cache)
+
+    info = ffprobe_get_stream_info(args.input)
+    print(f"Probed: {info['width']}x{info['height']} @ {info['fps']:.3f} fps, sar={info['sar']}, src_pix_fmt={info['pix_fmt']}")
+    if args.filtergraph:
+        # sharpen + contrast + the kernel's +-4 (16-bit) jitter, which is below any 10-bit step
+        vf = compile_filtergraph(float(sharpen_strength), contrast=float(contrast_boost), order="rgb48",
+                                 gpu=args.filtergraph_gpu)
+        # the raw-pipe path never carried audio; keep that behaviour
+        sys.exit(run_filtergraph(args.input, args.output, vf, encoder_args(),
+                                 gpu=args.filtergraph_gpu, keep_audio=False))
+    if args.preview:
+        pw, ph = proxy_size(info['width'], info['height'], args.preview_height)
+        enhancer = make_enhancer(pw, ph, args)
+        render_preview(args.input, args.output, info['width'], info['height'], info['fps'], "rgb48le",
+                       enhancer.process, args.preview_start, args.preview_duration,
+                       args.preview_every, args.preview_height)
+        return
+
+    tile_rows = tile_rows_for(info, args)
+    if tile_rows and args.dedup:
+        print("Note: --dedup works on whole frames and is ignored with row tiles.")
+
+    def render(path, start, end):
+        if tile_rows:
+            return run_tiled(args.input, path, info, args, tile_rows, start, end)
+        return run_linear(args.input, path, info, args, cache, start, end)
+
+    try:
+        ranged = run_range(args, args.output, info['fps'], render)
+    except ValueError as e:
+        parser.error(str(e))
+    if ranged is not None:
+        if args.resume:
+            print("Note: --resume is ignored for a frame range.")
+        sys.exit(0 if ranged else 1)
+    if args.resume:
+        run_resumable(args.input, args.output, info, args.segment_frames, args, cache, tile_rows)
+    elif not render(args.output, 0, None):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+enhance_math.py
+NumPy (CPU) versions of the enhancement kernels.
+
+Each function mirrors one CUDA kernel operation for operation, in float32, so
+results match the GPU to within rounding:
+
+    enhance_rgb48   <- enhance_kernel in enhance_cuda_ffmpeg.py      (RGB48, sharpen + contrast, +-4 jitter)
+    enhance_rgba64  <- enhance_kernel16 in cuda_detail_boost_stream.cu
+                       detail_boost_kernel16 in cuda_detail_boost_16bit.cu (preset="16bit")
+    enhance_rgba8   <- detail_boost_kernel in VideoEnhancement/cuda_detail_boost.cu (RGBA in, RGBA64 out)
+
+rgb48_base / rgb48_finish also work on row tiles: run the base step on the
+tile plus one halo row above and below (the 3x3 neighbourhood), keep the
+interior rows and pass their first frame row as `y0` (see
+enhance_cuda_ffmpeg.py --tile-rows).
+
+They are used wherever no GPU is needed or available: parameter sweeps,
+previews and CPU fallbacks. The *_base / *_finish split separates the
+expensive neighbourhood math from the per-frame dither, so a repeated input
+frame only has to be re-dithered (see frame_dedup.py).
+"""
+
+import numpy as np
+
+from dither import get_bank
+
+# kernel defaults, as hardcoded / passed on the command line today
+RGB48_DEFAULTS = dict(sharpen=0.8, contrast=1.05, dither=8.0)
+STREAM_DEFAULTS = dict(sharpen=1.15, saturation=1.35, dither=80.0, contrast=1.02)
+BOOST16_DEFAULTS = dict(sharpen=1.1, saturation=1.3, dither=64.0, contrast=1.02)
+RGBA8_DEFAULTS = dict(sharpen=1.0, saturation=1.25, dither=0.6, contrast=1.06)
+
+# per-kernel differences between the two RGBA64 tools
+RGBA64_PRESETS = {
+    # cuda_detail_boost_stream.cu: seed = x*73856093 ^ y*19349663 ^ seed_base, G/B jitter 0.85/0.7
+    "stream": dict(seed_offset=0, weights=(1.0, 0.85, 0.7)),
+    # cuda_detail_boost_16bit.cu: seed mixed with the golden ratio constant, G/B jitter 0.8/0.6
+    "16bit": dict(seed_offset=0x9E3779B9, weights=(1.0, 0.8, 0.6)),
+}
+
+LUMA = (0.2989, 0.5870, 0.1141)
+_grids = {}
+
+
+def _pixel_grid(h, w):
+    """Cached uint32 (y, x) coordinate arrays for a frame size."""
+    key = (h, w)
+    if key not in _grids:
+        y = np.arange(h, dtype=np.uint32)[:, None]
+        x = np.arange(w, dtype=np.uint32)[None, :]
+        _grids[key] = (y, x)
+    return _grids[key]
+
+
+def xorshift32(n):
+    """In-place xorshift32 step on a uint32 array (n ^= n<<13; n ^= n>>17; n ^= n<<5)."""
+    n ^= n << np.uint32(13)
+    n ^= n >> np.uint32(17)
+    n ^= n << np.uint32(5)
+    return n
+
+
+def box3_mean(img):
+    """3x3 mean of an (H, W, C) float32 array, edges averaged over the in-bounds neighbours only.
+
+    Matches the kernels' `count` handling: corner pixels average 4 samples, edge pixels 6.
+    """
+    h, w = img.shape[:2]
+    # separable sums: rows then columns
+    rows = img.copy()
+    rows[1:] += img[:-1]
+    rows[:-1] += img[1:]
+    acc = rows.copy()
+    acc[:, 1:] += rows[:, :-1]
+    acc[:, :-1] += rows[:, 1:]
+    cy = np.full(h, 3.0, dtype=np.float32)
+    cx = np.full(w, 3.0, dtype=np.float32)
+    cy[0] -= 1; cy[-1] -= 1
+    cx[0] -= 1; cx[-1] -= 1
+    if h == 1:
+        cy[:] = 1
+    if w == 1:
+        cx[:] = 1
+    acc /= (cy[:, None] * cx[None, :])[:, :, None]
+    return acc
+
+
+def _to_uint16(values, out):
+    # (unsigned short)(v + 0.5f) on the GPU truncates and saturates
+    np.add(values, 0.5, out=values)
+    np.clip(values, 0.0, 65535.0, out=values)
+    out[...] = values
+    return out
+
+
+def _work_buffer(base, scratch):
+    """Buffer the finish step may modify: `scratch` (refilled from `base` unless it is `base`) or a copy."""
+    if scratch is None:
+        return base.copy()
+    if scratch is not base:
+        np.copyto(scratch, base)
+    return scratch
+
+
+def rgb48_jitter(h, w, seed, dither=8.0, y0=0):
+    """Per-pixel jitter of enhance_kernel: xorshift32(seed ^ (y*width + x)), low byte scaled to +-dither/2.
+
+    `y0` is the frame row of the first row, for row tiles.
+    """
+    y, x = _pixel_grid(h, w)
+    n = ((y + np.uint32(y0)) * np.uint32(w) + x) ^ np.uint32(seed)
+    xorshift32(n)
+    return ((n & np.uint32(0xFF)).astype(np.float32) / np.float32(255.0) - np.float32(0.5)) * np.float32(dither)
+
+
+def rgba64_jitter(h, w, seed, dither=80.0, preset="stream"):
+    """Per-pixel jitter of the RGBA64 kernels, before the per-channel weights."""
+    y, x = _pixel_grid(h, w)
+    offset = RGBA64_PRESETS[preset]["seed_offset"]
+    base = np.uint32((int(seed) + offset) & 0xFFFFFFFF)
+    n = (x * np.uint32(73856093)) ^ (y * np.uint32(19349663)) ^ base
+    xorshift32(n)
+    rnd = (n & np.uint32(0xFFFF)).astype(np.float32) / np.float32(65535.0) - np.float32(0.5)
+    return rnd * np.float32(dither)
+
+
+# ---------- rgb48 (enhance_kernel) ----------
+def rgb48_base(frame, sharpen=0.8, contrast=1.05):
+    """Everything enhance_kernel does before the jitter: float32 (H, W, 3), already clamped."""
+    img = frame.astype(np.float32)
+    avg = box3_mean(img)
+    # Unsharp-ish: boost difference from local average
+    res = img + np.float32(sharpen) * (img - avg)
+    # Contrast boost (simple gain around mid)
+    res -= np.float32(32768.0)
+    res *= np.float32(contrast)
+    res += np.float32(32768.0)
+    np.clip(res, 0.0, 65535.0, out=res)
+    return res
+
+
+def rgb48_finish(base, seed, dither=8.0, out=None, jitter=None, dither_kind="xorshift", scratch=None, y0=0):
+    """Add the per-frame jitter to a rgb48_base() result and quantize. `base` is left untouched.
+
+    `base` may be a row tile starting at frame row `y0`.
+    """
+    h, w = base.shape[:2]
+    res = _work_buffer(base, scratch)
+    bank = get_bank(dither_kind) if jitter is None else None
+    if bank is not None:
+        bank.add(res, seed, dither, y0=y0)
+    else:
+        if jitter is None:
+            jitter = rgb48_jitter(h, w, seed, dither, y0)
+        res += jitter[:, :, None]
+    if out is None:
+        out = np.empty(base.shape, dtype=np.uint16)
+    return _to_uint16(res, out)
+
+
+def enhance_rgb48(frame, sharpen=0.8, contrast=1.05, seed=0, dither=8.0, out=None, jitter=None,
+                  dither_kind="xorshift"):
+    """CPU enhance_kernel: (H, W, 3) uint16 -> (H, W, 3) uint16.
+
+    `jitter` may be an (H, W) float32 array to use instead of the xorshift noise;
+    `dither_kind` "white"/"blue" adds a precomputed texture instead (dither.py).
+    """
+    base = rgb48_base(frame, sharpen, contrast)
+    # base is a temporary here, so let finish work in it directly
+    return rgb48_finish(base, seed, dither, out, jitter, dither_kind, scratch=base)
+
+
+# ---------- rgba64 (enhance_kernel16 / detail_boost_kernel16) ----------
+def rgba64_base(frame, sharpen=1.15, saturation=1.35):
+    """Sharpen + saturation of the RGBA64 kernels, before jitter and contrast: float32 (H, W, 3)."""
+    img = frame[:, :, :3].astype(np.float32)
+    blur = box3_mean(img)
+    # sharpen
+    s = img + np.float32(sharpen) * (img - blur)
+    # saturation around luma
+    lum = s[:, :, 0] * np.float32(LUMA[0]) + s[:, :, 1] * np.float32(LUMA[1]) + s[:, :, 2] * np.float32(LUMA[2])
+    lum = lum[:, :, None]
+    return lum + (s - lum) * np.float32(saturation)
+
+
+def rgba64_finish(base, alpha, seed, dither=80.0, contrast=1.02, preset="stream", out=None,
+                  jitter=None, dither_kind="xorshift", scratch=None):
+    """Jitter, contrast, clamp and quantize a rgba64_base() result. `base` is left untouched."""
+    h, w = base.shape[:2]
+    res = _work_buffer(base, scratch)
+    # jitter, weighted per channel
+    weights = np.asarray(RGBA64_PRESETS[preset]["weights"], dtype=np.float32)
+    bank = get_bank(dither_kind) if jitter is None else None
+    if bank is not None:
+        bank.add(res, seed, dither, weights)
+    else:
+        if jitter is None:
+            jitter = rgba64_jitter(h, w, seed, dither, preset)
+        res += jitter[:, :, None] * weights
+    # small contrast around midpoint
+    res -= np.float32(32768.0)
+    res *= np.float32(contrast)
+    res += np.float32(32768.0)
+    np.clip(res, 0.0, 65535.0, out=res)
+    if out is None:
+        out = np.empty((h, w, 4), dtype=np.uint16)
+    _to_uint16(res, out[:, :, :3])
+    out[:, :, 3] = alpha
+    return out
+
+
+def enhance_rgba64(frame, sharpen=1.15, saturation=1.35, dither=80.0, seed=12345,
+                   contrast=1.02, preset="stream", out=None, jitter=None, dither_kind="xorshift"):
+    """CPU enhance_kernel16 / detail_boost_kernel16: (H, W, 4) uint16 -> (H, W, 4) uint16.
+
+    `jitter` may be an (H, W) float32 array to use instead of the xorshift noise;
+    `dither_kind` "white"/"blue" adds a precomputed texture instead (dither.py).
+    """
+    base = rgba64_base(frame, sharpen, saturation)
+    return rgba64_finish(base, frame[:, :, 3], seed, dither, contrast, preset, out, jitter,
+                         dither_kind, scratch=base)
+
+
+# ---------- rgba8 (detail_boost_kernel, 8-bit in / 16-bit out) ----------
+def enhance_rgba8(frame, sharpen=1.0, saturation=1.25, dither=0.6, seed=12345, contrast=1.06, out=None):
+    """CPU detail_boost_kernel: (H, W, 4) uint8 -> (H, W, 4) uint16.
+
+    Same steps as the 16bit preset, but in 8-bit units: contrast around 128,
+    clamp to 255, then widened by *257.
+    """
+    h, w = frame.shape[:2]
+    res = rgba64_base(frame, sharpen, saturation)
+    weights = np.asarray(RGBA64_PRESETS["16bit"]["weights"], dtype=np.float32)
+    res += rgba64_jitter(h, w, seed, dither, "16bit")[:, :, None] * weights
+    res -= np.float32(128.0)
+    res *= np.float32(contrast)
+    res += np.float32(128.0)
+    np.clip(res, 0.0, 255.0, out=res)
+    res *= np.float32(257.0)
+    if out is None:
+        out = np.empty((h, w, 4), dtype=np.uint16)
+    _to_uint16(res, out[:, :, :3])
+    out[:, :, 3] = frame[:, :, 3].astype(np.uint16) * np.uint16(257)
+    return out
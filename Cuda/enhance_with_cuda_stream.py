@@ -2,25 +2,64 @@
 """
 enhance_with_cuda_stream.py
 Usage:
-    python enhance_with_cuda_stream.py input.mov [output.mov]
+    python enhance_with_cuda_stream.py input.mov [output.mov] [--resume] [--segment-frames N]
+        [--start T] [--end T] [--splice previous_output.mov] [--renditions 4k_sdr,8k_10bit,1080p_check]
+
+--preview renders a short side-by-side before/after clip of a time range
+(see preview.py) using the CPU port of the kernel in enhance_math.py.
+
+--filtergraph runs the same sharpen/saturation/contrast as ffmpeg filters in
+one process (see filtergraph_fastpath.py); faster at 8K but not bit-exact.
+
+--start/--end (or --start-frame/--end-frame) process only that range, and
+--splice TARGET joins it back into an earlier full output with stream copy
+(see time_range.py).
+
+--resume writes the video as checkpointed closed-GOP segments (see
+segment_checkpoint.py) so an interrupted run continues from the first
+unfinished segment instead of frame 0; --parallel-segments N runs N
+segment pipelines at once.
+
+Every decode -> cuda -> encode chain is supervised by async_pipeline.py: a
+failing stage stops the others, and a chain without pipe traffic for
+STALL_TIMEOUT seconds is killed instead of hanging.
+
+--renditions 4k_sdr,8k_10bit,1080p_check decodes and enhances once and
+encodes every listed rendition from the same frames (one ffmpeg with a split
+filter, see renditions.py); outputs are named <output>.<rendition>.mp4.
 
 Requirements:
- - ffmpeg (with NVENC + cuvid/cuvid decoder) in PATH
+ - ffmpeg (with NVENC) in PATH; the decoder is picked per source by decoder_select.py
  - nvcc-built cuda_detail_boost_stream.exe in same folder or PATH
  - Python 3.7+
 """
 
+import argparse
+import asyncio
 import subprocess
 import json
 import os
 import sys
 import shutil
-import math
+
+from async_pipeline import PipelineError, STALL_TIMEOUT, run_pipeline as run_async_pipeline, run_stages
+from decoder_select import decoder_args
+from filtergraph_fastpath import add_filtergraph_args, compile_filtergraph, run_filtergraph
+from preview import add_preview_args, render_preview
+from renditions import add_rendition_args, build_ladder_encode_cmd, parse_renditions, probe_color, rendition_path
+from segment_checkpoint import SegmentManifest, probe_frame_count, seek_args, DEFAULT_SEGMENT_FRAMES
+from time_range import add_range_args, run_range
 
 FFMPEG = "ffmpeg"       # or full path to ffmpeg.exe
 FFPROBE = "ffprobe"
 CUDA_TOOL = "cuda_detail_boost_stream.exe"  # compiled from above
 
+# cuda tool parameters: sharpen, saturation, dither, start seed (seed increments once per frame)
+SHARPEN = "1.15"
+SATURATION = "1.35"
+DITHER = "80"
+BASE_SEED = 12345
+
 def probe_video(path):
     cmd = [
         FFPROBE, "-v", "error", "-select_streams", "v:0",
@@ -45,51 +84,31 @@ def probe_video(path):
     sar = stream.get("sample_aspect_ratio", "1:1")
     return width, height, fps, pix_fmt, sar
 
-def main(input_path, output_path):
-    if not os.path.exists(input_path):
-        print("Input not found:", input_path); sys.exit(1)
-    if shutil.which(FFMPEG) is None:
-        print("ffmpeg not found in PATH"); sys.exit(1)
-    if shutil.which(FFPROBE) is None:
-        print("ffprobe not found in PATH"); sys.exit(1)
-    if not os.path.exists(CUDA_TOOL) and shutil.which(CUDA_TOOL) is None:
-        print("CUDA tool not found:", CUDA_TOOL); sys.exit(1)
-
-    w,h,fps,pix_fmt,sar = probe_video(input_path)
-    print(f"Detected: {w}x{h} @ {fps} fps, pix_fmt={pix_fmt}, SAR={sar}")
-
-    # Use rgba64le for high precision throughput (16-bit per channel)
-    pix_in = "rgba64le"
-    pix_out = "rgba64le"
-
-    # ffmpeg decode command: try GPU decode (cuvid/hevc_cuvid) if available, otherwise CPU decode.
+def build_decode_cmd(input_path, start_frame=0, frame_count=None, fps=30.0):
+    # ffmpeg decode command: fastest working hwaccel for this source, else threaded CPU decode
+    # (decoder_select.py). Frames arrive in system memory, so no hwdownload is needed.
     # We'll ask FFmpeg to produce rawvideo RGBA64LE to stdout.
     # Use -vsync 0 to preserve frames.
-    decode_cmd = [
+    cmd = [
     FFMPEG,
     "-hide_banner", "-loglevel", "error",
-    "-hwaccel", "cuda",
+    *decoder_args(input_path),
+    *seek_args(start_frame, fps),
     "-i", input_path,
-    "-vf", "hwdownload,format=rgba64le",
     "-pix_fmt", "rgba64le",
     "-f", "rawvideo",
     "-vsync", "0",
-    "-"
     ]
+    if frame_count is not None:
+        cmd += ["-frames:v", str(frame_count)]
+    return cmd + ["-"]
 
+def build_cuda_args(w, h, seed=BASE_SEED):
     # cuda tool args: width, height, sharpen, sat, dither, seed
-    cuda_args = [CUDA_TOOL, str(w), str(h), "1.15", "1.35", "80", "12345"]
+    return [CUDA_TOOL, str(w), str(h), SHARPEN, SATURATION, DITHER, str(seed)]
 
-    # ffmpeg encode command reading raw frames from stdin
-    encode_cmd = [
-        FFMPEG,
-        "-hide_banner", "-loglevel", "error",
-        "-f", "rawvideo",
-        "-pix_fmt", pix_out,
-        "-s", f"{w}x{h}",
-        "-r", str(round(fps,3)),
-        "-i", "-",   # read from stdin
-        "-map", "0:v",
+def encoder_args():
+    return [
         "-c:v", "hevc_nvenc",
         "-profile:v", "rext",               # Range extensions for 4:4:4 10/16-bit
         "-pix_fmt", "yuv444p16le",
@@ -100,38 +119,214 @@ def main(input_path, output_path):
         "-b:v", "0",
         "-maxrate", "200M",
         "-bufsize", "400M",
-        "-c:a", "copy",   # copy audio (this will require mapping audio separately; we will remap)
+    ]
+
+def raw_input_args(w, h, fps):
+    # Use rgba64le for high precision throughput (16-bit per channel)
+    pix_out = "rgba64le"
+    return [
+        "-f", "rawvideo",
+        "-pix_fmt", pix_out,
+        "-s", f"{w}x{h}",
+        "-r", str(round(fps,3)),
+        "-i", "-",   # read from stdin
+    ]
+
+def build_encode_cmd(w, h, fps, output_path):
+    # ffmpeg encode command reading raw frames from stdin (video only, audio is muxed afterwards)
+    return [
+        FFMPEG,
+        "-hide_banner", "-loglevel", "error",
+        *raw_input_args(w, h, fps),
+        "-map", "0:v",
+        *encoder_args(),
         output_path
     ]
 
-    # Because we want to preserve audio too, we'll run a separate ffmpeg step to mux audio
-    # Option A: Use a temporary output video without audio and then copy audio from input.
-    tmp_video = output_path + ".temp_no_audio.mp4"
+def run_pipeline(decode_cmd, cuda_args, encode_cmd):
+    """Run [ffmpeg decode] -> [cuda tool] -> [ffmpeg encode]; return the three exit codes.
+
+    Supervised by async_pipeline: if one stage fails the others are stopped
+    instead of blocking on a full pipe, and a stalled pipeline is killed.
+    """
+    return tuple(run_stages([decode_cmd, cuda_args, encode_cmd], stall_timeout=STALL_TIMEOUT))
+
+def run_resumable(input_path, tmp_video, w, h, fps, segment_frames, parallel=1):
+    """Segmented pipeline: each segment is its own decode->cuda->encode run, checkpointed in a manifest.
+
+    Up to `parallel` segments run at once (each is an independent seek + encoder session).
+    """
+    total = probe_frame_count(input_path)
+    params = dict(sharpen=SHARPEN, saturation=SATURATION, dither=DITHER, base_seed=BASE_SEED)
+    manifest = SegmentManifest(tmp_video, input_path, total, fps, segment_frames, params).load_or_init()
+    print(f"Resumable run: {manifest.segment_count} segments, {len(manifest.data['segments'])} already complete")
+    pending = [i for i in range(manifest.segment_count) if not manifest.is_done(i)]
+    if not asyncio.run(run_segments(manifest, pending, input_path, w, h, fps, parallel)):
+        print("Re-run with --resume to continue from the unfinished segments.")
+        sys.exit(1)
 
-    # Launch decode -> cuda -> encode pipeline:
-    print("Starting pipeline: [ffmpeg decode] -> [cuda tool] -> [ffmpeg encode]")
-    # Start decoder process (stdout pipe)
-    p_decode = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE)
+    manifest.concat(tmp_video)
+    manifest.cleanup()
 
-    # Start cuda tool reading from decoder stdout, writing to stdout
-    p_cuda = subprocess.Popen(cuda_args, stdin=p_decode.stdout, stdout=subprocess.PIPE)
+def written_frames(part):
+    """Frames in a finished segment part; 0 when the encoder wrote none (no file or no video stream)."""
+    if not os.path.exists(part):
+        return 0
+    try:
+        return probe_frame_count(part)
+    except RuntimeError:
+        return 0
 
-    # Start encoder reading from cuda stdout and writing to temporary file (no audio)
-    p_encode = subprocess.Popen(encode_cmd[:-3] + [tmp_video], stdin=p_cuda.stdout)
+async def run_segments(manifest, indices, input_path, w, h, fps, parallel):
+    """Run the given segments, at most `parallel` at a time; stop all of them on the first failure."""
+    gate = asyncio.Semaphore(max(1, parallel))
 
-    # Close parent's references to pipes so processes get EOF correctly
-    p_decode.stdout.close()
-    p_cuda.stdout.close()
+    async def segment(index):
+        start, count = manifest.segment_range(index)
+        # the cuda tool bumps its seed once per frame, so the segment starts where a full run would be
+        seed = BASE_SEED + start
+        part = manifest.segment_file(index) + ".part.mp4"
+        async with gate:
+            print(f"Segment {index + 1}/{manifest.segment_count}: frames {start}-{start + count - 1}")
+            await run_async_pipeline([build_decode_cmd(input_path, start, count, fps),
+                                      build_cuda_args(w, h, seed),
+                                      build_encode_cmd(w, h, fps, part)],
+                                     STALL_TIMEOUT, label=f"segment {index}")
+        # the frames never pass through Python here, so count what the encoder wrote
+        written = await asyncio.to_thread(written_frames, part)
+        # single-threaded event loop: manifest updates never interleave
+        if written == 0:
+            # probed frame count was too high: nothing left to decode from here on
+            if os.path.exists(part):
+                os.remove(part)
+            manifest.truncate(start)
+            return
+        manifest.mark_done(index, part, seed, written)
 
-    rc_encode = p_encode.wait()
-    rc_cuda = p_cuda.wait()
-    rc_decode = p_decode.wait()
+    tasks = [asyncio.ensure_future(segment(i)) for i in indices]
+    try:
+        for done in asyncio.as_completed(tasks):
+            await done
+    except PipelineError as e:
+        print("Segment failed:", e, "exit codes (decode, cuda, encode):", e.returncodes)
+        return False
+    finally:
+        # a failed segment stops its siblings right away; finished ones stay in the manifest
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return True
 
+def run_range_pipeline(input_path, part, w, h, fps, start_frame, end_frame):
+    """One decode->cuda->encode run over frames [start_frame, end_frame), seeded like a full run."""
+    count = None if end_frame is None else end_frame - start_frame
+    rcs = run_pipeline(build_decode_cmd(input_path, start_frame, count, fps),
+                       build_cuda_args(w, h, BASE_SEED + start_frame),
+                       build_encode_cmd(w, h, fps, part))
+    if any(rc != 0 for rc in rcs):
+        print("Range failed. rc_decode", rcs[0], "rc_cuda", rcs[1], "rc_encode", rcs[2])
+        return False
+    return True
+
+def run_preview(input_path, output_path, w, h, fps, start, duration, every, proxy_height):
+    """Same math as cuda_detail_boost_stream.exe, on the CPU, for a short proxy range."""
+    import enhance_math
+
+    def process(frame, frame_index):
+        # the tool's seed starts at BASE_SEED and increments once per frame
+        return enhance_math.enhance_rgba64(frame, float(SHARPEN), float(SATURATION), float(DITHER),
+                                           BASE_SEED + frame_index, preset="stream")
+
+    render_preview(input_path, output_path, w, h, fps, "rgba64le", process,
+                   start, duration, every, proxy_height)
+
+def run_fast_filtergraph(input_path, output_path, gpu=False):
+    """Single ffmpeg process: the tool's sharpen/saturation/contrast as filters, audio copied in the same pass."""
+    vf = compile_filtergraph(float(SHARPEN), contrast=1.02, saturation=float(SATURATION),
+                             dither=float(DITHER), order="stream", gpu=gpu)
+    return run_filtergraph(input_path, output_path, vf, encoder_args(), gpu=gpu, keep_audio=True)
+
+def run_renditions(input_path, output_path, w, h, fps, names):
+    """One decode -> cuda pass feeding a single ffmpeg that encodes every rendition (audio included)."""
+    print(f"Starting pipeline: [ffmpeg decode] -> [cuda tool] -> [ffmpeg split -> {', '.join(names)}]")
+    rc_decode, rc_cuda, rc_encode = run_pipeline(
+        build_decode_cmd(input_path), build_cuda_args(w, h),
+        build_ladder_encode_cmd(raw_input_args(w, h, fps), names, output_path, audio_from=input_path,
+                                source_color=probe_color(input_path)))
     if rc_encode != 0 or rc_cuda != 0 or rc_decode != 0:
         print("One of the pipeline processes failed. rc_decode", rc_decode, "rc_cuda", rc_cuda, "rc_encode", rc_encode)
-        sys.exit(1)
+        return False
+    for name in names:
+        print("Rendition written to:", rendition_path(output_path, name))
+    return True
 
-    # Now mux audio from original input into final output (copy audio)
+def main(input_path, output_path, resume=False, segment_frames=DEFAULT_SEGMENT_FRAMES, preview=None,
+         filtergraph=False, filtergraph_gpu=False, range_options=None, parallel_segments=1, renditions=None):
+    """range_options: parsed --start/--end/--start-frame/--end-frame/--splice (see time_range.py).
+    renditions: list of renditions.RENDITIONS names encoded from one pass instead of output_path."""
+    if not os.path.exists(input_path):
+        print("Input not found:", input_path); sys.exit(1)
+    if shutil.which(FFMPEG) is None:
+        print("ffmpeg not found in PATH"); sys.exit(1)
+    if shutil.which(FFPROBE) is None:
+        print("ffprobe not found in PATH"); sys.exit(1)
+    if filtergraph:
+        # no raw pipes, no CUDA tool: one ffmpeg does decode, filters, encode and audio
+        if run_fast_filtergraph(input_path, output_path, filtergraph_gpu) != 0:
+            print("Filtergraph fast path failed."); sys.exit(1)
+        print("Done. Output written to:", output_path)
+        return
+
+    if preview is None and not os.path.exists(CUDA_TOOL) and shutil.which(CUDA_TOOL) is None:
+        print("CUDA tool not found:", CUDA_TOOL); sys.exit(1)
+
+    w,h,fps,pix_fmt,sar = probe_video(input_path)
+    print(f"Detected: {w}x{h} @ {fps} fps, pix_fmt={pix_fmt}, SAR={sar}")
+
+    if preview is not None:
+        # preview = (start, duration, every, proxy_height)
+        run_preview(input_path, output_path, w, h, fps, *preview)
+        return
+
+    if range_options is not None:
+        def render(path, start, end):
+            return run_range_pipeline(input_path, path, w, h, fps, start, end)
+
+        try:
+            ranged = run_range(range_options, output_path, fps, render, audio_from=input_path)
+        except ValueError as e:
+            print("Range error:", e); sys.exit(1)
+        if ranged is not None:
+            if not ranged:
+                sys.exit(1)
+            print("Done. Output written to:", output_path)
+            return
+
+    if renditions:
+        if resume:
+            print("Note: --resume is ignored with --renditions")
+        if not run_renditions(input_path, output_path, w, h, fps, renditions):
+            sys.exit(1)
+        return
+
+    # Because we want to preserve audio too, we'll run a separate ffmpeg step to mux audio
+    # Option A: Use a temporary output video without audio and then copy audio from input.
+    tmp_video = output_path + ".temp_no_audio.mp4"
+
+    if resume:
+        run_resumable(input_path, tmp_video, w, h, fps, segment_frames, parallel_segments)
+    else:
+        # Launch decode -> cuda -> encode pipeline:
+        print("Starting pipeline: [ffmpeg decode] -> [cuda tool] -> [ffmpeg encode]")
+        rc_decode, rc_cuda, rc_encode = run_pipeline(build_decode_cmd(input_path),
+                                                     build_cuda_args(w, h),
+                                                     build_encode_cmd(w, h, fps, tmp_video))
+
+        if rc_encode != 0 or rc_cuda != 0 or rc_decode != 0:
+            print("One of the pipeline processes failed. rc_decode", rc_decode, "rc_cuda", rc_cuda, "rc_encode", rc_encode)
+            sys.exit(1)
+
+    # Now mux audio from original input into final file (copy audio)
     print("Muxing audio from original into final file...")
     mux_cmd = [
         FFMPEG, "-hide_banner", "-loglevel", "error",
@@ -149,9 +344,29 @@ def main(input_path, output_path):
     print("Done. Output written to:", output_path)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python enhance_with_cuda_stream.py input.mov [output.mov]")
-        sys.exit(1)
-    input_path = sys.argv[1]
-    output_path = sys.argv[2] if len(sys.argv) >= 3 else "enhanced_output.mp4"
-    main(input_path, output_path)
+    parser = argparse.ArgumentParser(description="ffmpeg decode -> CUDA detail boost -> NVENC encode")
+    parser.add_argument("input")
+    parser.add_argument("output", nargs="?", default="enhanced_output.mp4")
+    parser.add_argument("--resume", action="store_true",
+                        help="write checkpointed segments and continue an interrupted run")
+    parser.add_argument("--segment-frames", type=int, default=DEFAULT_SEGMENT_FRAMES,
+                        help="frames per checkpoint segment (with --resume)")
+    parser.add_argument("--parallel-segments", type=int, default=1,
+                        help="segments encoded at once with --resume (NVENC session limits apply)")
+    add_preview_args(parser)
+    add_filtergraph_args(parser)
+    add_range_args(parser)
+    add_rendition_args(parser)
+    args = parser.parse_args()
+    renditions = None
+    if args.renditions:
+        try:
+            renditions = parse_renditions(args.renditions)
+        except ValueError as e:
+            parser.error(str(e))
+    preview = None
+    if args.preview:
+        preview = (args.preview_start, args.preview_duration, args.preview_every, args.preview_height)
+    main(args.input, args.output, resume=args.resume, segment_frames=args.segment_frames, preview=preview,
+         filtergraph=args.filtergraph, filtergraph_gpu=args.filtergraph_gpu, range_options=args,
+         parallel_segments=args.parallel_segments, renditions=renditions)
@@ -0,0 +1,145 @@
+"""
+filtergraph_fastpath.py
+Run the enhancement as a plain ffmpeg filter chain in one process (--filtergraph).
+
+The enhancers normally pipe every frame out of ffmpeg as raw rgb48/rgba64,
+through Python or the CUDA tool, and back into a second ffmpeg. At 8K those
+two raw pipes cost more than the math. When bit-exact kernel output is not
+needed, the same steps can be approximated with ffmpeg filters:
+
+    3x3 local-average sharpen  -> unsharp=3:3:<amount>:3:3:<amount>   (same box-average formula)
+    saturation around luma     -> colorchannelmixer with the kernel's luma weights
+                                  or eq=saturation on 8-bit chains
+    contrast around mid-grey   -> lutrgb clip((val-(maxval+1)/2)*c+(maxval+1)/2)
+                                  (mid-grey 32768 at 16 bits, as in the kernels)
+                                  or eq=contrast on 8-bit chains
+    dither                     -> noise=alls:allf=t (8-bit chains only)
+
+None of this is exact. The mixer and lut round per step where the kernels
+keep floats, and unsharp has no gbrp16le path, so in high_depth mode ffmpeg
+converts to and from a planar YUV format around it. The dither is dropped in
+high_depth mode, because the noise filter has no high-bit-depth path; 10-bit
+output bands less anyway.
+
+Filters are probed once; unsharp_opencl is used instead of unsharp when the
+build has it and --filtergraph-gpu is given.
+"""
+
+import functools
+import subprocess
+
+from decoder_select import decoder_args
+
+FFMPEG = "ffmpeg"
+LUMA = (0.2989, 0.5870, 0.1141)
+
+
+@functools.lru_cache(maxsize=None)
+def available_filters(ffmpeg=FFMPEG):
+    """Names of the filters compiled into this ffmpeg build."""
+    try:
+        p = subprocess.run([ffmpeg, "-hide_banner", "-filters"], capture_output=True, text=True)
+    except OSError:
+        return frozenset()
+    names = set()
+    for line in p.stdout.splitlines():
+        parts = line.split()
+        # " TSC unsharp           V->V       Sharpen or blur ..."
+        if len(parts) >= 3 and "->" in parts[2]:
+            names.add(parts[1])
+    return frozenset(names)
+
+
+def _saturation_mixer(sat):
+    """colorchannelmixer coefficients for lum + (c - lum) * sat with the kernel's luma weights."""
+    k = 1.0 - sat
+    rows = []
+    for ch in range(3):
+        coeffs = [LUMA[i] * k + (sat if i == ch else 0.0) for i in range(3)]
+        rows.append(coeffs)
+    names = ("r", "g", "b")
+    opts = []
+    for out, coeffs in zip(names, rows):
+        for src, c in zip(names, coeffs):
+            opts.append(f"{out}{src}={c:.6f}")
+    return "colorchannelmixer=" + ":".join(opts)
+
+
+def _contrast_lut(contrast):
+    # single quotes keep the commas from splitting the filter chain
+    # (maxval+1)/2 is the kernels' mid-grey: 32768 at 16 bits (maxval/2 would be 32767.5)
+    expr = f"clip((val-(maxval+1)/2)*{contrast:.6f}+(maxval+1)/2,minval,maxval)"
+    return f"lutrgb=r='{expr}':g='{expr}':b='{expr}'"
+
+
+def compile_filtergraph(sharpen, contrast=1.0, saturation=1.0, dither=0.0, order="rgb48",
+                        high_depth=True, gpu=False, filters=None):
+    """Build a -vf chain approximating the kernel with these parameters.
+
+    order: "rgb48" (sharpen, contrast, dither) as in enhance_kernel, or
+           "stream" (sharpen, saturation, dither, contrast) as in enhance_kernel16.
+    high_depth: keep a 16-bit planar RGB working format for the mixer/lut steps
+                (no dither); False uses eq/noise on 8-bit YUV.
+    """
+    filters = available_filters() if filters is None else filters
+    chain = ["format=gbrp16le" if high_depth else "format=yuv444p"]
+
+    if sharpen:
+        amount = max(-2.0, min(5.0, sharpen))   # unsharp's accepted range
+        if gpu and "unsharp_opencl" in filters:
+            chain += ["hwupload", f"unsharp_opencl=lx=3:ly=3:la={amount:.4f}:cx=3:cy=3:ca={amount:.4f}",
+                      "hwdownload", chain[0]]
+        else:
+            chain.append(f"unsharp=lx=3:ly=3:la={amount:.4f}:cx=3:cy=3:ca={amount:.4f}")
+
+    def color_steps(with_contrast, with_saturation):
+        steps = []
+        if high_depth:
+            if with_saturation and saturation != 1.0:
+                steps.append(_saturation_mixer(saturation))
+            if with_contrast and contrast != 1.0:
+                steps.append(_contrast_lut(contrast))
+        else:
+            opts = []
+            if with_contrast and contrast != 1.0:
+                opts.append(f"contrast={contrast:.4f}")
+            if with_saturation and saturation != 1.0:
+                opts.append(f"saturation={saturation:.4f}")
+            if opts:
+                steps.append("eq=" + ":".join(opts))
+        return steps
+
+    noise = []
+    if dither and not high_depth and "noise" in filters:
+        # dither is in 16-bit code values; noise strength is in 8-bit code values
+        noise = [f"noise=alls={max(1, int(round(dither / 257.0)))}:allf=t+u"]
+
+    if order == "rgb48":
+        chain += color_steps(True, False) + noise
+    else:
+        chain += color_steps(False, True) + noise + color_steps(True, False)
+    return ",".join(chain)
+
+
+def build_filtergraph_cmd(input_path, output_path, vf, encode_args, gpu=False, keep_audio=True):
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y"]
+    if gpu:
+        cmd += ["-init_hw_device", "opencl=ocl", "-filter_hw_device", "ocl"]
+    cmd += [*decoder_args(input_path), "-i", input_path, "-map", "0:v:0"]
+    if keep_audio:
+        cmd += ["-map", "0:a?", "-c:a", "copy"]
+    return cmd + ["-vf", vf] + list(encode_args) + [output_path]
+
+
+def run_filtergraph(input_path, output_path, vf, encode_args, gpu=False, keep_audio=True):
+    cmd = build_filtergraph_cmd(input_path, output_path, vf, encode_args, gpu, keep_audio)
+    print("[INFO] Filtergraph fast path: " + vf)
+    return subprocess.run(cmd).returncode
+
+
+def add_filtergraph_args(parser):
+    group = parser.add_argument_group("filtergraph fast path")
+    group.add_argument("--filtergraph", action="store_true",
+                       help="run the enhancement as ffmpeg filters in one process (not bit-exact)")
+    group.add_argument("--filtergraph-gpu", action="store_true",
+                       help="use unsharp_opencl when the ffmpeg build has it")
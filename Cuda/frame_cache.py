@@ -0,0 +1,217 @@
+"""
+frame_cache.py
+Disk cache of decoded raw frames, shared by the enhancers and the compare tools.
+
+One entry = one source decoded to one pixel format at one resolution, stored
+as a flat raw file (fixed stride per frame, so the frame index is just
+`offset = i * frame_bytes`) plus a small JSON sidecar. Entries are keyed by a
+content hash of the source (size + first/middle/last MiB, so renames and
+copies still hit), the pixel format, the resolution and a decoder tag.
+
+Reads are zero-copy: frames come back as read-only views into a numpy.memmap.
+A miss streams frames from the real decoder and writes them to the cache at the
+same time; the entry becomes visible only once the decode completed. The cache
+is trimmed least-recently-used first to stay under its disk budget, and a source
+that would not fit on its own is simply not cached.
+
+Enable with FRAME_CACHE_DIR=/path (and optionally FRAME_CACHE_BUDGET_GB=200),
+or --frame-cache on enhance_cuda_ffmpeg.py.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import time
+
+import numpy as np
+
+from pipe_buffers import set_pipe_size
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "yt_enhance_frames")
+DEFAULT_BUDGET_GB = 100
+HASH_CHUNK = 1 << 20
+
+# bytes per pixel and channels for the raw formats the tools exchange
+PIX_FMTS = {
+    "rgb48le": (np.uint16, 3),
+    "rgba64le": (np.uint16, 4),
+    "bgr24": (np.uint8, 3),
+    "rgb24": (np.uint8, 3),
+    "gray": (np.uint8, 1),
+    "gray16le": (np.uint16, 1),
+}
+
+
+def source_hash(path):
+    """Fast content hash: file size plus the first, middle and last MiB."""
+    size = os.path.getsize(path)
+    h = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in (0, max(0, size // 2 - HASH_CHUNK // 2), max(0, size - HASH_CHUNK)):
+            f.seek(offset)
+            h.update(f.read(HASH_CHUNK))
+    return h.hexdigest()
+
+
+def frame_shape(pix_fmt, width, height):
+    dtype, channels = PIX_FMTS[pix_fmt]
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    return shape, dtype
+
+
+def pipe_frames(cmd, shape, dtype):
+    """Run an ffmpeg command writing rawvideo to stdout and yield frames.
+
+    Frames are read with readinto() into one reusable buffer, so each yielded
+    array is only valid until the next iteration.
+    """
+    buf = np.empty(shape, dtype=dtype)
+    view = memoryview(buf).cast("B")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0)
+    set_pipe_size(proc.stdout, buf.nbytes)
+    try:
+        while True:
+            n = 0
+            while n < len(view):
+                r = proc.stdout.readinto(view[n:])
+                if not r:
+                    break
+                n += r
+            if n < len(view):
+                break
+            yield buf
+        # a decoder error must not look like a clean end of stream (it would be cached)
+        if proc.wait() != 0:
+            raise RuntimeError(f"decoder exited with {proc.returncode}: {' '.join(cmd)}")
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+
+class FrameCache:
+    def __init__(self, cache_dir=None, budget_bytes=None):
+        self.dir = cache_dir or DEFAULT_DIR
+        self.budget = budget_bytes if budget_bytes is not None else DEFAULT_BUDGET_GB << 30
+        os.makedirs(self.dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, force=False):
+        """Cache configured by FRAME_CACHE_DIR / FRAME_CACHE_BUDGET_GB, or None when disabled."""
+        cache_dir = os.environ.get("FRAME_CACHE_DIR")
+        if not cache_dir and not force:
+            return None
+        budget = os.environ.get("FRAME_CACHE_BUDGET_GB")
+        return cls(cache_dir, int(float(budget) * (1 << 30)) if budget else None)
+
+    # ---------- entries ----------
+    def key(self, path, pix_fmt, width, height, tag="ffmpeg"):
+        return f"{source_hash(path)[:20]}_{pix_fmt}_{width}x{height}_{tag}"
+
+    def _paths(self, key):
+        base = os.path.join(self.dir, key)
+        return base + ".raw", base + ".json"
+
+    def _entries(self):
+        for name in os.listdir(self.dir):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.dir, name)) as f:
+                        yield name[:-5], json.load(f)
+                except (OSError, ValueError):
+                    continue
+
+    def lookup(self, path, pix_fmt, width, height, tag="ffmpeg"):
+        """Return a read-only memmap (frames, *shape) for a complete entry, or None."""
+        key = self.key(path, pix_fmt, width, height, tag)
+        raw_path, meta_path = self._paths(key)
+        if not os.path.exists(meta_path) or not os.path.exists(raw_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta["last_used"] = time.time()
+        self._write_meta(meta_path, meta)
+        shape, dtype = frame_shape(pix_fmt, width, height)
+        return np.memmap(raw_path, dtype=dtype, mode="r", shape=(meta["frames"],) + shape)
+
+    def _write_meta(self, meta_path, meta):
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    # ---------- reading ----------
+    def iter_frames(self, path, pix_fmt, width, height, decode, start=0, tag="ffmpeg"):
+        """Yield frames for `path`, from the cache when possible.
+
+        `decode` is a zero-argument callable returning an iterator of full-source
+        frames (from frame 0); it is only called on a miss. On a hit frames are
+        zero-copy memmap views starting at `start`.
+        """
+        cached = self.lookup(path, pix_fmt, width, height, tag)
+        if cached is not None:
+            for i in range(start, cached.shape[0]):
+                yield cached[i]
+            return
+        index = 0
+        for frame in self._populate(path, pix_fmt, width, height, decode(), tag):
+            if index >= start:
+                yield frame
+            index += 1
+
+    def _populate(self, path, pix_fmt, width, height, frames, tag):
+        key = self.key(path, pix_fmt, width, height, tag)
+        raw_path, meta_path = self._paths(key)
+        part = raw_path + f".{os.getpid()}.part"
+        shape, dtype = frame_shape(pix_fmt, width, height)
+        frame_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        out = open(part, "wb")
+        written = 0
+        count = 0
+        complete = False
+        try:
+            for frame in frames:
+                if out is not None:
+                    if written + frame_bytes > self.budget:
+                        # the source alone exceeds the budget: stop caching, keep streaming
+                        out.close()
+                        os.remove(part)
+                        out = None
+                    else:
+                        out.write(np.ascontiguousarray(frame).data)
+                        written += frame_bytes
+                count += 1
+                yield frame
+            complete = True
+        finally:
+            if out is not None:
+                out.close()
+                if complete and count > 0:
+                    self._evict(written)
+                    os.replace(part, raw_path)
+                    self._write_meta(meta_path, {
+                        "source": os.path.abspath(path), "pix_fmt": pix_fmt, "width": width,
+                        "height": height, "frames": count, "frame_bytes": frame_bytes,
+                        "bytes": written, "created": time.time(), "last_used": time.time(),
+                    })
+                else:
+                    os.remove(part)
+
+    # ---------- eviction ----------
+    def _evict(self, incoming):
+        """Drop least-recently-used entries until `incoming` more bytes fit in the budget."""
+        entries = sorted(self._entries(), key=lambda kv: kv[1].get("last_used", 0))
+        total = sum(meta.get("bytes", 0) for _, meta in entries)
+        for key, meta in entries:
+            if total + incoming <= self.budget:
+                break
+            raw_path, meta_path = self._paths(key)
+            for p in (meta_path, raw_path):
+                if os.path.exists(p):
+                    os.remove(p)
+            total -= meta.get("bytes", 0)
+
+    def usage(self):
+        return sum(meta.get("bytes", 0) for _, meta in self._entries())
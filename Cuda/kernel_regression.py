@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+kernel_regression.py
+Golden-output regression checks and fps benchmarks for every enhancement backend.
+
+Usage:
+    python kernel_regression.py check [--backends rgb48/cpu,stream/exe,...]
+    python kernel_regression.py bless                 # rewrite kernel_golden.json from the CPU backends
+    python kernel_regression.py bench [--sizes 1080p,4k,8k] [--frames 3]
+
+Backends (kernel/implementation):
+
+    rgb48/cpu     enhance_math.enhance_rgb48                 rgb48/pycuda  enhance_kernel (enhance_cuda_ffmpeg.py)
+    stream/cpu    enhance_math.enhance_rgba64 "stream"       stream/exe    cuda_detail_boost_stream
+    16bit/cpu     enhance_math.enhance_rgba64 "16bit"        16bit/exe     cuda_detail_boost_16bit
+    rgba8/cpu     enhance_math.enhance_rgba8                 rgba8/exe     cuda_detail_boost
+
+`check` enhances a few small deterministic synthetic frames with each
+available backend. CPU backends must reproduce the SHA-256 stored in
+kernel_golden.json bit for bit; GPU backends are compared to their CPU
+counterpart and may differ by at most GPU_TOLERANCE code values (the GPU may
+fuse multiply-adds, which moves a rounding boundary now and then).
+Backends that cannot run here (no pycuda, no compiled tool, no GPU) are
+skipped, so the check also runs on CPU-only CI machines; any other failure
+to load a backend (a broken import in the module under test) is a FAIL.
+Exit code 1 on any failure.
+
+The golden hashes are blessed from the CPU backends themselves, so they only
+catch unintended changes to the CPU port. Nothing here has been checked
+against a GPU run; the GPU backends are only as right as the CPU port they
+are compared with. Each golden entry records its source.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import enhance_math
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_PATH = os.path.join(HERE, "kernel_golden.json")
+GPU_TOLERANCE = 2
+GOLDEN_SOURCE = "cpu backend (enhance_math), self-blessed; not verified against a GPU run"
+CHECK_SIZE = (96, 64)        # width, height: odd tile counts, exercises all edges
+CHECK_FRAMES = 3
+BENCH_SIZES = {"1080p": (1920, 1080), "4k": (3840, 2160), "8k": (7680, 4320)}
+
+# kernel -> input layout, parameters and first seed, as each tool runs them by default
+KERNELS = {
+    "rgb48": dict(dtype=np.uint16, channels=3, out_channels=3,
+                  params=dict(sharpen=0.8, contrast=1.05)),
+    "stream": dict(dtype=np.uint16, channels=4, out_channels=4, seed=12345,
+                   params=dict(sharpen=1.15, saturation=1.35, dither=80.0)),
+    "16bit": dict(dtype=np.uint16, channels=4, out_channels=4, seed=123456,
+                  params=dict(sharpen=1.1, saturation=1.3, dither=64.0)),
+    "rgba8": dict(dtype=np.uint8, channels=4, out_channels=4, seed=12345,
+                  params=dict(sharpen=1.0, saturation=1.25, dither=0.6)),
+}
+TOOLS = {
+    "stream": os.path.join(HERE, "cuda_detail_boost_stream"),
+    "16bit": os.path.join(HERE, "..", "VideoEnhancement", "cuda_detail_boost_16bit"),
+    "rgba8": os.path.join(HERE, "..", "VideoEnhancement", "cuda_detail_boost"),
+}
+
+
+def synthetic_frames(kernel, width, height, count, seed=2024):
+    """Deterministic test frames: gradients, hard edges, fine checkerboard and noise."""
+    cfg = KERNELS[kernel]
+    top = 255 if cfg["dtype"] == np.uint8 else 65535
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0.0, 1.0, height)[:, None]
+    x = np.linspace(0.0, 1.0, width)[None, :]
+    frames = []
+    for i in range(count):
+        planes = [
+            x * np.ones_like(y),
+            y * np.ones_like(x),
+            ((np.arange(height)[:, None] // 4 + np.arange(width)[None, :] // 4 + i) % 2) * 0.8 + 0.1,
+        ]
+        img = np.stack(planes, axis=-1)
+        img = np.clip(img + rng.normal(0.0, 0.03, img.shape), 0.0, 1.0)
+        img[height // 3:height // 2, width // 3:width // 2] = (1.0, 0.0, 0.5)   # saturated block
+        frame = np.empty((height, width, cfg["channels"]), dtype=cfg["dtype"])
+        frame[:, :, :3] = np.rint(img * top)
+        if cfg["channels"] == 4:
+            frame[:, :, 3] = rng.integers(0, top + 1, (height, width))
+        frames.append(frame)
+    return frames
+
+
+# ---------- backends ----------
+def _cpu_backend(kernel):
+    cfg = KERNELS[kernel]
+    p = cfg["params"]
+
+    def run(frames):
+        out = []
+        for i, frame in enumerate(frames):
+            if kernel == "rgb48":
+                seed = (i * 2654435761) & 0xFFFFFFFF          # enhance_cuda_ffmpeg.frame_seed
+                out.append(enhance_math.enhance_rgb48(frame, p["sharpen"], p["contrast"], seed))
+            elif kernel == "rgba8":
+                out.append(enhance_math.enhance_rgba8(frame, p["sharpen"], p["saturation"], p["dither"],
+                                                      cfg["seed"] + i))
+            else:
+                out.append(enhance_math.enhance_rgba64(frame, p["sharpen"], p["saturation"], p["dither"],
+                                                       cfg["seed"] + i, preset=kernel))
+        return out
+    return run
+
+
+def _pycuda_backend():
+    # only a missing pycuda is a reason to skip; any other import error is a regression
+    if importlib.util.find_spec("pycuda") is None:
+        return None, "pycuda not installed"
+    try:
+        import enhance_cuda_ffmpeg
+    except Exception as e:
+        error = f"enhance_cuda_ffmpeg failed to import: {type(e).__name__}: {e}"
+
+        def broken(frames):
+            raise RuntimeError(error)
+        return broken, None
+    if not enhance_cuda_ffmpeg.HAVE_CUDA:
+        return None, "pycuda / GPU not available"
+
+    def run(frames):
+        h, w = frames[0].shape[:2]
+        enhancer = enhance_cuda_ffmpeg.CudaEnhancer(w, h)
+        return [enhancer.process(frame, i) for i, frame in enumerate(frames)]
+    return run, None
+
+
+def _find_tool(base):
+    for path in (base + ".exe", base) if os.name == "nt" else (base,):
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def _exe_backend(kernel):
+    tool = _find_tool(TOOLS[kernel])
+    if tool is None:
+        return None, f"{os.path.basename(TOOLS[kernel])} not built for this platform"
+    cfg = KERNELS[kernel]
+    p = cfg["params"]
+
+    def run(frames):
+        h, w = frames[0].shape[:2]
+        cmd = [tool, str(w), str(h), str(p["sharpen"]), str(p["saturation"]), str(p["dither"])]
+        if kernel != "16bit":     # the 16bit tool always starts at its built-in seed
+            cmd.append(str(cfg["seed"]))
+        data = b"".join(f.tobytes() for f in frames)
+        proc = subprocess.run(cmd, input=data, capture_output=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.decode(errors="replace").strip() or f"exit {proc.returncode}")
+        shape = (len(frames), h, w, cfg["out_channels"])
+        got = np.frombuffer(proc.stdout, dtype=np.uint16)
+        if got.size != np.prod(shape):
+            raise RuntimeError(f"tool wrote {got.size * 2} bytes, expected {int(np.prod(shape)) * 2}")
+        return list(got.reshape(shape))
+    return run, None
+
+
+def backends():
+    """name -> (run function or None, reason it is unavailable)."""
+    found = {}
+    for kernel in KERNELS:
+        found[f"{kernel}/cpu"] = (_cpu_backend(kernel), None)
+    found["rgb48/pycuda"] = _pycuda_backend()
+    for kernel in TOOLS:
+        found[f"{kernel}/exe"] = _exe_backend(kernel)
+    return found
+
+
+# ---------- check / bless ----------
+def digest(outputs):
+    h = hashlib.sha256()
+    for frame in outputs:
+        h.update(np.ascontiguousarray(frame).tobytes())
+    return h.hexdigest()
+
+
+def cpu_reference(kernel):
+    w, h = CHECK_SIZE
+    return _cpu_backend(kernel)(synthetic_frames(kernel, w, h, CHECK_FRAMES))
+
+
+def bless():
+    golden = {kernel: dict(sha256=digest(cpu_reference(kernel)), size=list(CHECK_SIZE), frames=CHECK_FRAMES,
+                           source=GOLDEN_SOURCE)
+              for kernel in KERNELS}
+    with open(GOLDEN_PATH, "w") as f:
+        json.dump(golden, f, indent=2)
+        f.write("\n")
+    print(f"[SUCCESS] Wrote {GOLDEN_PATH}")
+
+
+def check(selected):
+    with open(GOLDEN_PATH) as f:
+        golden = json.load(f)
+    w, h = CHECK_SIZE
+    failures = 0
+    references = {}
+    for name, (run, reason) in backends().items():
+        if selected and name not in selected:
+            continue
+        kernel, impl = name.split("/")
+        if run is None:
+            print(f"[SKIP] {name}: {reason}")
+            continue
+        try:
+            outputs = run(synthetic_frames(kernel, w, h, CHECK_FRAMES))
+        except Exception as e:
+            print(f"[FAIL] {name}: {e}")
+            failures += 1
+            continue
+        if impl == "cpu":
+            ok = digest(outputs) == golden[kernel]["sha256"]
+            print(f"[{'PASS' if ok else 'FAIL'}] {name}: golden sha256 {'matches' if ok else 'differs'}")
+        else:
+            if kernel not in references:
+                references[kernel] = cpu_reference(kernel)
+            diff = max(int(np.abs(a.astype(np.int32) - b.astype(np.int32)).max())
+                       for a, b in zip(outputs, references[kernel]))
+            ok = diff <= GPU_TOLERANCE
+            print(f"[{'PASS' if ok else 'FAIL'}] {name}: max |GPU - CPU| = {diff} (tolerance {GPU_TOLERANCE})")
+        failures += not ok
+    return failures
+
+
+# ---------- benchmark ----------
+def bench(sizes, frames, selected):
+    print(f"{'backend':<14}" + "".join(f"{s:>12}" for s in sizes))
+    for name, (run, reason) in backends().items():
+        if selected and name not in selected:
+            continue
+        if run is None:
+            print(f"{name:<14}  skipped: {reason}")
+            continue
+        kernel = name.split("/")[0]
+        row = []
+        for size in sizes:
+            w, h = BENCH_SIZES[size]
+            batch = synthetic_frames(kernel, w, h, 1) * frames
+            try:
+                run(batch[:1])                      # warm-up: kernel compile, textures, caches
+                t0 = time.perf_counter()
+                run(batch)
+                row.append(f"{frames / (time.perf_counter() - t0):9.2f} fps")
+            except Exception as e:
+                row.append(f"{'error':>12}")
+                print(f"[ERROR] {name} at {size}: {e}")
+            del batch
+        print(f"{name:<14}" + "".join(f"{c:>12}" for c in row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enhancement backend regression checks and benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_check = sub.add_parser("check", help="compare every available backend with the golden outputs")
+    p_check.add_argument("--backends", default="", help="comma separated subset, e.g. stream/cpu,stream/exe")
+    sub.add_parser("bless", help="rewrite the golden hashes from the CPU backends (not from a GPU)")
+    p_bench = sub.add_parser("bench", help="frames per second of each backend")
+    p_bench.add_argument("--sizes", default="1080p,4k,8k", help="comma separated: " + ",".join(BENCH_SIZES))
+    p_bench.add_argument("--frames", type=int, default=3, help="frames per measurement")
+    p_bench.add_argument("--backends", default="")
+    args = parser.parse_args()
+
+    selected = {b.strip() for b in getattr(args, "backends", "").split(",") if b.strip()}
+    if args.command == "bless":
+        bless()
+    elif args.command == "check":
+        failures = check(selected)
+        if failures:
+            print(f"[ERROR] {failures} backend(s) failed")
+            sys.exit(1)
+        print("[SUCCESS] All available backends match")
+    else:
+        sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+        for s in sizes:
+            if s not in BENCH_SIZES:
+                parser.error(f"unknown size: {s}")
+        bench(sizes, max(1, args.frames), selected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+param_sweep.py
+Try a grid of enhancement settings on a short sampled window of a source.
+
+Usage:
+    python param_sweep.py input.mov [--start 60] [--frames 48] [--step 2]
+        [--kernel stream|16bit|rgb48]
+        [--sharpen 0.8,1.15] [--contrast 1.02] [--saturation 1.0,1.35] [--dither 0,40,80]
+        [--dither-kind xorshift,white,blue]
+        [--encoder hevc_nvenc] [--bitrate 80M] [--jobs 3] [--out sweep_out]
+
+The window is decoded exactly once into a memory-mapped raw file (kept in
+--cache-dir, so later sweeps over the same window skip the decode too). Every
+parameter set is then enhanced on the CPU (enhance_math.py, same math as the
+CUDA kernels), encoded with the target encoder and measured against the
+enhanced frames it was fed with. Results go to <out>/report.csv.
+"""
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+
+import enhance_math
+from dither import DITHER_KINDS
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+
+# kernel -> raw pixel format, channels, which parameters it takes and their defaults
+KERNELS = {
+    "rgb48": dict(pix_fmt="rgb48le", channels=3, params=("sharpen", "contrast", "dither"),
+                  defaults=enhance_math.RGB48_DEFAULTS),
+    "stream": dict(pix_fmt="rgba64le", channels=4, params=("sharpen", "saturation", "dither", "contrast"),
+                   defaults=enhance_math.STREAM_DEFAULTS),
+    "16bit": dict(pix_fmt="rgba64le", channels=4, params=("sharpen", "saturation", "dither", "contrast"),
+                  defaults=enhance_math.BOOST16_DEFAULTS),
+}
+
+
+def probe_video(path):
+    cmd = [
+        FFPROBE, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,r_frame_rate", "-of", "json", path
+    ]
+    p = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    s = json.loads(p.stdout)["streams"][0]
+    a, b = s.get("r_frame_rate", "30/1").split("/")
+    fps = float(a) / float(b) if float(b) != 0 else 30.0
+    return int(s["width"]), int(s["height"]), fps
+
+
+# ---------- decode once ----------
+def decode_window(input_path, start, frames, step, pix_fmt, channels, cache_dir):
+    """Decode `frames` frames (every `step`th, from `start` seconds) into a uint16 memmap.
+
+    Returns (memmap of shape (N, H, W, C), fps of the sampled sequence).
+    """
+    w, h, fps = probe_video(input_path)
+    st = os.stat(input_path)
+    key = f"{os.path.abspath(input_path)}|{st.st_size}|{st.st_mtime_ns}|{start}|{frames}|{step}|{pix_fmt}"
+    name = hashlib.sha1(key.encode()).hexdigest()[:16]
+    os.makedirs(cache_dir, exist_ok=True)
+    raw_path = os.path.join(cache_dir, name + ".raw")
+    meta_path = os.path.join(cache_dir, name + ".json")
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        print(f"[INFO] Reusing cached window {raw_path} ({meta['frames']} frames)")
+        return np.memmap(raw_path, dtype=np.uint16, mode="r",
+                         shape=(meta["frames"], h, w, channels)), fps / step
+
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error"]
+    if start > 0:
+        cmd += ["-ss", str(start)]
+    cmd += ["-i", input_path]
+    if step > 1:
+        cmd += ["-vf", f"select=not(mod(n\\,{step}))"]
+    cmd += ["-frames:v", str(frames), "-vsync", "0", "-f", "rawvideo", "-pix_fmt", pix_fmt, "-"]
+
+    cache = np.memmap(raw_path, dtype=np.uint16, mode="w+", shape=(frames, h, w, channels))
+    print(f"[INFO] Decoding {frames} frames once into {raw_path}")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    got = 0
+    for i in range(frames):
+        # read straight into the mapped pages, no intermediate bytes object
+        view = memoryview(cache[i]).cast("B")
+        n = 0
+        while n < len(view):
+            r = proc.stdout.readinto(view[n:])
+            if not r:
+                break
+            n += r
+        if n < len(view):
+            break
+        got += 1
+    proc.stdout.close()
+    code = proc.wait()
+    cache.flush()
+    del cache
+    # only a complete, clean decode is recorded in the cache; anything else is decoded again next time
+    if code != 0 or got == 0:
+        os.remove(raw_path)
+        raise RuntimeError(f"decoder exited with {code} after {got} of {frames} frames")
+    if got < frames:
+        print(f"[WARN] Window ends after {got} of {frames} frames (end of input); not cached")
+    else:
+        with open(meta_path, "w") as f:
+            json.dump({"input": input_path, "frames": got, "width": w, "height": h, "pix_fmt": pix_fmt}, f)
+    return np.memmap(raw_path, dtype=np.uint16, mode="r", shape=(got, h, w, channels)), fps / step
+
+
+# ---------- per-setting worker ----------
+def enhance(kernel, frame, params, frame_index, out):
+    if kernel == "rgb48":
+        seed = (frame_index * 2654435761) & 0xFFFFFFFF
+        return enhance_math.enhance_rgb48(frame, params["sharpen"], params["contrast"], seed,
+                                          params["dither"], out=out, dither_kind=params["dither_kind"])
+    seed = (12345 if kernel == "stream" else 123456) + frame_index
+    return enhance_math.enhance_rgba64(frame, params["sharpen"], params["saturation"], params["dither"],
+                                       seed, params["contrast"], preset=kernel, out=out,
+                                       dither_kind=params["dither_kind"])
+
+
+def build_encode_cmd(args, pix_fmt, w, h, fps, out_path):
+    cmd = [
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{w}x{h}", "-r", f"{fps:.6f}", "-i", "-",
+        "-c:v", args.encoder, "-pix_fmt", args.out_pix_fmt,
+    ]
+    if args.bitrate:
+        cmd += ["-b:v", args.bitrate, "-maxrate", args.bitrate, "-bufsize", args.bitrate]
+    cmd += args.encoder_args.split()
+    return cmd + [out_path]
+
+
+def measure(encoded, enhanced_raw, pix_fmt, w, h, fps):
+    """PSNR/SSIM of the encoded file against the enhanced frames, via ffmpeg's psnr/ssim filters."""
+    graph = ("[0:v]format=yuv444p16le,split[a1][a2];"
+             "[1:v]format=yuv444p16le,split[b1][b2];"
+             "[a1][b1]psnr;[a2][b2]ssim")
+    cmd = [
+        FFMPEG, "-hide_banner", "-nostats", "-i", encoded,
+        "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{w}x{h}", "-r", f"{fps:.6f}", "-i", enhanced_raw,
+        "-lavfi", graph, "-f", "null", "-"
+    ]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    psnr = re.search(r"PSNR .*average:([0-9.]+|inf)", p.stderr)
+    ssim = re.search(r"SSIM .*All:([0-9.]+)", p.stderr)
+    return (float(psnr.group(1)) if psnr else float("nan"),
+            float(ssim.group(1)) if ssim else float("nan"))
+
+
+def run_setting(job):
+    args, kernel, cache_path, shape, fps, index, params = job
+    cfg = KERNELS[kernel]
+    frames = np.memmap(cache_path, dtype=np.uint16, mode="r", shape=shape)
+    n, h, w, _ = shape
+    tag = "_".join(f"{k[:3]}{params[k]:g}" for k in cfg["params"]) + "_" + params["dither_kind"]
+    out_path = os.path.join(args.out, f"{index:03d}_{tag}.mp4")
+    enhanced_raw = out_path + ".enhanced.raw"
+
+    enc = subprocess.Popen(build_encode_cmd(args, cfg["pix_fmt"], w, h, fps, out_path), stdin=subprocess.PIPE)
+    out = np.empty(shape[1:], dtype=np.uint16)
+    with open(enhanced_raw, "wb") as tee:
+        for i in range(n):
+            enhance(kernel, frames[i], params, i, out)
+            enc.stdin.write(out.data)
+            tee.write(out.data)
+    enc.stdin.close()
+    if enc.wait() != 0:
+        os.remove(enhanced_raw)
+        return dict(index=index, **params, size_bytes=0, kbps=0, psnr=float("nan"), ssim=float("nan"),
+                    file=out_path, error="encoder failed")
+
+    psnr, ssim = measure(out_path, enhanced_raw, cfg["pix_fmt"], w, h, fps)
+    os.remove(enhanced_raw)
+    size = os.path.getsize(out_path)
+    kbps = size * 8 / 1000 / (n / fps)
+    return dict(index=index, **params, size_bytes=size, kbps=round(kbps, 1),
+                psnr=round(psnr, 3), ssim=round(ssim, 5), file=out_path, error="")
+
+
+def parse_list(text):
+    return [float(v) for v in text.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter sweep over a decode-once frame window")
+    parser.add_argument("input")
+    parser.add_argument("--start", type=float, default=0.0, help="window start in seconds")
+    parser.add_argument("--frames", type=int, default=48, help="frames to sample")
+    parser.add_argument("--step", type=int, default=1, help="take every Nth frame")
+    parser.add_argument("--kernel", choices=sorted(KERNELS), default="stream")
+    parser.add_argument("--sharpen", default=None, help="comma separated values")
+    parser.add_argument("--contrast", default=None)
+    parser.add_argument("--saturation", default=None)
+    parser.add_argument("--dither", default=None)
+    parser.add_argument("--dither-kind", default="xorshift",
+                        help="comma separated dither kinds: " + ",".join(DITHER_KINDS))
+    parser.add_argument("--encoder", default="hevc_nvenc")
+    parser.add_argument("--encoder-args", default="-preset p7 -tune hq")
+    parser.add_argument("--out-pix-fmt", default="yuv444p10le")
+    parser.add_argument("--bitrate", default="80M")
+    parser.add_argument("--jobs", type=int, default=min(3, os.cpu_count() or 1),
+                        help="parallel settings (NVENC session limits apply)")
+    parser.add_argument("--out", default="sweep_out")
+    parser.add_argument("--cache-dir", default=".frame_cache")
+    args = parser.parse_args()
+
+    cfg = KERNELS[args.kernel]
+    defaults = cfg["defaults"]
+    axes = []
+    for name in cfg["params"]:
+        text = getattr(args, name)
+        axes.append(parse_list(text) if text else [defaults[name]])
+    kinds = [k.strip() for k in args.dither_kind.split(",") if k.strip()]
+    for kind in kinds:
+        if kind not in DITHER_KINDS:
+            parser.error(f"unknown dither kind: {kind}")
+    grid = [dict(zip(cfg["params"], combo), dither_kind=kind)
+            for combo in itertools.product(*axes) for kind in kinds]
+    if not grid:
+        parser.error("the parameter grid is empty (check the comma separated lists)")
+    print(f"[INFO] {len(grid)} parameter set(s) for kernel '{args.kernel}'")
+
+    frames, fps = decode_window(args.input, args.start, args.frames, args.step,
+                                cfg["pix_fmt"], cfg["channels"], args.cache_dir)
+    os.makedirs(args.out, exist_ok=True)
+    jobs = [(args, args.kernel, frames.filename, frames.shape, fps, i, p) for i, p in enumerate(grid)]
+
+    results = []
+    with multiprocessing.Pool(max(1, args.jobs)) as pool:
+        for res in pool.imap_unordered(run_setting, jobs):
+            results.append(res)
+            print(f"  #{res['index']:03d} {res['kbps']:>10} kbps  PSNR {res['psnr']}  SSIM {res['ssim']}  {res['error']}")
+
+    results.sort(key=lambda r: r["index"])
+    report = os.path.join(args.out, "report.csv")
+    with open(report, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"[SUCCESS] Report written to {report}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python param_sweep.py input.mov [--sharpen 0.8,1.15] [--dither 0,40,80] ...")
+        sys.exit(1)
+    main()
@@ -0,0 +1,46 @@
+"""
+pipe_buffers.py
+Pipe sizing for the raw-video process chains.
+
+A Linux pipe holds 64 KiB by default, so every 8K rgba64 frame (~265 MB)
+crosses it in thousands of tiny writes, each one a context switch between
+producer and consumer. F_SETPIPE_SZ raises the capacity up to
+/proc/sys/fs/pipe-max-size (1 MiB unless raised by root); elsewhere this is
+a no-op.
+"""
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+
+# Python < 3.10 does not export the constants
+F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+F_GETPIPE_SZ = getattr(fcntl, "F_GETPIPE_SZ", 1032)
+PIPE_MAX_SIZE = "/proc/sys/fs/pipe-max-size"
+
+
+def pipe_max_size():
+    try:
+        with open(PIPE_MAX_SIZE) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def set_pipe_size(pipe, size):
+    """Grow the kernel buffer of `pipe` (file object or fd) towards `size` bytes.
+
+    Returns the resulting capacity, or 0 where pipes cannot be resized.
+    """
+    limit = pipe_max_size() if fcntl else 0
+    if not limit:
+        return 0
+    fd = pipe if isinstance(pipe, int) else pipe.fileno()
+    try:
+        return fcntl.fcntl(fd, F_SETPIPE_SZ, min(size, limit))
+    except OSError:
+        try:
+            return fcntl.fcntl(fd, F_GETPIPE_SZ)
+        except OSError:
+            return 0
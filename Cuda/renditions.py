@@ -0,0 +1,144 @@
+"""
+renditions.py
+Encode several renditions from one decode + enhancement pass (--renditions).
+
+Instead of running Shorts/4k.sh, Shorts/8k.sh and the HDR scripts one after
+another (each decoding and enhancing the source again), the enhanced raw
+frames go into a single ffmpeg that splits them:
+
+    raw frames -> split=N -> scale -> zscale -> format -> encoder 1 -> <output>.4k_sdr.mp4
+                          -> scale -> zscale -> format -> encoder 2 -> <output>.8k_10bit.mp4
+                          -> scale -> zscale -> format -> encoder 3 -> <output>.1080p_check.mp4
+
+Sizes are given by the short edge, so vertical Shorts sources (2160x3840)
+and landscape sources both get the usual ladder. The encoder settings follow
+the existing scripts.
+
+The raw frames are RGB in the source's primaries and transfer (probe_color).
+Each branch's zscale converts them to the rendition's colour (BT.709 or
+HDR10) and to YUV with that matrix, tonemapping PQ/HLG sources down for the
+SDR rungs; renditions without a colour of their own keep the source's. The
+outputs are tagged with what they were converted to.
+"""
+
+import json
+import os
+import subprocess
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+
+# ffmpeg colour names (zscale accepts the same ones)
+BT709 = dict(primaries="bt709", transfer="bt709", matrix="bt709")
+HDR10 = dict(primaries="bt2020", transfer="smpte2084", matrix="bt2020nc")
+HDR_TRANSFERS = ("smpte2084", "arib-std-b67")
+UNSET = (None, "", "unknown", "unspecified", "reserved")
+
+RENDITIONS = {
+    "4k_sdr": dict(short_edge=2160, pix_fmt="yuv420p10le", color=BT709, args=[
+        "-c:v", "hevc_nvenc", "-profile:v", "main10", "-preset", "p5", "-tune", "hq",
+        "-rc", "vbr", "-cq", "18", "-b:v", "0", "-spatial-aq", "1", "-temporal-aq", "1"]),
+    "4k_444": dict(short_edge=2160, pix_fmt="yuv444p10le", args=[          # Shorts/4k.sh
+        "-c:v", "hevc_nvenc", "-profile:v", "rext", "-preset", "p5", "-tune", "hq",
+        "-rc", "constqp", "-cq", "12", "-b_ref_mode", "middle",
+        "-spatial-aq", "1", "-temporal-aq", "1", "-aq-strength", "15"]),
+    "8k_10bit": dict(short_edge=4320, pix_fmt="p010le", args=[              # Shorts/8k.sh
+        "-c:v", "hevc_nvenc", "-profile:v", "main10", "-preset", "p5", "-tune", "hq",
+        "-rc", "constqp", "-cq", "10"]),
+    "8k_hdr10": dict(short_edge=4320, pix_fmt="p010le", color=HDR10, args=[  # Shorts/8k_hdr_master_encode.sh
+        "-c:v", "hevc_nvenc", "-profile:v", "main10", "-preset", "p7", "-tune", "hq",
+        "-b:v", "500M", "-maxrate", "600M", "-bufsize", "800M",
+        "-rc", "vbr", "-rc-lookahead", "32", "-spatial-aq", "1", "-aq-strength", "10", "-temporal-aq", "1",
+        "-g", "120", "-bf", "3"]),
+    "1080p_check": dict(short_edge=1080, pix_fmt="yuv420p", color=BT709, args=[
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "20"]),
+}
+DEFAULT_LADDER = "4k_sdr,8k_10bit,1080p_check"
+
+
+def parse_renditions(text):
+    names = [n.strip() for n in text.split(",") if n.strip()]
+    for name in names:
+        if name not in RENDITIONS:
+            raise ValueError(f"unknown rendition '{name}' (known: {', '.join(RENDITIONS)})")
+    return names
+
+
+def rendition_path(output_path, name):
+    base, ext = os.path.splitext(output_path)
+    return f"{base}.{name}{ext or '.mp4'}"
+
+
+def scale_filter(short_edge):
+    # short edge to `short_edge`, long edge from the aspect ratio (even)
+    return (f"scale=w='if(gt(iw,ih),-2,{short_edge})':h='if(gt(iw,ih),{short_edge},-2)'"
+            f":flags=lanczos")
+
+
+def probe_color(path):
+    """Colour primaries, transfer and matrix of the first video stream; unset tags are taken as BT.709."""
+    cmd = [FFPROBE, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=color_primaries,color_transfer,color_space", "-of", "json", path]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    streams = json.loads(p.stdout).get("streams", []) if p.returncode == 0 else []
+    s = streams[0] if streams else {}
+    color = dict(primaries=s.get("color_primaries"), transfer=s.get("color_transfer"),
+                 matrix=s.get("color_space"))
+    if color["matrix"] == "gbr":
+        color["matrix"] = None      # RGB source: the YUV renditions need a real matrix
+    return {key: BT709[key] if value in UNSET else value for key, value in color.items()}
+
+
+def color_filter(source, target):
+    """zscale chain taking RGB frames in `source` colour to YUV in `target` colour (limited range)."""
+    if source["transfer"] in HDR_TRANSFERS and target["transfer"] not in HDR_TRANSFERS:
+        # HDR -> SDR: linearize, bring highlights into range, then apply the SDR transfer
+        return (f"zscale=primariesin={source['primaries']}:transferin={source['transfer']}"
+                f":transfer=linear:npl=100,format=gbrpf32le,zscale=primaries={target['primaries']},"
+                f"tonemap=hable:desat=0,zscale=transfer={target['transfer']}:matrix={target['matrix']}"
+                f":range=limited")
+    return (f"zscale=primariesin={source['primaries']}:transferin={source['transfer']}"
+            f":primaries={target['primaries']}:transfer={target['transfer']}:matrix={target['matrix']}"
+            f":range=limited")
+
+
+def color_tags(color):
+    return ["-color_primaries", color["primaries"], "-color_trc", color["transfer"],
+            "-colorspace", color["matrix"], "-color_range", "tv"]
+
+
+def ladder_filtergraph(names, source_color=BT709, source="0:v"):
+    """filter_complex splitting `source` into one scaled, converted, formatted branch per rendition ([r0], ...)."""
+    n = len(names)
+    graph = [f"[{source}]split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    for i, name in enumerate(names):
+        r = RENDITIONS[name]
+        color = color_filter(source_color, r.get("color", source_color))
+        graph.append(f"[s{i}]{scale_filter(r['short_edge'])},{color},format={r['pix_fmt']}[r{i}]")
+    return ";".join(graph)
+
+
+def build_ladder_encode_cmd(raw_input_args, names, output_path, audio_from=None, source_color=BT709):
+    """One ffmpeg reading raw frames (`raw_input_args` ends with "-i", "-") and writing every rendition.
+
+    `audio_from` adds the source's audio to each output with stream copy.
+    `source_color` (probe_color) is the colour the raw RGB frames are in.
+    """
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", *raw_input_args]
+    if audio_from:
+        cmd += ["-i", audio_from]
+    cmd += ["-filter_complex", ladder_filtergraph(names, source_color)]
+    for i, name in enumerate(names):
+        r = RENDITIONS[name]
+        cmd += ["-map", f"[r{i}]"]
+        if audio_from:
+            cmd += ["-map", "1:a?", "-c:a", "copy"]
+        cmd += ["-pix_fmt", r["pix_fmt"], *r["args"], *color_tags(r.get("color", source_color)),
+                rendition_path(output_path, name)]
+    return cmd
+
+
+def add_rendition_args(parser):
+    parser.add_argument("--renditions", default=None, metavar="LIST",
+                        help="encode several renditions from one pass, e.g. " + DEFAULT_LADDER +
+                             " (known: " + ", ".join(RENDITIONS) + ")")
@@ -0,0 +1,194 @@
+"""
+segment_checkpoint.py
+Checkpoint / resume bookkeeping for long enhancement runs.
+
+The output is written as independent closed-GOP segments (every segment is
+its own encoder session, so it starts on an IDR frame and never references
+another segment) plus a JSON manifest recording which frame ranges are done
+and which dither seed each segment started from. After a crash the enhancer
+reloads the manifest, seeks the decoder to the first unfinished segment and
+carries on; finished segments are never decoded, enhanced or encoded again.
+
+Used by enhance_cuda_ffmpeg.py and enhance_with_cuda_stream.py (--resume).
+"""
+
+import json
+import os
+import subprocess
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+MANIFEST_VERSION = 1
+DEFAULT_SEGMENT_FRAMES = 600   # 10 s at 60 fps
+
+
+def probe_frame_count(path):
+    """Return the number of video frames in `path`.
+
+    Uses the container's nb_frames when present, otherwise counts packets
+    (demux only, no decode) which is still fast for long files.
+    """
+    cmd = [
+        FFPROBE, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=nb_frames,duration", "-of", "json", path
+    ]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode == 0:
+        stream = json.loads(p.stdout).get("streams", [{}])[0]
+        nb = stream.get("nb_frames")
+        if nb and nb.isdigit() and int(nb) > 0:
+            return int(nb)
+    cmd = [
+        FFPROBE, "-v", "error", "-select_streams", "v:0", "-count_packets",
+        "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", path
+    ]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0 or not p.stdout.strip().isdigit():
+        raise RuntimeError("could not determine frame count: " + p.stderr)
+    return int(p.stdout.strip())
+
+
+def seek_args(start_frame, fps):
+    """Input-side seek arguments that land exactly on `start_frame`.
+
+    ffmpeg seeks to the previous keyframe and decodes forward, dropping frames
+    before the requested time. Seeking half a frame early keeps rounding in the
+    timestamp from skipping or repeating the boundary frame.
+    """
+    if start_frame <= 0:
+        return []
+    return ["-ss", f"{(start_frame - 0.5) / fps:.6f}"]
+
+
+class SegmentManifest:
+    """Tracks completed segments of one (input, output, parameters) run.
+
+    The manifest lives next to the output as `<output>.segments/manifest.json`
+    and is rewritten atomically after every finished segment, so it only ever
+    lists segments whose file is complete on disk.
+    """
+
+    def __init__(self, output_path, input_path, total_frames, fps, segment_frames, params):
+        self.segment_dir = output_path + ".segments"
+        self.path = os.path.join(self.segment_dir, "manifest.json")
+        self.output_path = output_path
+        self.data = {
+            "version": MANIFEST_VERSION,
+            "input": os.path.abspath(input_path),
+            "input_size": os.path.getsize(input_path),
+            "total_frames": int(total_frames),
+            "fps": fps,
+            "segment_frames": int(segment_frames),
+            "params": params,
+            "segments": {},
+        }
+
+    # ---------- persistence ----------
+    def load_or_init(self):
+        """Reuse an existing manifest if it belongs to the same job, else start fresh."""
+        os.makedirs(self.segment_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                old = json.load(f)
+            keys = ("version", "input", "input_size", "segment_frames", "params")
+            if all(old.get(k) == self.data[k] for k in keys):
+                # total_frames may have been truncated by a previous run that hit EOF early
+                self.data["total_frames"] = old["total_frames"]
+                self.data["segments"] = old.get("segments", {})
+                # drop entries whose file disappeared
+                for key, seg in list(self.data["segments"].items()):
+                    if not os.path.exists(os.path.join(self.segment_dir, seg["file"])):
+                        del self.data["segments"][key]
+            else:
+                raise RuntimeError(
+                    f"{self.path} belongs to a different input or parameter set; "
+                    "delete the .segments folder to start over")
+        self.save()
+        return self
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    # ---------- segment layout ----------
+    @property
+    def segment_count(self):
+        n, seg = self.data["total_frames"], self.data["segment_frames"]
+        return (n + seg - 1) // seg
+
+    def segment_range(self, index):
+        """Return (start_frame, frame_count) for segment `index`."""
+        seg = self.data["segment_frames"]
+        start = index * seg
+        return start, min(seg, self.data["total_frames"] - start)
+
+    def segment_file(self, index):
+        return os.path.join(self.segment_dir, f"seg_{index:05d}.mp4")
+
+    def is_done(self, index):
+        return str(index) in self.data["segments"]
+
+    def pending_runs(self):
+        """Group unfinished segments into contiguous runs [(first, last), ...].
+
+        Each run needs exactly one decoder seek.
+        """
+        runs = []
+        for i in range(self.segment_count):
+            if self.is_done(i):
+                continue
+            if runs and runs[-1][1] == i - 1:
+                runs[-1] = (runs[-1][0], i)
+            else:
+                runs.append((i, i))
+        return runs
+
+    def truncate(self, total_frames):
+        """Shrink the job when the decoder runs dry before the probed frame count (never grows it)."""
+        self.data["total_frames"] = min(int(total_frames), self.data["total_frames"])
+        self.save()
+
+    def mark_done(self, index, tmp_file, seed, count=None):
+        """Move a finished segment into place and record it in the manifest."""
+        final = self.segment_file(index)
+        os.replace(tmp_file, final)
+        start, full = self.segment_range(index)
+        if count is None:
+            count = full
+        elif count < full:
+            self.data["total_frames"] = start + count
+        self.data["segments"][str(index)] = {
+            "file": os.path.basename(final),
+            "start_frame": start,
+            "end_frame": start + count - 1,
+            "seed": int(seed),
+        }
+        self.save()
+
+    @property
+    def complete(self):
+        return len(self.data["segments"]) == self.segment_count
+
+    # ---------- final assembly ----------
+    def concat(self, output_path):
+        """Join all segments into `output_path` with stream copy (no re-encode)."""
+        list_path = os.path.join(self.segment_dir, "concat.txt")
+        with open(list_path, "w") as f:
+            for i in range(self.segment_count):
+                name = os.path.basename(self.segment_file(i))
+                f.write(f"file '{name}'\n")
+        cmd = [
+            FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", output_path
+        ]
+        subprocess.run(cmd, check=True)
+
+    def cleanup(self):
+        for name in os.listdir(self.segment_dir):
+            os.remove(os.path.join(self.segment_dir, name))
+        os.rmdir(self.segment_dir)
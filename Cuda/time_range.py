@@ -0,0 +1,255 @@
+"""
+time_range.py
+Process only part of a video (--start/--end, --start-frame/--end-frame) and
+optionally splice the result back into an existing full-length output (--splice).
+
+The decoder seeks on the input side (keyframe seek, then decode forward to
+the exact frame, see segment_checkpoint.seek_args) and stops after the
+requested number of frames, so a 20-second fix costs 20 seconds of decode,
+enhancement and encode. Dither seeds follow the absolute frame index, so the
+frames match what a full run would have produced.
+
+With --splice TARGET the range is widened to TARGET's keyframes, rendered to
+a temporary part and joined with stream copy:
+
+    TARGET[0 .. start)  +  new part [start .. end)  +  TARGET[end ..]   (+ TARGET's audio)
+
+Nothing outside the range is decoded or re-encoded. The part must use the
+same codec, profile, pixel format and size as TARGET (normally TARGET is an
+earlier output of the same enhancer). Both cuts are made by timestamp at a
+keyframe; a keyframe with leading pictures (open GOP: frames shown before it
+but decoded after it) cannot be cut there with stream copy and is refused.
+"""
+
+import json
+import os
+import subprocess
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+
+
+def parse_time(text):
+    """Seconds from '12.5', '1:02.5' or '0:01:02.5'."""
+    seconds = 0.0
+    for part in str(text).split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def add_range_args(parser):
+    group = parser.add_argument_group("time range")
+    group.add_argument("--start", type=parse_time, default=None, help="range start ([HH:]MM:SS or seconds)")
+    group.add_argument("--end", type=parse_time, default=None, help="range end, exclusive")
+    group.add_argument("--start-frame", type=int, default=None, help="range start as a frame index")
+    group.add_argument("--end-frame", type=int, default=None, help="range end as a frame index, exclusive")
+    group.add_argument("--splice", metavar="TARGET", default=None,
+                       help="splice the processed range into this existing full-length output")
+
+
+def requested_range(args, fps):
+    """(start_frame, end_frame or None) from the parsed options, or None when no range was given."""
+    if all(getattr(args, k, None) is None for k in ("start", "end", "start_frame", "end_frame")):
+        if getattr(args, "splice", None):
+            raise ValueError("--splice needs --start/--end or --start-frame/--end-frame")
+        return None
+    if args.start is not None and args.start_frame is not None:
+        raise ValueError("use either --start or --start-frame")
+    if args.end is not None and args.end_frame is not None:
+        raise ValueError("use either --end or --end-frame")
+    start = args.start_frame if args.start_frame is not None else int(round((args.start or 0.0) * fps))
+    end = args.end_frame
+    if args.end is not None:
+        end = int(round(args.end * fps))
+    if start < 0 or (end is not None and end <= start):
+        raise ValueError(f"empty frame range {start}..{end}")
+    return start, end
+
+
+def output_args(start_frame, end_frame):
+    """Output-side trim that ends the decode exactly at `end_frame`."""
+    return [] if end_frame is None else ["-frames:v", str(end_frame - start_frame)]
+
+
+# ---------- splicing ----------
+def keyframes(path, fps):
+    """[(frame_index, pts_time, dts_time, open_gop), ...] of the video keyframes in `path` (demux only, no decode).
+
+    open_gop is True when a packet decoded after the keyframe (before the next
+    one) is shown before it, i.e. the keyframe has leading pictures.
+    """
+    cmd = [
+        FFPROBE, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,dts_time,flags", "-of", "csv=p=0", path
+    ]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        raise RuntimeError("ffprobe failed: " + p.stderr)
+    packets = []      # decode order
+    for line in p.stdout.splitlines():
+        pts, dts, flags = (line.split(",") + ["", ""])[:3]
+        if pts and pts != "N/A":
+            packets.append((float(pts), float(dts) if dts and dts != "N/A" else float(pts), "K" in flags))
+    if not packets:
+        raise RuntimeError(f"no video packets in {path}")
+    first = min(pts for pts, _, _ in packets)
+    keys = []
+    for n, (pts, dts, key) in enumerate(packets):
+        if not key:
+            continue
+        leading = False
+        for later_pts, _, later_key in packets[n + 1:]:
+            if later_key:
+                break
+            if later_pts < pts:
+                leading = True
+                break
+        keys.append((int(round((pts - first) * fps)), pts, dts, leading))
+    return sorted(keys)
+
+
+def snap_to_keyframes(start_frame, end_frame, keys):
+    """Widen [start, end) to keyframe boundaries of the splice target.
+
+    Returns (start, head_dts, end, tail_pts): head_dts is the decode timestamp
+    of the keyframe the head is cut before (None when start is 0), end is None
+    when the range runs to the end of the target, tail_pts is the timestamp
+    the untouched tail starts at. Raises ValueError when a cut would land on
+    an open-GOP keyframe.
+    """
+    start, head_dts = 0, None
+    start_key = max((k for k in keys if k[0] <= start_frame), default=None)
+    if start_key is not None and start_key[0] > 0:
+        start, _, head_dts, leading = start_key
+        if leading:
+            raise ValueError(f"the splice target's keyframe at frame {start} has leading pictures (open GOP); "
+                             "it cannot be cut there with stream copy")
+    if end_frame is None:
+        return start, head_dts, None, None
+    for i, pts, _, leading in keys:
+        if i >= end_frame:
+            if leading:
+                raise ValueError(f"the splice target's keyframe at frame {i} has leading pictures (open GOP); "
+                                 "it cannot be cut there with stream copy")
+            return start, head_dts, i, pts
+    return start, head_dts, None, None
+
+
+def stream_signature(path):
+    cmd = [
+        FFPROBE, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,profile,pix_fmt,width,height", "-of", "json", path
+    ]
+    p = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(p.stdout)["streams"][0]
+
+
+def container_start(path):
+    """The container's start_time in seconds; input-side -ss positions are relative to it."""
+    cmd = [FFPROBE, "-v", "error", "-show_entries", "format=start_time", "-of", "json", path]
+    p = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    value = json.loads(p.stdout).get("format", {}).get("start_time", "0")
+    try:
+        return float(value)
+    except ValueError:      # "N/A"
+        return 0.0
+
+
+def splice_into(target, part, output_path, head_dts, tail_pts, fps):
+    """Join TARGET's head, `part` and TARGET's tail with stream copy, audio taken from TARGET.
+
+    `head_dts` / `tail_pts` come from snap_to_keyframes (None: no head / no tail).
+
+    Raises ValueError when `part` cannot be stream-copied next to TARGET.
+    """
+    want, got = stream_signature(target), stream_signature(part)
+    if want != got:
+        raise ValueError(f"cannot stream-copy splice: target is {want}, processed range is {got}")
+
+    work = output_path + ".splice"
+    os.makedirs(work, exist_ok=True)
+    pieces = []
+    base = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y"]
+    # both cuts are absolute timestamps; -ss and -t count from the container's start_time
+    origin = container_start(target)
+    if head_dts is not None:
+        head = os.path.join(work, "head.mp4")
+        # stream copy stops at the first packet whose decode time reaches -t: everything decoded
+        # before the keyframe (a quarter frame early, for the rounding of the probed times)
+        duration = head_dts - origin - 0.25 / fps
+        subprocess.run(base + ["-i", target, "-map", "0:v:0", "-c", "copy",
+                               "-t", f"{max(duration, 0.0):.6f}", head], check=True)
+        pieces.append(head)
+    pieces.append(os.path.abspath(part))
+    if tail_pts is not None:
+        tail = os.path.join(work, "tail.mp4")
+        # copy seek lands on the keyframe at or before the time; half a frame past it is safe
+        seek = tail_pts - origin + 0.5 / fps
+        subprocess.run(base + ["-ss", f"{max(seek, 0.0):.6f}", "-i", target, "-map", "0:v:0",
+                               "-c", "copy", tail], check=True)
+        pieces.append(tail)
+
+    list_path = os.path.join(work, "concat.txt")
+    with open(list_path, "w") as f:
+        for piece in pieces:
+            escaped = os.path.abspath(piece).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    # written next to the output first, so TARGET may be the output itself
+    joined = os.path.join(work, "joined" + os.path.splitext(output_path)[1])
+    subprocess.run(base + ["-f", "concat", "-safe", "0", "-i", list_path, "-i", target,
+                           "-map", "0:v:0", "-map", "1:a?", "-c", "copy", joined], check=True)
+    os.replace(joined, output_path)
+    for name in os.listdir(work):
+        os.remove(os.path.join(work, name))
+    os.rmdir(work)
+
+
+def mux_range_audio(part, source, output_path, start_frame, end_frame, fps):
+    """Copy `part`'s video and the matching stretch of `source`'s audio into `output_path`."""
+    audio_in = ["-ss", f"{start_frame / fps:.6f}"] if start_frame > 0 else []
+    if end_frame is not None:
+        audio_in += ["-t", f"{(end_frame - start_frame) / fps:.6f}"]
+    cmd = [
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", part, *audio_in, "-i", source,
+        "-map", "0:v:0", "-map", "1:a?", "-c", "copy", output_path
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def run_range(args, output_path, fps, render, audio_from=None):
+    """Handle the range options for an entry point.
+
+    `render(path, start_frame, end_frame)` writes frames [start, end) of the
+    source (end None = to the end) as a video-only file and returns True on
+    success. Without --splice, `audio_from` (the source) adds the range's audio.
+    Returns None when no range was requested (the caller runs its normal full
+    pipeline), else the success flag. Raises ValueError for unusable options
+    and for a processed range that cannot be spliced into the target.
+    """
+    rng = requested_range(args, fps)
+    if rng is None:
+        return None
+    start, end = rng
+    part = output_path + ".range.mp4"
+    if not args.splice:
+        print(f"[INFO] Processing frames {start}..{'end' if end is None else end - 1}")
+        if audio_from is None:
+            return render(output_path, start, end)
+        if not render(part, start, end):
+            return False
+        mux_range_audio(part, audio_from, output_path, start, end, fps)
+        os.remove(part)
+        return True
+
+    start, head_dts, end, tail_pts = snap_to_keyframes(start, end, keyframes(args.splice, fps))
+    print(f"[INFO] Processing frames {start}..{'end' if end is None else end - 1} "
+          f"(widened to keyframes of {args.splice})")
+    if not render(part, start, end):
+        return False
+    try:
+        splice_into(args.splice, part, output_path, head_dts, tail_pts, fps)
+    finally:
+        os.remove(part)
+    print(f"[SUCCESS] Spliced range into {output_path}")
+    return True
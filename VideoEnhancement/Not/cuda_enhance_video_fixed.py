@@ -54,6 +54,7 @@ def enhance_video(input_file, output_file="enhanced_output.mp4"):
         print(f"[SUCCESS] Enhanced video saved as: {output_file}")
     else:
         print("[ERROR] FFmpeg process failed!")
+    return process.returncode == 0
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -64,6 +64,7 @@ def enhance_video(input_file, output_file):
     print(" ".join(shlex.quote(c) for c in cmd))
     subprocess.run(cmd, check=True)
     print(f"\n✅ Enhanced video saved as: {output_file}")
+    return True
 
 def main():
     if len(sys.argv) < 2:
@@ -37,6 +37,7 @@ def enhance_video(input_file, output_file="output_enhanced.mp4"):
         print(f"[SUCCESS] Output saved as {output_file}")
     else:
         print("[ERROR] FFmpeg failed!")
+    return process.returncode == 0
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
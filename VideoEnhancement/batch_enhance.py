@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+batch_enhance.py
+Persistent job queue + worker pool for running the enhancers unattended.
+
+Usage:
+    python batch_enhance.py add <file-or-dir> [...] [--backend cuda_stream] [--out-dir enhanced]
+    python batch_enhance.py run [--cpus N] [--encoder-sessions N] [--ram-mb N]
+    python batch_enhance.py status
+
+Jobs live in a local SQLite database (batch_jobs.sqlite by default), so the
+queue survives restarts. A running job records the runner that claimed it
+and its child process, each as "pid:start time" so a reused pid is not
+mistaken for them. On the next `run`, jobs whose runner no longer exists are
+put back in the queue and an orphaned child that is still alive is killed.
+Several runners may share one database; a job is claimed by exactly one.
+Each job runs in its own child process and calls an existing entry point:
+
+    cuda_stream     ../Cuda/enhance_with_cuda_stream.py  main(input_path, output_path, resume=True)
+    final / fixed / cuda / nvenc444 / zscale / enhance
+                    Not/*.py                             enhance_video(input_file, output_file)
+
+The scheduler only starts a job when its CPU cores, NVENC sessions and RAM
+estimate fit in the remaining budget, so a night of 8K jobs cannot oversubscribe
+the encoder or push the node into swap.
+"""
+
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = "batch_jobs.sqlite"
+VIDEO_EXTS = (".mov", ".mp4", ".mkv", ".avi", ".webm", ".m4v", ".mxf")
+
+# name -> script, function, extra kwargs, cores, NVENC sessions, frames held in memory
+BACKENDS = {
+    "cuda_stream": dict(script=os.path.join(HERE, "..", "Cuda", "enhance_with_cuda_stream.py"),
+                        func="main", kwargs={"resume": True}, cpus=2, encoders=1, frames=8, bpp=8),
+    "final":       dict(script=os.path.join(HERE, "Not", "cuda_enhance_video_final.py"),
+                        func="enhance_video", kwargs={}, cpus=4, encoders=1, frames=16, bpp=6),
+    "fixed":       dict(script=os.path.join(HERE, "Not", "cuda_enhance_video_fixed.py"),
+                        func="enhance_video", kwargs={}, cpus=4, encoders=1, frames=16, bpp=6),
+    "cuda":        dict(script=os.path.join(HERE, "Not", "cuda_enhance_video.py"),
+                        func="enhance_video", kwargs={}, cpus=4, encoders=1, frames=16, bpp=6),
+    "nvenc444":    dict(script=os.path.join(HERE, "Not", "enhance_video_cuda.py"),
+                        func="enhance_video", kwargs={}, cpus=1, encoders=1, frames=8, bpp=6),
+    "zscale":      dict(script=os.path.join(HERE, "Not", "enhance_video_fixed.py"),
+                        func="enhance_video", kwargs={}, cpus=4, encoders=1, frames=16, bpp=6),
+    "enhance":     dict(script=os.path.join(HERE, "Not", "enhance_video.py"),
+                        func="enhance_video", kwargs={}, cpus=1, encoders=1, frames=8, bpp=3),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    input       TEXT NOT NULL,
+    output      TEXT NOT NULL,
+    backend     TEXT NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'queued',   -- queued | running | done | failed
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    ram_mb      INTEGER NOT NULL DEFAULT 0,
+    pid         INTEGER,
+    runner      TEXT,                             -- "pid:start" of the runner that claimed the job
+    child       TEXT,                             -- "pid:start" of the job's child process
+    error       TEXT,
+    created     REAL NOT NULL,
+    started     REAL,
+    finished    REAL,
+    UNIQUE(input, output, backend)
+);
+"""
+
+
+# ---------- database ----------
+def connect(db_path):
+    # isolation_level=None: every statement commits immediately, so a crash never loses a state change
+    db = sqlite3.connect(db_path, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    # databases created before jobs recorded their runner
+    columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+    for name in ("runner", "child"):
+        if name not in columns:
+            db.execute(f"ALTER TABLE jobs ADD COLUMN {name} TEXT")
+    return db
+
+
+def estimate_ram_mb(path, backend):
+    """Rough peak RAM for a job: frames in flight * frame size, plus ffmpeg overhead."""
+    cfg = BACKENDS[backend]
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=width,height", "-of", "json", path]
+    try:
+        p = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        s = json.loads(p.stdout)["streams"][0]
+        w, h = int(s["width"]), int(s["height"])
+    except Exception:
+        w, h = 3840, 2160
+    return 512 + (cfg["frames"] * w * h * cfg["bpp"]) // (1 << 20)
+
+
+def collect_inputs(paths):
+    for p in paths:
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                if name.lower().endswith(VIDEO_EXTS):
+                    yield os.path.join(p, name)
+        else:
+            yield p
+
+
+def add_jobs(db, paths, backend, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    added = 0
+    for path in collect_inputs(paths):
+        src = os.path.abspath(path)
+        base = os.path.splitext(os.path.basename(src))[0]
+        dst = os.path.abspath(os.path.join(out_dir, f"{base}_{backend}.mp4"))
+        cur = db.execute(
+            "INSERT OR IGNORE INTO jobs (input, output, backend, ram_mb, created) VALUES (?, ?, ?, ?, ?)",
+            (src, dst, backend, estimate_ram_mb(src, backend), time.time()))
+        added += cur.rowcount
+    print(f"[INFO] Queued {added} new job(s)")
+
+
+def process_identity(pid):
+    """"pid:start time" of a live process, or None when no such process exists (or it cannot be told)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # field 22 (starttime) counted after the parenthesised command name, which may contain spaces
+            return f"{pid}:{f.read().rsplit(')', 1)[1].split()[19]}"
+    except (OSError, IndexError):
+        pass
+    if os.path.isdir("/proc/self"):
+        return None
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        return f"{pid}:{psutil.Process(pid).create_time()}"
+    except psutil.Error:
+        return None
+
+
+def identity_alive(identity):
+    return bool(identity) and process_identity(int(identity.split(":", 1)[0])) == identity
+
+
+def kill_orphan(identity):
+    """Terminate a job child (and the ffmpeg processes in its group) if it is still the same process."""
+    if not identity_alive(identity):
+        return False
+    pid = int(identity.split(":", 1)[0])
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(pid, signal.SIGTERM)      # the child leads its own process group
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except OSError:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            return False
+    return True
+
+
+def recover_stale(db):
+    """Requeue jobs left 'running' by a runner that no longer exists, killing their orphaned children."""
+    for row in db.execute("SELECT id, runner, child FROM jobs WHERE state = 'running'").fetchall():
+        if identity_alive(row["runner"]):
+            continue
+        if kill_orphan(row["child"]):
+            print(f"[WARN] Killed orphaned child {row['child']} of job {row['id']}")
+        cur = db.execute("UPDATE jobs SET state = 'queued', pid = NULL, runner = NULL, child = NULL "
+                         "WHERE id = ? AND state = 'running' AND runner IS ?", (row["id"], row["runner"]))
+        if cur.rowcount:
+            print(f"[INFO] Requeued interrupted job {row['id']}")
+
+
+# ---------- worker ----------
+def _run_job(backend, input_path, output_path):
+    """Child process body: import the backend script by path and call its entry point."""
+    cfg = BACKENDS[backend]
+    if hasattr(os, "setpgrp"):
+        # own process group, so an orphan can be killed together with its ffmpeg children
+        os.setpgrp()
+    script = os.path.abspath(cfg["script"])
+    # the enhancers look for their CUDA tools next to themselves
+    os.chdir(os.path.dirname(script))
+    sys.path.insert(0, os.path.dirname(script))
+    spec = importlib.util.spec_from_file_location(f"backend_{backend}", script)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    result = getattr(mod, cfg["func"])(input_path, output_path, **cfg["kwargs"])
+    if result is False:
+        sys.exit(1)
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        sys.exit(2)
+
+
+# ---------- scheduler ----------
+class ResourcePool:
+    """Budgets for concurrently running jobs."""
+
+    def __init__(self, cpus, encoders, ram_mb):
+        self.free = {"cpus": cpus, "encoders": encoders, "ram_mb": ram_mb}
+        self.total = dict(self.free)
+
+    def cost(self, row):
+        cfg = BACKENDS[row["backend"]]
+        # a job larger than the whole budget would never start; clamp so it runs alone
+        return {"cpus": min(cfg["cpus"], self.total["cpus"]),
+                "encoders": min(cfg["encoders"], self.total["encoders"]),
+                "ram_mb": min(row["ram_mb"], self.total["ram_mb"])}
+
+    def fits(self, cost):
+        return all(self.free[k] >= v for k, v in cost.items())
+
+    def take(self, cost):
+        for k, v in cost.items():
+            self.free[k] -= v
+
+    def give(self, cost):
+        for k, v in cost.items():
+            self.free[k] += v
+
+
+def default_ram_mb():
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.75) >> 20
+    except (ValueError, OSError, AttributeError):
+        return 8192
+
+
+def run_queue(db, cpus, encoders, ram_mb, max_attempts, poll=1.0):
+    recover_stale(db)
+    runner = process_identity(os.getpid()) or f"{os.getpid()}:{time.time()}"
+    pool = ResourcePool(cpus, encoders, ram_mb)
+    running = {}   # job id -> (process, cost)
+    print(f"[INFO] Worker pool: {cpus} cores, {encoders} encoder sessions, {ram_mb} MB RAM")
+
+    while True:
+        # reap finished children first so their resources are free for this round
+        for job_id, (proc, cost) in list(running.items()):
+            if proc.is_alive():
+                continue
+            proc.join()
+            pool.give(cost)
+            del running[job_id]
+            if proc.exitcode == 0:
+                db.execute("UPDATE jobs SET state = 'done', pid = NULL, child = NULL, error = NULL, finished = ? WHERE id = ?",
+                           (time.time(), job_id))
+                print(f"[SUCCESS] Job {job_id} done")
+            else:
+                row = db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                state = "queued" if row["attempts"] < max_attempts else "failed"
+                db.execute("UPDATE jobs SET state = ?, pid = NULL, child = NULL, error = ?, finished = ? WHERE id = ?",
+                           (state, f"exit code {proc.exitcode}", time.time(), job_id))
+                print(f"[ERROR] Job {job_id} exited with {proc.exitcode} -> {state}")
+
+        queued = db.execute("SELECT * FROM jobs WHERE state = 'queued' ORDER BY id").fetchall()
+        if not queued and not running:
+            break
+
+        # first-fit in queue order: a big 8K job does not block smaller ones behind it
+        for row in queued:
+            if row["backend"] not in BACKENDS:
+                db.execute("UPDATE jobs SET state = 'failed', error = 'unknown backend' WHERE id = ?", (row["id"],))
+                continue
+            cost = pool.cost(row)
+            if not pool.fits(cost):
+                continue
+            # claim first: another runner on the same database may have taken the job since the SELECT
+            cur = db.execute("UPDATE jobs SET state = 'running', runner = ?, attempts = attempts + 1, started = ? "
+                             "WHERE id = ? AND state = 'queued'", (runner, time.time(), row["id"]))
+            if cur.rowcount != 1:
+                continue
+            proc = multiprocessing.Process(target=_run_job, args=(row["backend"], row["input"], row["output"]))
+            proc.start()
+            pool.take(cost)
+            running[row["id"]] = (proc, cost)
+            db.execute("UPDATE jobs SET pid = ?, child = ? WHERE id = ?",
+                       (proc.pid, process_identity(proc.pid), row["id"]))
+            print(f"[INFO] Job {row['id']} started ({row['backend']}): {row['input']}")
+
+        time.sleep(poll)
+
+    print_status(db)
+
+
+def print_status(db):
+    rows = db.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+    print("[INFO] " + ", ".join(f"{r['state']}: {r['n']}" for r in rows))
+    for r in db.execute("SELECT id, backend, input, error FROM jobs WHERE state = 'failed'"):
+        print(f"  failed #{r['id']} [{r['backend']}] {r['input']}: {r['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch runner for the enhancement scripts")
+    parser.add_argument("--db", default=DB_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_add = sub.add_parser("add", help="queue files or directories")
+    p_add.add_argument("paths", nargs="+")
+    p_add.add_argument("--backend", default="cuda_stream", choices=sorted(BACKENDS))
+    p_add.add_argument("--out-dir", default="enhanced")
+
+    p_run = sub.add_parser("run", help="process the queue until it is empty")
+    p_run.add_argument("--cpus", type=int, default=os.cpu_count() or 4)
+    p_run.add_argument("--encoder-sessions", type=int, default=3,
+                       help="concurrent NVENC sessions (consumer GeForce drivers cap this)")
+    p_run.add_argument("--ram-mb", type=int, default=default_ram_mb())
+    p_run.add_argument("--max-attempts", type=int, default=2)
+
+    sub.add_parser("status", help="show job counts and failures")
+    p_retry = sub.add_parser("retry", help="requeue failed jobs")
+    p_retry.add_argument("ids", nargs="*", type=int)
+
+    args = parser.parse_args()
+    db = connect(args.db)
+    if args.cmd == "add":
+        add_jobs(db, args.paths, args.backend, args.out_dir)
+    elif args.cmd == "run":
+        run_queue(db, args.cpus, args.encoder_sessions, args.ram_mb, args.max_attempts)
+    elif args.cmd == "retry":
+        if args.ids:
+            db.executemany("UPDATE jobs SET state = 'queued', attempts = 0 WHERE id = ? AND state = 'failed'",
+                           [(i,) for i in args.ids])
+        else:
+            db.execute("UPDATE jobs SET state = 'queued', attempts = 0 WHERE state = 'failed'")
+        print_status(db)
+    else:
+        print_status(db)
+
+
+if __name__ == "__main__":
+    main()
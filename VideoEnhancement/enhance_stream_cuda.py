@@ -1,26 +1,189 @@
+"""
+enhance_stream_cuda.py
+Streaming enhancement: ffmpeg decode -> cuda_detail_boost -> ffmpeg encode, no frames on disk.
+
+Usage:
+    python enhance_stream_cuda.py <input_video> [output_video] [--cpu] [--tool PATH]
+        [--sharpen 1.0] [--saturation 1.25] [--dither 0.6] [--seed 12345]
+        [--start T] [--end T | --start-frame N --end-frame M] [--splice previous_output.mp4]
+
+The three stages are chained directly (no shell, so it runs the same on
+Linux and Windows) under Cuda/async_pipeline.py, and the source is probed
+once. On Linux the pipes between the stages are enlarged with F_SETPIPE_SZ so
+frames cross them in a few large writes.
+
+cuda_detail_boost reads 8-bit RGBA frames and writes RGBA64. When the tool
+is missing (or with --cpu) the same kernel runs in this process on the CPU
+(enhance_math.enhance_rgba8), which is much slower but needs no GPU.
+
+--start/--end process only a range (input-side seek, exact trim, seeds as in
+a full run); --splice joins that range back into an earlier full output with
+stream copy (see Cuda/time_range.py).
+"""
+
+import argparse
+import functools
+import json
+import os
+import shutil
 import subprocess
 import sys
-import shlex
-
-def enhance_stream(input_video, output_video):
-    # ffmpeg decodes input -> rawvideo pipe -> cuda_detail_boost.exe -> ffmpeg encodes output
-    cmd = f"""
-    ffmpeg -hide_banner -loglevel error -hwaccel cuda -hwaccel_output_format cuda -i "{input_video}" ^
-    -pix_fmt rgb48le -f rawvideo pipe: ^
-    | cuda_detail_boost.exe ^
-    | ffmpeg -y -f rawvideo -pix_fmt rgb48le -s $(ffprobe -v error -select_streams v:0 -show_entries stream=width,height -of csv=s=x:p=0 "{input_video}") -r $(ffprobe -v error -select_streams v:0 -show_entries stream=r_frame_rate -of csv=p=0 "{input_video}") -i pipe: ^
-    -c:v hevc_nvenc -profile:v main444_10 -pix_fmt yuv444p16le -preset p7 -tune hq -cq 18 "{output_video}"
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "Cuda"))
+import enhance_math  # noqa: E402
+from async_pipeline import run_stages  # noqa: E402
+from decoder_select import decoder_args  # noqa: E402
+from frame_cache import pipe_frames  # noqa: E402
+from pipe_buffers import set_pipe_size  # noqa: E402
+from segment_checkpoint import seek_args  # noqa: E402
+from time_range import add_range_args, output_args, run_range  # noqa: E402
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+TOOL_NAME = "cuda_detail_boost"
+DEFAULTS = dict(enhance_math.RGBA8_DEFAULTS, seed=12345)
+
+
+@functools.lru_cache(maxsize=None)
+def probe_video(path):
+    """(width, height, frame rate string, fps) of the first video stream, probed once per file."""
+    cmd = [
+        FFPROBE, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,r_frame_rate", "-of", "json", path
+    ]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        raise RuntimeError("ffprobe failed: " + p.stderr)
+    stream = json.loads(p.stdout)["streams"][0]
+    rate = stream.get("r_frame_rate", "30/1")
+    if rate in ("0/0", "0/1"):
+        rate = "30/1"
+    num, _, den = rate.partition("/")
+    return int(stream["width"]), int(stream["height"]), rate, float(num) / float(den or 1)
+
+
+def find_tool(path=None):
+    """The compiled cuda_detail_boost next to this script or on PATH, else None."""
+    if path:
+        return path if os.path.isfile(path) else None
+    names = [TOOL_NAME + ".exe", TOOL_NAME] if os.name == "nt" else [TOOL_NAME]
+    for name in names:
+        local = os.path.join(HERE, name)
+        if os.path.isfile(local) and os.access(local, os.X_OK):
+            return local
+    return shutil.which(TOOL_NAME)
+
+
+def build_decode_cmd(input_path, start_frame=0, end_frame=None, fps=30.0):
+    # frames go to system memory anyway, so no -hwaccel_output_format cuda here
+    return [
+        FFMPEG, "-hide_banner", "-loglevel", "error", *decoder_args(input_path),
+        *seek_args(start_frame, fps), "-i", input_path,
+        "-map", "0:v:0", *output_args(start_frame, end_frame), "-f", "rawvideo", "-pix_fmt", "rgba", "-"
+    ]
+
+
+def build_tool_cmd(tool, w, h, params):
+    return [tool, str(w), str(h), str(params["sharpen"]), str(params["saturation"]),
+            str(params["dither"]), str(params["seed"])]
+
+
+def build_encode_cmd(w, h, rate, output_path):
+    return [
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgba64le", "-s", f"{w}x{h}", "-r", rate, "-i", "-",
+        "-c:v", "hevc_nvenc", "-profile:v", "main444_10", "-pix_fmt", "yuv444p16le",
+        "-preset", "p7", "-tune", "hq", "-cq", "18", output_path
+    ]
+
+
+def run_gpu(output_path, tool, w, h, rate, params, decode_cmd):
+    """decode -> tool -> encode as three chained processes; returns the three exit codes.
+
+    async_pipeline supervises the chain (enlarged pipes, a failing stage stops the others).
     """
+    return tuple(run_stages([decode_cmd, build_tool_cmd(tool, w, h, params),
+                             build_encode_cmd(w, h, rate, output_path)]))
+
+
+def run_cpu(output_path, w, h, rate, params, decode_cmd):
+    """decode -> enhance_rgba8 in this process -> encode; returns the decode and encode exit codes."""
+    p_encode = subprocess.Popen(build_encode_cmd(w, h, rate, output_path), stdin=subprocess.PIPE, bufsize=0)
+    set_pipe_size(p_encode.stdin, w * h * 8)
+    out = np.empty((h, w, 4), dtype=np.uint16)
+    rc_decode = 0
+    try:
+        for i, frame in enumerate(pipe_frames(decode_cmd, (h, w, 4), np.uint8)):
+            enhance_math.enhance_rgba8(frame, params["sharpen"], params["saturation"], params["dither"],
+                                       params["seed"] + i, params["contrast"], out=out)
+            p_encode.stdin.write(out.data)
+    except RuntimeError as exc:
+        print("[ERROR]", exc)
+        rc_decode = 1
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            p_encode.stdin.close()
+        except BrokenPipeError:
+            pass
+    return rc_decode, p_encode.wait()
+
+
+def enhance_stream(input_video, output_video, cpu=False, tool=None, start_frame=0, end_frame=None, **params):
+    """Enhance frames [start_frame, end_frame) (default: all) of `input_video`; True on success."""
+    params = dict(DEFAULTS, **params)
+    w, h, rate, fps = probe_video(input_video)
+    decode_cmd = build_decode_cmd(input_video, start_frame, end_frame, fps)
+    # the tool bumps its seed once per frame; start where a full run would be
+    params["seed"] += start_frame
+    tool_path = None if cpu else find_tool(tool)
+    if tool_path:
+        print(f"[INFO] Running streaming enhancement ({w}x{h} @ {rate}) with {tool_path}...")
+        rcs = run_gpu(output_video, tool_path, w, h, rate, params, decode_cmd)
+        names = ("decode", "cuda", "encode")
+    else:
+        if not cpu:
+            print(f"[WARN] {TOOL_NAME} not found; using the CPU kernel")
+        print(f"[INFO] Running streaming enhancement ({w}x{h} @ {rate}) on the CPU...")
+        rcs = run_cpu(output_video, w, h, rate, params, decode_cmd)
+        names = ("decode", "encode")
+    if any(rcs):
+        print("[ERROR] Pipeline failed: " + ", ".join(f"rc_{n} {rc}" for n, rc in zip(names, rcs)))
+        return False
+    return True
 
-    print("[INFO] Running streaming enhancement...")
-    subprocess.run(cmd, shell=True)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python enhance_stream_cuda.py <input_video>")
+        print("Usage: python enhance_stream_cuda.py <input_video> [output_video] [--cpu]")
         sys.exit(1)
 
-    input_file = sys.argv[1]
-    output_file = "enhanced_output.mp4"
-    enhance_stream(input_file, output_file)
-    print(f"\n✅ Done! Enhanced video saved as {output_file}")
+    parser = argparse.ArgumentParser(description="Streaming CUDA detail boost")
+    parser.add_argument("input")
+    parser.add_argument("output", nargs="?", default="enhanced_output.mp4")
+    parser.add_argument("--cpu", action="store_true", help="run the kernel on the CPU instead of the CUDA tool")
+    parser.add_argument("--tool", default=None, help="path to the compiled cuda_detail_boost")
+    for name, value in DEFAULTS.items():
+        if name != "contrast":      # fixed in the CUDA tool
+            parser.add_argument("--" + name, type=type(value), default=value)
+    add_range_args(parser)
+    args = parser.parse_args()
+    params = dict(cpu=args.cpu, tool=args.tool, sharpen=args.sharpen, saturation=args.saturation,
+                  dither=args.dither, seed=args.seed)
+
+    def render(path, start, end):
+        return enhance_stream(args.input, path, start_frame=start, end_frame=end, **params)
+
+    try:
+        ok = run_range(args, args.output, probe_video(args.input)[3], render, audio_from=args.input)
+    except ValueError as e:
+        parser.error(str(e))
+    if ok is None:
+        ok = enhance_stream(args.input, args.output, **params)
+    if not ok:
+        sys.exit(1)
+    print(f"\n✅ Done! Enhanced video saved as {args.output}")
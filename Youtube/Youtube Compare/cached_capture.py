@@ -0,0 +1,128 @@
+"""
+cached_capture.py
+ffmpeg frame iterators for the compare scripts that can be served from the
+shared decoded-frame cache (Cuda/frame_cache.py).
+
+Set FRAME_CACHE_DIR (and optionally FRAME_CACHE_BUDGET_GB) to enable it; the
+first comparison of a file then stores its decoded frames and every later
+run over the same file reads them back zero-copy instead of decoding again.
+
+luma_frames() is the cheaper decode for the metrics: ffmpeg hands over only
+the Y plane (gray / gray16le), already scaled to the reference size, through
+a raw pipe into one reused buffer. No BGR conversion, no cvtColor, no
+per-frame cv2.resize. Note the values are the video's own luma (limited
+range), not cv2's BGR->gray, so the numbers differ slightly from the BGR path.
+
+ffmpeg_frames() is the same decode for any raw format (bgr24 for the BGR
+comparison); its `start` seek is frame-accurate, unlike cv2's
+CAP_PROP_POS_FRAMES on inter-coded streams. cv2 is only used to read the
+video's size, frame count and rate.
+"""
+
+import os
+import sys
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Cuda"))
+from decoder_select import decoder_args  # noqa: E402
+from frame_cache import FrameCache, frame_shape, pipe_frames  # noqa: E402
+from segment_checkpoint import seek_args  # noqa: E402
+
+FFMPEG = "ffmpeg"
+
+
+def video_size(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file: {video_path}")
+    size = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    return size
+
+
+def video_frame_count(video_path):
+    """Frame count from the container (an estimate for some formats; 0 if unknown)."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file: {video_path}")
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return max(count, 0)
+
+
+def video_fps(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps > 0 else 30.0
+
+
+def ffmpeg_frames(video_path, width, height, start=0, count=None, pix_fmt="gray"):
+    """Yield frames [start, start + count) decoded by ffmpeg to `pix_fmt` at width x height.
+
+    ffmpeg seeks to the keyframe before `start` and decodes forward, dropping
+    frames up to it, so the first frame is exactly frame `start`. The yielded
+    array is reused for the next frame (or is a read-only cache view), so
+    copy it to keep it.
+    """
+    shape, dtype = frame_shape(pix_fmt, width, height)
+
+    def decode():
+        cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin", *decoder_args(video_path),
+               "-accurate_seek", *seek_args(start, video_fps(video_path)), "-i", video_path, "-map", "0:v:0"]
+        if count is not None:
+            cmd += ["-frames:v", str(count)]
+        cmd += ["-vf", f"scale={width}:{height}:flags=bicubic", "-vsync", "0",
+                "-f", "rawvideo", "-pix_fmt", pix_fmt, "-"]
+        return pipe_frames(cmd, shape, dtype)
+
+    cache = FrameCache.from_env()
+    if cache is None:
+        return decode()
+    cached = cache.lookup(video_path, pix_fmt, width, height)
+    if cached is not None:
+        return iter(cached[start:None if count is None else start + count])
+    if start or count is not None:
+        return decode()     # only whole-file decodes populate the cache
+    return cache.iter_frames(video_path, pix_fmt, width, height, decode)
+
+
+def luma_frames(video_path, width, height, start=0, count=None, pix_fmt="gray"):
+    """Yield the luma plane of frames [start, start + count) scaled to width x height.
+
+    pix_fmt "gray16le" keeps more than 8 bits.
+    """
+    return ffmpeg_frames(video_path, width, height, start, count, pix_fmt)
+
+
+class FramePairs:
+    """Lockstep iterator over two frame streams: yields (frame_a, frame_b) one pair at a time.
+
+    Only the current pair is held, so memory stays at two frames whatever the
+    length. When the shorter stream ends the longer one is drained to count its
+    remaining frames; `count_a` / `count_b` are final once iteration stops.
+    """
+
+    def __init__(self, frames_a, frames_b):
+        self.frames_a = iter(frames_a)
+        self.frames_b = iter(frames_b)
+        self.count_a = 0
+        self.count_b = 0
+
+    def __iter__(self):
+        for frame_a in self.frames_a:
+            self.count_a += 1
+            frame_b = next(self.frames_b, None)
+            if frame_b is None:
+                break
+            self.count_b += 1
+            yield frame_a, frame_b
+        self.count_a += sum(1 for _ in self.frames_a)
+        self.count_b += sum(1 for _ in self.frames_b)
+
+    @property
+    def matched(self):
+        return self.count_a == self.count_b
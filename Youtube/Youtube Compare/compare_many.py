@@ -0,0 +1,128 @@
+"""
+compare_many.py
+Compare one original against several renditions with a single decode of the original.
+
+Usage:
+    python compare_many.py original.mp4 av1_2160p.mp4 vp9_1440p.webm h264_1080p.mp4 [--csv matrix.csv]
+        [--threads N]
+
+Comparing each YouTube rendition separately decodes the 4K master once per
+rendition. Here the master is decoded once (luma plane, see
+cached_capture.luma_frames), every rendition has its own ffmpeg decoder
+scaling it to the master's size, and each master frame is fanned out to one
+metric task per rendition on a thread pool. Every rendition has its own
+metrics engine, so the tasks share no buffers; the decoders run ahead in
+their own processes while the metrics are computed.
+
+The result is one row per rendition (codec, size, frames, PSNR, SSIM),
+printed as a table and optionally written as CSV.
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from cached_capture import luma_frames, video_size
+from metrics_engine import MetricsEngine
+
+FFPROBE = "ffprobe"
+
+
+def describe(path):
+    """codec and size of the first video stream, e.g. ("av1", "3840x2160")."""
+    cmd = [FFPROBE, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=codec_name,width,height", "-of", "json", path]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        return "?", "?"
+    s = json.loads(p.stdout)["streams"][0]
+    return s.get("codec_name", "?"), f"{s.get('width')}x{s.get('height')}"
+
+
+class Rendition:
+    """Decoder, metrics engine and running totals for one rendition."""
+
+    def __init__(self, path, width, height):
+        self.path = path
+        self.frames = iter(luma_frames(path, width, height))
+        self.engine = MetricsEngine(height, width)
+        self.count = 0
+        self.total_psnr = 0.0
+        self.total_ssim = 0.0
+        self.ended = False
+        self.longer = False
+
+    def measure(self, reference):
+        """Compare the next frame with `reference`; runs on a pool thread."""
+        if self.ended:
+            return
+        frame = next(self.frames, None)
+        if frame is None:
+            self.ended = True
+            return
+        self.total_psnr += self.engine.psnr(reference, frame)
+        self.total_ssim += self.engine.ssim(reference, frame)
+        self.count += 1
+
+    def finish(self):
+        if not self.ended:
+            self.longer = next(self.frames, None) is not None
+        close = getattr(self.frames, "close", None)
+        if close is not None:
+            close()         # stops a decoder that is still running
+
+    def row(self, reference_frames):
+        codec, size = describe(self.path)
+        n = max(self.count, 1)
+        note = "" if self.count == reference_frames and not self.longer else \
+            ("longer than original" if self.longer else f"{reference_frames - self.count} frames short")
+        return dict(rendition=os.path.basename(self.path), codec=codec, size=size, frames=self.count,
+                    psnr=self.total_psnr / n, ssim=self.total_ssim / n, note=note)
+
+
+def compare_many(original_path, rendition_paths, threads=None):
+    """One row per rendition: dict(rendition, codec, size, frames, psnr, ssim, note)."""
+    width, height = video_size(original_path)
+    renditions = [Rendition(path, width, height) for path in rendition_paths]
+    reference_frames = 0
+    with ThreadPoolExecutor(max_workers=threads or min(len(renditions), os.cpu_count() or 1)) as pool:
+        for reference in luma_frames(original_path, width, height):
+            # the reference buffer is reused by the decoder: every task must finish before the next frame
+            for future in [pool.submit(r.measure, reference) for r in renditions]:
+                future.result()
+            reference_frames += 1
+    for r in renditions:
+        r.finish()
+    return [r.row(reference_frames) for r in renditions]
+
+
+def print_matrix(rows):
+    print(f"\n{'rendition':<32}{'codec':<8}{'size':>11}{'frames':>8}{'PSNR':>9}{'SSIM':>9}  note")
+    for row in rows:
+        print(f"{row['rendition'][:31]:<32}{row['codec']:<8}{row['size']:>11}{row['frames']:>8}"
+              f"{row['psnr']:>9.2f}{row['ssim']:>9.4f}  {row['note']}")
+
+
+def write_matrix(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare one original against several renditions (one decode)")
+    parser.add_argument("original")
+    parser.add_argument("renditions", nargs="+")
+    parser.add_argument("--csv", default=None, help="also write the comparison matrix as CSV")
+    parser.add_argument("--threads", type=int, default=None, help="metric threads (default: one per rendition)")
+    args = parser.parse_args()
+
+    rows = compare_many(args.original, args.renditions, args.threads)
+    print_matrix(rows)
+    if args.csv:
+        write_matrix(args.csv, rows)
+        print(f"[SUCCESS] Matrix written to {args.csv}")
@@ -1,75 +1,73 @@
+import argparse
 import cv2
-import numpy as np
-from skimage.metrics import structural_similarity as ssim
 from tqdm import tqdm
-import os
+
+from cached_capture import video_frame_count
+import metrics_engine
+from parallel_compare import compare_frames
 
 def calculate_psnr(original, compressed):
-    """Calculate PSNR between two images."""
-    mse = np.mean((original - compressed) ** 2)
-    if mse == 0:
-        return 100  # PSNR is infinite if no difference
-    max_pixel = 255.0
-    psnr = 20 * np.log10(max_pixel / np.sqrt(mse))
-    return psnr
+    """Calculate PSNR between two images (exact, no uint8 wraparound)."""
+    return metrics_engine.psnr(original, compressed)
 
 def calculate_ssim(original, compressed):
     """Calculate SSIM between two images."""
-    return ssim(original, compressed, data_range=compressed.max() - compressed.min())
-
-def extract_frames(video_path):
-    """Extract frames from the video."""
-    video_capture = cv2.VideoCapture(video_path)
-    frames = []
-    while True:
-        ret, frame = video_capture.read()
-        if not ret:
-            break
-        frames.append(frame)
-    video_capture.release()
-    return frames
+    return metrics_engine.ssim(original, compressed, data_range=compressed.max() - compressed.min())
 
-def compare_videos(original_video_path, uploaded_video_path):
-    """Compare videos using PSNR and SSIM."""
-    # Extract frames from both videos
-    print("Extracting frames from the original video...")
-    original_frames = extract_frames(original_video_path)
-    print("Extracting frames from the uploaded video...")
-    uploaded_frames = extract_frames(uploaded_video_path)
-    
-    # Make sure both videos have the same number of frames
-    if len(original_frames) != len(uploaded_frames):
-        raise ValueError("Videos have different number of frames!")
-    
-    total_psnr = 0
-    total_ssim = 0
-    frame_count = len(original_frames)
-    
-    # Initialize the progress bar
-    for orig_frame, upload_frame in tqdm(zip(original_frames, uploaded_frames), total=frame_count, desc="Comparing frames", unit="frame"):
-        # Convert frames to grayscale
+def frame_metrics(orig_frame, upload_frame):
+    """PSNR and SSIM of one frame pair (on grayscale)."""
+    if orig_frame.ndim == 2:
+        # luma planes (--luma) are gray already
+        orig_gray, upload_gray = orig_frame, upload_frame
+    else:
         orig_gray = cv2.cvtColor(orig_frame, cv2.COLOR_BGR2GRAY)
         upload_gray = cv2.cvtColor(upload_frame, cv2.COLOR_BGR2GRAY)
-        
-        # Calculate PSNR and SSIM for the current frame
-        psnr_value = calculate_psnr(orig_gray, upload_gray)
-        ssim_value = calculate_ssim(orig_gray, upload_gray)
+    return calculate_psnr(orig_gray, upload_gray), calculate_ssim(orig_gray, upload_gray)
+
+def compare_videos(original_video_path, uploaded_video_path, workers=1, luma=False):
+    """Compare videos using PSNR and SSIM.
 
-        total_psnr += psnr_value
-        total_ssim += ssim_value
+    Both videos are decoded in lockstep and each frame pair is dropped once
+    measured, so memory use does not grow with the length of the videos.
+    workers > 1 splits the timeline into chunks measured in parallel (see
+    parallel_compare.py, which decodes with frame-accurate ffmpeg seeks and
+    warns if a chunk boundary does not line up).
+    luma=True lets ffmpeg decode straight to the luma plane (cached_capture.luma_frames).
+    """
+    estimate = min(video_frame_count(original_video_path), video_frame_count(uploaded_video_path))
+
+    # Initialize the progress bar
+    with tqdm(total=estimate or None, desc="Comparing frames", unit="frame") as progress:
+        # Frames are decoded on demand (zero-copy views when the frame cache has them)
+        results, original_count, uploaded_count = compare_frames(
+            original_video_path, uploaded_video_path, frame_metrics, workers, progress=progress, luma=luma)
 
     # Calculate average PSNR and SSIM
-    average_psnr = total_psnr / frame_count if frame_count > 0 else 0
-    average_ssim = total_ssim / frame_count if frame_count > 0 else 0
+    frame_count = len(results)
+    average_psnr = sum(r[0] for r in results) / frame_count if frame_count > 0 else 0
+    average_ssim = sum(r[1] for r in results) / frame_count if frame_count > 0 else 0
 
     print(f"\nAverage PSNR: {average_psnr:.2f} dB")
     print(f"Average SSIM: {average_ssim:.4f}")
 
+    # Make sure both videos have the same number of frames
+    if original_count != uploaded_count:
+        raise ValueError(f"Videos have different number of frames! "
+                         f"({original_count} vs {uploaded_count}; averages cover the first {frame_count})")
+
 if __name__ == "__main__":
-    original_video_path = input("Enter the path to the original video: ")
-    uploaded_video_path = input("Enter the path to the uploaded video: ")
+    parser = argparse.ArgumentParser(description="Compare two videos using PSNR and SSIM")
+    parser.add_argument("original", nargs="?", help="original video (prompted for if omitted)")
+    parser.add_argument("uploaded", nargs="?", help="uploaded video (prompted for if omitted)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes comparing chunks of the timeline in parallel (0 = one per core)")
+    parser.add_argument("--luma", action="store_true",
+                        help="decode only the luma plane with ffmpeg (faster; video-range luma, not BGR->gray)")
+    args = parser.parse_args()
+    original_video_path = args.original or input("Enter the path to the original video: ")
+    uploaded_video_path = args.uploaded or input("Enter the path to the uploaded video: ")
 
     try:
-        compare_videos(original_video_path, uploaded_video_path)
+        compare_videos(original_video_path, uploaded_video_path, args.workers, args.luma)
     except Exception as e:
         print(f"Error: {e}")
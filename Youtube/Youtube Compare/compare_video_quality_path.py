@@ -1,69 +1,67 @@
+import argparse
 import cv2
-import numpy as np
-from skimage.metrics import structural_similarity as ssim
+
+import metrics_engine
+from parallel_compare import compare_frames
 
 def calculate_psnr(original, compressed):
-    """Calculate PSNR between two images."""
-    mse = np.mean((original - compressed) ** 2)
-    if mse == 0:
-        return 100  # PSNR is infinite if no difference
-    max_pixel = 255.0
-    psnr = 20 * np.log10(max_pixel / np.sqrt(mse))
-    return psnr
+    """Calculate PSNR between two images (exact, no uint8 wraparound)."""
+    return metrics_engine.psnr(original, compressed)
 
 def calculate_ssim(original, compressed):
     """Calculate SSIM between two images."""
-    return ssim(original, compressed, data_range=compressed.max() - compressed.min())
-
-def compare_videos(original_video_path, uploaded_video_path):
-    """Compare two videos using PSNR and SSIM."""
-    original_video = cv2.VideoCapture(original_video_path)
-    uploaded_video = cv2.VideoCapture(uploaded_video_path)
-
-    # Check if the videos opened successfully
-    if not original_video.isOpened() or not uploaded_video.isOpened():
-        print("Error: Could not open video files.")
-        return
-
-    frame_count = 0
-    total_psnr = 0
-    total_ssim = 0
-    while True:
-        ret_original, original_frame = original_video.read()
-        ret_uploaded, uploaded_frame = uploaded_video.read()
-
-        if not ret_original or not ret_uploaded:
-            break
+    return metrics_engine.ssim(original, compressed, data_range=compressed.max() - compressed.min())
 
+def frame_metrics(original_frame, uploaded_frame):
+    """PSNR and SSIM of one frame pair, the uploaded frame scaled to the original's size."""
+    if original_frame.ndim == 2:
+        # luma planes (--luma): ffmpeg already scaled the upload to the original's size
+        original_gray, uploaded_gray = original_frame, uploaded_frame
+    else:
         # Resize the frames to the same size (if needed)
-        uploaded_frame_resized = cv2.resize(uploaded_frame, (original_frame.shape[1], original_frame.shape[0]))
+        if uploaded_frame.shape != original_frame.shape:
+            uploaded_frame = cv2.resize(uploaded_frame, (original_frame.shape[1], original_frame.shape[0]))
 
         # Convert frames to grayscale for SSIM (optional, but faster)
         original_gray = cv2.cvtColor(original_frame, cv2.COLOR_BGR2GRAY)
-        uploaded_gray = cv2.cvtColor(uploaded_frame_resized, cv2.COLOR_BGR2GRAY)
+        uploaded_gray = cv2.cvtColor(uploaded_frame, cv2.COLOR_BGR2GRAY)
+
+    # Calculate PSNR and SSIM
+    return calculate_psnr(original_gray, uploaded_gray), calculate_ssim(original_gray, uploaded_gray)
 
-        # Calculate PSNR and SSIM
-        psnr_value = calculate_psnr(original_gray, uploaded_gray)
-        ssim_value = calculate_ssim(original_gray, uploaded_gray)
+def compare_videos(original_video_path, uploaded_video_path, workers=1, luma=False):
+    """Compare two videos using PSNR and SSIM (workers > 1: chunks in parallel, see parallel_compare.py).
 
-        total_psnr += psnr_value
-        total_ssim += ssim_value
-        frame_count += 1
+    luma=True decodes only the luma plane, scaled to the original's size, with ffmpeg.
+    """
+    try:
+        results, _, _ = compare_frames(original_video_path, uploaded_video_path, frame_metrics, workers,
+                                      luma=luma)
+    except IOError:
+        print("Error: Could not open video files.")
+        return
 
     # Average PSNR and SSIM
-    average_psnr = total_psnr / frame_count if frame_count > 0 else 0
-    average_ssim = total_ssim / frame_count if frame_count > 0 else 0
+    frame_count = len(results)
+    average_psnr = sum(r[0] for r in results) / frame_count if frame_count > 0 else 0
+    average_ssim = sum(r[1] for r in results) / frame_count if frame_count > 0 else 0
 
     print(f"Average PSNR: {average_psnr:.2f} dB")
     print(f"Average SSIM: {average_ssim:.4f}")
 
-    original_video.release()
-    uploaded_video.release()
-
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two videos using PSNR and SSIM")
+    parser.add_argument("original", nargs="?", help="original video (prompted for if omitted)")
+    parser.add_argument("uploaded", nargs="?", help="uploaded video (prompted for if omitted)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes comparing chunks of the timeline in parallel (0 = one per core)")
+    parser.add_argument("--luma", action="store_true",
+                        help="decode only the luma plane with ffmpeg, scaled to the original's size (faster)")
+    args = parser.parse_args()
+
     # Paths to the original and uploaded videos
-    original_video_path = input("Enter the path to the original video: ")
-    uploaded_video_path = input("Enter the path to the uploaded video: ")
+    original_video_path = args.original or input("Enter the path to the original video: ")
+    uploaded_video_path = args.uploaded or input("Enter the path to the uploaded video: ")
 
     # Compare videos
-    compare_videos(original_video_path, uploaded_video_path)
+    compare_videos(original_video_path, uploaded_video_path, args.workers, args.luma)
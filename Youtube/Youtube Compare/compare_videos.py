@@ -1,7 +1,15 @@
+import argparse
+import os
 import ffmpeg
 import cv2
-import numpy as np
-from skimage.metrics import structural_similarity as ssim
+
+import ffmpeg_metrics
+import metric_series
+import metrics_engine
+from parallel_compare import compare_frames
+from plane_metrics import compare_planes
+from sampled_compare import compare_sampled
+from temporal_align import align_videos
 
 def get_video_info(video_path):
     """Extracts basic video info (resolution, frame rate, bitrate) using ffmpeg."""
@@ -23,15 +31,63 @@ def get_video_info(video_path):
     }
 
 def calculate_psnr(original, compressed):
-    """Calculate PSNR (Peak Signal to Noise Ratio) between two frames."""
-    mse = np.mean((original - compressed) ** 2)
-    if mse == 0:
-        return 100
-    PIXEL_MAX = 255.0
-    return 20 * np.log10(PIXEL_MAX / np.sqrt(mse))
+    """Calculate PSNR (Peak Signal to Noise Ratio) between two frames (exact, no uint8 wraparound)."""
+    return metrics_engine.psnr(original, compressed)
+
+def frame_metrics(frame_original, frame_uploaded):
+    """PSNR and SSIM of one frame pair (on grayscale)."""
+    if frame_original.ndim == 2:
+        # luma planes (--luma) are gray already
+        gray_original, gray_uploaded = frame_original, frame_uploaded
+    else:
+        # Convert frames to grayscale for SSIM calculation
+        gray_original = cv2.cvtColor(frame_original, cv2.COLOR_BGR2GRAY)
+        gray_uploaded = cv2.cvtColor(frame_uploaded, cv2.COLOR_BGR2GRAY)
+    
+    # Calculate PSNR and SSIM for the current frame
+    psnr_value = calculate_psnr(gray_original, gray_uploaded)
+    ssim_value = metrics_engine.ssim(gray_original, gray_uploaded)
+    return psnr_value, ssim_value
+
+def write_series_files(series_path, fps, per_frame, worst, worst_window):
+    """Per-frame series plus the ranked worst-window index next to it."""
+    metric_series.write_series(series_path, fps, **per_frame)
+    windows = metric_series.worst_windows(per_frame['ssim'], fps, worst_window, worst, per_frame.get('frames'),
+                                          psnr=per_frame['psnr'], vmaf=per_frame.get('vmaf'))
+    index_path = os.path.splitext(series_path)[0] + ".worst.csv"
+    metric_series.write_worst_index(index_path, windows)
+    print(f"Per-frame metrics written to {series_path}, worst windows to {index_path}")
+    for w in windows[:3]:
+        print(f"  #{w['rank']}: {w['start_time']:.2f}-{w['end_time']:.2f}s  "
+              f"SSIM {w['mean']:.4f}  PSNR {w['mean_psnr']:.2f} dB")
+
+def compare_videos(original_video, uploaded_video, workers=1, backend="python", vmaf=False, sampling=None,
+                   series_path=None, worst=10, worst_window=2.0, align=False, luma=False, planes=False):
+    """Compare two videos by analyzing PSNR, SSIM, and basic properties.
+
+    backend="ffmpeg" measures with ffmpeg's psnr/ssim (and libvmaf with
+    vmaf=True) filters in one process instead (see ffmpeg_metrics.py); the
+    result then also has 'avg_vmaf'.
+
+    sampling=dict(every=N or samples=K, tolerance_psnr=..., tolerance_ssim=...)
+    measures sampled frames only and adds 'psnr_ci', 'ssim_ci' and
+    'sampled_frames' (see sampled_compare.py).
+
+    series_path writes the per-frame metrics (.csv/.npz/.parquet) and next to
+    it <name>.worst.csv, the `worst` lowest-SSIM windows of `worst_window`
+    seconds (see metric_series.py).
+
+    align=True first matches the uploaded frames to the original by content
+    (dropped/repeated frames, frame rate changes, start shifts; see
+    temporal_align.py) and measures only the matched pairs.
+
+    luma=True decodes only the luma plane with ffmpeg, the upload scaled to
+    the original's size (cached_capture.luma_frames), for the full comparison.
 
-def compare_videos(original_video, uploaded_video):
-    """Compare two videos by analyzing PSNR, SSIM, and basic properties."""
+    planes=True measures Y, U and V separately at the original's bit depth and
+    chroma layout (see plane_metrics.py); avg_psnr/avg_ssim are then the Y
+    plane's and the result has 'planes'.
+    """
     
     # Get basic video info
     original_info = get_video_info(original_video)
@@ -47,57 +103,124 @@ def compare_videos(original_video, uploaded_video):
     if original_info['frame_rate'] != uploaded_info['frame_rate']:
         print("Warning: Frame rates don't match between the two videos.")
     
-    # Compare video quality frame by frame (using PSNR and SSIM)
-    cap_original = cv2.VideoCapture(original_video)
-    cap_uploaded = cv2.VideoCapture(uploaded_video)
-    
-    frame_count = 0
-    total_psnr = 0
-    total_ssim = 0
-    frame_comparisons = 0
-    
-    while True:
-        ret_original, frame_original = cap_original.read()
-        ret_uploaded, frame_uploaded = cap_uploaded.read()
-        
-        if not ret_original or not ret_uploaded:
-            break
-        
-        # Convert frames to grayscale for SSIM calculation
-        gray_original = cv2.cvtColor(frame_original, cv2.COLOR_BGR2GRAY)
-        gray_uploaded = cv2.cvtColor(frame_uploaded, cv2.COLOR_BGR2GRAY)
-        
-        # Calculate PSNR for the current frame
-        psnr_value = calculate_psnr(gray_original, gray_uploaded)
-        total_psnr += psnr_value
+    avg_vmaf = None
+    sampled = None
+    per_frame = None
+    plane_result = None
+    if sampling:
+        sampled = compare_sampled(original_video, uploaded_video, frame_metrics, **sampling)
+        avg_psnr, avg_ssim = sampled['avg_psnr'], sampled['avg_ssim']
+    elif planes:
+        mapping = align_videos(original_video, uploaded_video) if align else None
+        plane_result = compare_planes(original_video, uploaded_video, mapping)
+        avg_psnr, avg_ssim = plane_result['y']['psnr'], plane_result['y']['ssim']
+    elif backend == "ffmpeg":
+        records = ffmpeg_metrics.run_metrics(original_video, uploaded_video,
+                                             original_info['width'], original_info['height'], vmaf=vmaf)
+        avg_psnr, avg_ssim, avg_vmaf = ffmpeg_metrics.averages(records)
+        per_frame = dict(psnr=[ffmpeg_metrics.y_or_average(r['psnr']) for r in records],
+                         ssim=[ffmpeg_metrics.y_or_average(r['ssim']) for r in records],
+                         vmaf=[r['vmaf'] for r in records] if avg_vmaf is not None else None)
+    else:
+        # Compare video quality frame by frame (using PSNR and SSIM)
+        # (served from the shared frame cache when FRAME_CACHE_DIR is set; workers > 1
+        # measures chunks of the timeline in parallel, decoded by ffmpeg with frame-accurate seeks)
+        mapping = align_videos(original_video, uploaded_video) if align else None
+        frame_results, _, _ = compare_frames(original_video, uploaded_video, frame_metrics, workers,
+                                             mapping=mapping, luma=luma)
         
-        # Calculate SSIM for the current frame
-        ssim_value, _ = ssim(gray_original, gray_uploaded, full=True)
-        total_ssim += ssim_value
+        frame_comparisons = len(frame_results)
+        total_psnr = sum(r[0] for r in frame_results)
+        total_ssim = sum(r[1] for r in frame_results)
+        per_frame = dict(psnr=[r[0] for r in frame_results], ssim=[r[1] for r in frame_results])
+        if mapping is not None:
+            per_frame['frames'] = [j for j, _ in mapping[:len(frame_results)]]
         
-        frame_comparisons += 1
-        frame_count += 1
-    
-    cap_original.release()
-    cap_uploaded.release()
-    
-    # Compute average PSNR and SSIM over all frames
-    avg_psnr = total_psnr / frame_comparisons if frame_comparisons > 0 else 0
-    avg_ssim = total_ssim / frame_comparisons if frame_comparisons > 0 else 0
+        # Compute average PSNR and SSIM over all frames
+        avg_psnr = total_psnr / frame_comparisons if frame_comparisons > 0 else 0
+        avg_ssim = total_ssim / frame_comparisons if frame_comparisons > 0 else 0
     
     print(f"\nAverage PSNR: {avg_psnr:.2f} dB")
     print(f"Average SSIM: {avg_ssim:.4f}")
+    if avg_vmaf is not None:
+        print(f"Average VMAF: {avg_vmaf:.2f}")
+    if plane_result is not None:
+        print(f"Per plane ({plane_result['pix_fmt']}, {plane_result['bits']}-bit, {plane_result['frames']} frames):")
+        for plane in ("y", "u", "v"):
+            print(f"  {plane.upper()}: PSNR {plane_result[plane]['psnr']:.2f} dB  SSIM {plane_result[plane]['ssim']:.4f}")
+        print(f"  YUV (6:1:1) PSNR {plane_result['psnr_yuv']:.2f} dB")
+    if sampled is not None:
+        print(f"(95% interval: PSNR +/- {sampled['psnr_ci']:.3f} dB, SSIM +/- {sampled['ssim_ci']:.5f}; "
+              f"{sampled['sampled_frames']} of {sampled['candidate_frames']} sample frames"
+              f"{', stopped early' if sampled['stopped_early'] else ''})")
     
-    return {
+    result = {
         'avg_psnr': avg_psnr,
         'avg_ssim': avg_ssim,
         'original_info': original_info,
         'uploaded_info': uploaded_info
     }
+    if avg_vmaf is not None:
+        result['avg_vmaf'] = avg_vmaf
+    if plane_result is not None:
+        result['planes'] = plane_result
+    if series_path:
+        if per_frame is None:
+            print("Warning: no per-frame series in sampling mode; nothing written to", series_path)
+        else:
+            write_series_files(series_path, original_info['frame_rate'], per_frame, worst, worst_window)
+    if sampled is not None:
+        result.update(psnr_ci=sampled['psnr_ci'], ssim_ci=sampled['ssim_ci'],
+                      sampled_frames=sampled['sampled_frames'])
+    return result
+
+if __name__ == "__main__":
+    # Paths to your video files
+    original_video_path = 'path_to_original_video.mp4'
+    uploaded_video_path = 'path_to_uploaded_video.mp4'
 
-# Paths to your video files
-original_video_path = 'path_to_original_video.mp4'
-uploaded_video_path = 'path_to_uploaded_video.mp4'
+    parser = argparse.ArgumentParser(description="Compare two videos by PSNR, SSIM and basic properties")
+    parser.add_argument("original", nargs="?", default=original_video_path)
+    parser.add_argument("uploaded", nargs="?", default=uploaded_video_path)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes comparing chunks of the timeline in parallel (0 = one per core)")
+    parser.add_argument("--backend", choices=("python", "ffmpeg"), default="python",
+                        help="ffmpeg: measure with ffmpeg's psnr/ssim filters in one process")
+    parser.add_argument("--vmaf", action="store_true", help="also compute VMAF (ffmpeg backend, needs libvmaf)")
+    sample = parser.add_mutually_exclusive_group()
+    sample.add_argument("--sample-every", type=int, default=None, metavar="N",
+                        help="quick check: measure every Nth frame only (with a tolerance: seeking, random order)")
+    sample.add_argument("--sample-random", type=int, default=None, metavar="K",
+                        help="quick check: measure K random frames")
+    parser.add_argument("--tolerance-psnr", type=float, default=None, metavar="DB",
+                        help="with sampling: stop once the 95%% PSNR interval is within +/- DB")
+    parser.add_argument("--tolerance-ssim", type=float, default=None,
+                        help="with sampling: stop once the 95%% SSIM interval is within +/- this")
+    parser.add_argument("--series", default=None, metavar="PATH",
+                        help="write per-frame metrics (.csv, .npz or .parquet) and PATH-stem.worst.csv")
+    parser.add_argument("--worst", type=int, default=10, help="windows listed in the worst-window index")
+    parser.add_argument("--worst-window", type=float, default=2.0, metavar="SECONDS",
+                        help="length of the worst-window index entries")
+    parser.add_argument("--align", action="store_true",
+                        help="match frames by content first (dropped/repeated frames, fps change, start shift)")
+    parser.add_argument("--luma", action="store_true",
+                        help="decode only the luma plane with ffmpeg, scaled to the original's size (faster)")
+    parser.add_argument("--planes", action="store_true",
+                        help="PSNR/SSIM per Y/U/V plane at the original's bit depth and chroma layout")
+    args = parser.parse_args()
+    if args.planes and (args.backend != "python" or args.sample_every or args.sample_random or args.series):
+        parser.error("--planes is its own full comparison (no --backend ffmpeg, sampling or --series)")
+    if args.align and (args.backend != "python" or args.sample_every or args.sample_random):
+        parser.error("--align works with the full Python comparison only")
+    if args.vmaf and args.backend != "ffmpeg":
+        parser.error("--vmaf needs --backend ffmpeg")
+    sampling = None
+    if (args.sample_every or args.sample_random) and args.series:
+        parser.error("--series needs a full comparison (no sampling)")
+    if args.sample_every or args.sample_random:
+        sampling = dict(every=args.sample_every, samples=args.sample_random,
+                        tolerance_psnr=args.tolerance_psnr, tolerance_ssim=args.tolerance_ssim)
 
-# Compare the videos
-compare_videos(original_video_path, uploaded_video_path)
+    # Compare the videos
+    compare_videos(args.original, args.uploaded, args.workers, args.backend, args.vmaf, sampling,
+                   args.series, args.worst, args.worst_window, args.align, args.luma, args.planes)
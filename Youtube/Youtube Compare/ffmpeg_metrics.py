@@ -0,0 +1,136 @@
+"""
+ffmpeg_metrics.py
+Metrics backend that lets one ffmpeg compare the two files (psnr, ssim, optionally libvmaf).
+
+Both inputs are decoded by ffmpeg (decoder per source from Cuda/decoder_select.py),
+the uploaded video is scaled to the original's size and the filters write
+per-frame stats files into a temporary directory; nothing passes through
+Python per frame and the filters run on ffmpeg's own threads. The stats are
+parsed into per-frame records and averaged the way compare_videos.py does, so
+its result dictionary looks the same whichever backend produced it.
+
+PSNR/SSIM are taken on the Y plane (the Python path measures grayscale);
+the per-frame records also carry U and V. Sources that ffmpeg compares in
+RGB (r/g/b planes) have no Y plane; for those the all-plane average is used. VMAF needs an ffmpeg built with
+--enable-libvmaf and is skipped with a warning otherwise.
+"""
+
+import functools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Cuda"))
+from decoder_select import decoder_args  # noqa: E402
+
+FFMPEG = "ffmpeg"
+PSNR_IDENTICAL = 100        # ffmpeg writes "inf"; the Python path reports 100
+
+
+@functools.lru_cache(maxsize=None)
+def has_filter(name):
+    p = subprocess.run([FFMPEG, "-hide_banner", "-filters"], capture_output=True, text=True)
+    return any(line.split()[1:2] == [name] for line in p.stdout.splitlines())
+
+
+def build_metrics_cmd(original, uploaded, width, height, vmaf=False, vmaf_model=None, threads=0):
+    """ffmpeg command comparing `uploaded` (distorted) with `original` (reference).
+
+    Stats files are written to the working directory: psnr.log, ssim.log, vmaf.json.
+    """
+    filters = ["psnr=stats_file=psnr.log:shortest=1", "ssim=stats_file=ssim.log:shortest=1"]
+    if vmaf:
+        options = f"log_path=vmaf.json:log_fmt=json:n_threads={threads or os.cpu_count() or 1}:shortest=1"
+        if vmaf_model:
+            options += f":model=version={vmaf_model}"
+        filters.append("libvmaf=" + options)
+    n = len(filters)
+    graph = [
+        f"[0:v]setpts=PTS-STARTPTS,scale={width}:{height}:flags=bicubic,split={n}"
+        + "".join(f"[d{i}]" for i in range(n)),
+        "[1:v]setpts=PTS-STARTPTS,split=" + str(n) + "".join(f"[r{i}]" for i in range(n)),
+    ]
+    # the metric filters take the distorted stream first and the reference second
+    graph += [f"[d{i}][r{i}]{f}[o{i}]" for i, f in enumerate(filters)]
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin",
+           *decoder_args(uploaded), "-i", uploaded, *decoder_args(original), "-i", original,
+           "-filter_complex", ";".join(graph), "-filter_complex_threads", str(threads or os.cpu_count() or 1)]
+    for i in range(n):
+        cmd += ["-map", f"[o{i}]"]
+    return cmd + ["-f", "null", "-"]
+
+
+def _fields(line):
+    return dict(part.split(":", 1) for part in line.split() if ":" in part)
+
+
+def _number(value):
+    return PSNR_IDENTICAL if value == "inf" else float(value)
+
+
+def parse_psnr_log(path):
+    """Per-frame {plane: psnr} with whichever planes ffmpeg wrote (y/u/v, r/g/b or y only) plus "avg"."""
+    frames = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                d = _fields(line)
+                frames.append({key[5:]: _number(value) for key, value in d.items() if key.startswith("psnr_")})
+    return frames
+
+
+def parse_ssim_log(path):
+    """Per-frame {plane: ssim} with whichever planes ffmpeg wrote plus "all"."""
+    frames = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                d = _fields(line)
+                frames.append({key.lower(): float(value) for key, value in d.items() if key != "n"})
+    return frames
+
+
+def y_or_average(values):
+    """The Y plane value of a per-frame record, or the all-plane average when there is no Y plane."""
+    for key in ("y", "avg", "all"):
+        if key in values:
+            return values[key]
+    raise KeyError(f"no Y plane or average in {values}")
+
+
+def parse_vmaf_log(path):
+    with open(path) as f:
+        data = json.load(f)
+    return [frame["metrics"]["vmaf"] for frame in data.get("frames", [])]
+
+
+def run_metrics(original, uploaded, width, height, vmaf=False, vmaf_model=None, threads=0):
+    """Per-frame records [{psnr: {...}, ssim: {...}, vmaf: float|None}, ...] from one ffmpeg run."""
+    if vmaf and not has_filter("libvmaf"):
+        print("[WARN] ffmpeg has no libvmaf filter; computing PSNR/SSIM only")
+        vmaf = False
+    cmd = build_metrics_cmd(os.path.abspath(original), os.path.abspath(uploaded), width, height,
+                            vmaf, vmaf_model, threads)
+    with tempfile.TemporaryDirectory(prefix="ffmetrics_") as work:
+        # relative stats paths: no filtergraph escaping of drive letters or spaces
+        p = subprocess.run(cmd, cwd=work, stderr=subprocess.PIPE, text=True)
+        if p.returncode != 0:
+            raise RuntimeError("ffmpeg metrics failed: " + p.stderr.strip())
+        psnr = parse_psnr_log(os.path.join(work, "psnr.log"))
+        ssim = parse_ssim_log(os.path.join(work, "ssim.log"))
+        scores = parse_vmaf_log(os.path.join(work, "vmaf.json")) if vmaf else []
+    return [dict(psnr=psnr_f, ssim=ssim_f, vmaf=scores[i] if i < len(scores) else None)
+            for i, (psnr_f, ssim_f) in enumerate(zip(psnr, ssim))]
+
+
+def averages(records):
+    """(avg_psnr, avg_ssim, avg_vmaf or None) over the Y plane (see y_or_average), like compare_videos."""
+    n = len(records)
+    if n == 0:
+        return 0, 0, None
+    avg_psnr = sum(y_or_average(r["psnr"]) for r in records) / n
+    avg_ssim = sum(y_or_average(r["ssim"]) for r in records) / n
+    scores = [r["vmaf"] for r in records if r["vmaf"] is not None]
+    return avg_psnr, avg_ssim, (sum(scores) / len(scores) if scores else None)
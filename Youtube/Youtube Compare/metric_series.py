@@ -0,0 +1,106 @@
+"""
+metric_series.py
+Per-frame metric time series and a ranked index of the worst stretches.
+
+Averages hide short high-motion bursts where the re-encode falls apart. The
+compare loop already keeps one (psnr, ssim) result per frame, so exporting
+costs nothing while comparing; everything here runs once at the end.
+
+    write_series(path, fps, psnr=..., ssim=..., vmaf=...)
+        .csv      frame,time,psnr,ssim[,vmaf]
+        .npz      one float array per column (numpy.load)
+        .parquet  same columns (needs pyarrow)
+    worst_windows(ssim, fps, window_seconds, count)
+        lowest-mean windows that do not overlap, worst first
+    write_worst_index(path, windows)
+        rank,start_frame,end_frame,start_time,end_time,<metric means>
+"""
+
+import csv
+import os
+
+import numpy as np
+
+SERIES_FORMATS = (".csv", ".npz", ".parquet")
+
+
+def series_columns(fps, frames=None, **metrics):
+    """frame/time columns plus every metric that is not None, as float arrays.
+
+    `frames` gives the original frame index of each value (aligned comparisons); default 0, 1, 2, ...
+    """
+    columns = {name: np.asarray(values, dtype=np.float64) for name, values in metrics.items() if values is not None}
+    n = min((len(v) for v in columns.values()), default=0)
+    columns = {name: v[:n] for name, v in columns.items()}
+    frames = np.arange(n) if frames is None else np.asarray(frames[:n], dtype=np.int64)
+    return dict(frame=frames, time=frames / fps, **columns)
+
+
+def write_series(path, fps, frames=None, **metrics):
+    columns = series_columns(fps, frames, **metrics)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npz":
+        np.savez(path, **columns)
+    elif ext == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("writing .parquet needs pyarrow (pip install pyarrow)") from None
+        pq.write_table(pa.table(columns), path)
+    elif ext == ".csv":
+        names = list(columns)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            for i in range(len(columns["frame"])):
+                writer.writerow([int(columns[n][i]) if n == "frame" else f"{columns[n][i]:.6g}" for n in names])
+    else:
+        raise ValueError(f"unknown series format '{ext}' (use {', '.join(SERIES_FORMATS)})")
+
+
+def window_means(values, window):
+    """Mean of values[i:i + window] for every full window."""
+    c = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return (c[window:] - c[:-window]) / window
+
+
+def worst_windows(values, fps, window_seconds=2.0, count=10, frames=None, **others):
+    """The `count` non-overlapping windows with the lowest mean of `values`, worst first.
+
+    `others` (name -> per-frame values) are averaged over the same windows;
+    `frames` maps value positions to original frame indices as in series_columns.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    window = max(1, min(len(values), int(round(window_seconds * fps))))
+    if len(values) == 0:
+        return []
+    means = window_means(values, window)
+    taken = np.zeros(len(values), dtype=bool)
+    found = []
+    for start in np.argsort(means, kind="stable"):
+        if len(found) == count:
+            break
+        end = start + window
+        if taken[start:end].any():
+            continue
+        taken[start:end] = True
+        first, last = (start, end) if frames is None else (frames[start], frames[end - 1] + 1)
+        entry = dict(rank=len(found) + 1, start_frame=int(first), end_frame=int(last),
+                     start_time=float(first / fps), end_time=float(last / fps), mean=float(means[start]))
+        for name, series in others.items():
+            if series is not None:
+                entry["mean_" + name] = float(np.mean(np.asarray(series[start:end], dtype=np.float64)))
+        found.append(entry)
+    return found
+
+
+def write_worst_index(path, windows):
+    if not windows:
+        open(path, "w").close()
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(windows[0]))
+        writer.writeheader()
+        for w in windows:
+            writer.writerow({k: (f"{v:.6g}" if isinstance(v, float) else v) for k, v in w.items()})
@@ -0,0 +1,170 @@
+"""
+metrics_engine.py
+PSNR and SSIM for the compare scripts, with buffers reused from frame to frame.
+
+    psnr(a, b)                 exact: squared differences in int32 (int64 above
+                               8 bits), summed in int64; no uint8 wraparound
+    ssim(a, b, data_range)     skimage.metrics.structural_similarity defaults
+                               (7x7 window, sample covariance, K1 0.01, K2 0.03),
+                               computed in float32 with separable cv2 filters;
+                               gaussian=True gives the 11x11 sigma 1.5 window
+
+An engine owns every full-frame buffer it needs, so after the first frame a
+comparison allocates nothing per frame. engine_for() keeps one engine per
+frame shape and process, i.e. one per parallel_compare worker.
+
+Validate against skimage (and time both) with:
+    python metrics_engine.py [--size 3840x2160] [--frames 5]
+"""
+
+import argparse
+import math
+import time
+
+import cv2
+import numpy as np
+
+PSNR_IDENTICAL = 100        # what the compare scripts have always reported for identical frames
+SSIM_TOLERANCE = 1e-4       # float32 engine vs float64 skimage
+
+
+class MetricsEngine:
+    def __init__(self, height, width, dtype=np.uint8, window=7, gaussian=False, k1=0.01, k2=0.03):
+        self.shape = (height, width)
+        self.dtype = np.dtype(dtype)
+        self.k1, self.k2 = k1, k2
+        if gaussian:
+            # skimage: sigma 1.5, truncate 3.5 -> radius 5
+            window = 11
+            self.kernel = cv2.getGaussianKernel(window, 1.5, cv2.CV_32F)
+        else:
+            self.kernel = None
+        self.window = window
+        self.pad = (window - 1) // 2
+        self.cov_norm = window * window / (window * window - 1.0)
+        # 255**2 fits int32; deeper samples need int64 squares
+        self.diff = np.empty(self.shape, dtype=np.int32 if self.dtype.itemsize == 1 else np.int64)
+        self.fa, self.fb, self.tmp, self.ux, self.uy, self.uxx, self.uyy, self.uxy = (
+            np.empty(self.shape, dtype=np.float32) for _ in range(8))
+
+    def default_range(self):
+        return float(np.iinfo(self.dtype).max) if self.dtype.kind in "ui" else 1.0
+
+    def psnr(self, a, b, data_range=None):
+        data_range = data_range or self.default_range()
+        np.subtract(a, b, out=self.diff, dtype=self.diff.dtype)
+        np.multiply(self.diff, self.diff, out=self.diff)
+        sse = int(self.diff.sum(dtype=np.int64))
+        if sse == 0:
+            return PSNR_IDENTICAL
+        mse = sse / self.diff.size
+        return 10 * math.log10(data_range * data_range / mse)
+
+    def _filter(self, src, dst):
+        if self.kernel is None:
+            cv2.boxFilter(src, cv2.CV_32F, (self.window, self.window), dst=dst,
+                          normalize=True, borderType=cv2.BORDER_REFLECT)
+        else:
+            cv2.sepFilter2D(src, cv2.CV_32F, self.kernel, self.kernel, dst=dst,
+                            borderType=cv2.BORDER_REFLECT)
+
+    def ssim(self, a, b, data_range=None):
+        """Mean SSIM over the window-complete area, as skimage reports it."""
+        data_range = data_range or self.default_range()
+        c1 = (self.k1 * data_range) ** 2
+        c2 = (self.k2 * data_range) ** 2
+        fa, fb, t = self.fa, self.fb, self.tmp
+        ux, uy, uxx, uyy, uxy = self.ux, self.uy, self.uxx, self.uyy, self.uxy
+        np.copyto(fa, a, casting="unsafe")
+        np.copyto(fb, b, casting="unsafe")
+        self._filter(fa, ux)
+        self._filter(fb, uy)
+        np.multiply(fa, fa, out=t)
+        self._filter(t, uxx)
+        np.multiply(fb, fb, out=t)
+        self._filter(t, uyy)
+        np.multiply(fa, fb, out=t)
+        self._filter(t, uxy)
+
+        # fa becomes the numerator, ux the denominator; everything in place
+        np.multiply(ux, uy, out=fa)
+        np.subtract(uxy, fa, out=uxy)                  # cov(x, y) / cov_norm
+        fa *= 2
+        fa += c1                                       # 2 ux uy + C1
+        uxy *= 2 * self.cov_norm
+        uxy += c2                                      # 2 vxy + C2
+        fa *= uxy
+        np.multiply(ux, ux, out=ux)
+        np.multiply(uy, uy, out=uy)
+        np.subtract(uxx, ux, out=uxx)                  # var(x) / cov_norm
+        np.subtract(uyy, uy, out=uyy)
+        np.add(ux, uy, out=ux)
+        ux += c1                                       # ux^2 + uy^2 + C1
+        np.add(uxx, uyy, out=uxx)
+        uxx *= self.cov_norm
+        uxx += c2                                      # vx + vy + C2
+        ux *= uxx
+        np.divide(fa, ux, out=fa)
+        p = self.pad
+        return float(fa[p:fa.shape[0] - p, p:fa.shape[1] - p].mean(dtype=np.float64))
+
+
+_engines = {}
+
+
+def engine_for(shape, dtype=np.uint8, gaussian=False):
+    """The engine for frames of this shape in this process (created on first use)."""
+    key = (tuple(shape[:2]), np.dtype(dtype).str, gaussian)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = _engines[key] = MetricsEngine(shape[0], shape[1], dtype, gaussian=gaussian)
+    return engine
+
+
+def psnr(a, b, data_range=None):
+    return engine_for(a.shape, a.dtype).psnr(a, b, data_range)
+
+
+def ssim(a, b, data_range=None, gaussian=False):
+    return engine_for(a.shape, a.dtype, gaussian).ssim(a, b, data_range)
+
+
+def validate(width, height, frames):
+    """Compare with skimage on noisy frames; returns the largest SSIM difference found."""
+    from skimage.metrics import structural_similarity
+
+    rng = np.random.default_rng(7)
+    worst = 0.0
+    t_engine = t_skimage = 0.0
+    for gaussian in (False, True):
+        for _ in range(frames):
+            a = rng.integers(0, 256, (height, width), dtype=np.uint8)
+            a = cv2.GaussianBlur(a, (0, 0), 3)
+            b = np.clip(a.astype(np.int16) + rng.integers(-12, 13, a.shape), 0, 255).astype(np.uint8)
+            t0 = time.perf_counter()
+            got = ssim(a, b, gaussian=gaussian)
+            t_engine += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            want = structural_similarity(a, b, data_range=255, gaussian_weights=gaussian)
+            t_skimage += time.perf_counter() - t0
+            worst = max(worst, abs(got - want))
+            mse = np.mean((a.astype(np.float64) - b) ** 2)
+            if abs(psnr(a, b) - 10 * math.log10(255.0 ** 2 / mse)) > 1e-9:
+                raise AssertionError("PSNR differs from the float64 reference")
+    n = 2 * frames
+    print(f"[INFO] {width}x{height}: engine {1000 * t_engine / n:.1f} ms/frame, "
+          f"skimage {1000 * t_skimage / n:.1f} ms/frame")
+    return worst
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate and time the PSNR/SSIM engine against skimage")
+    parser.add_argument("--size", default="1920x1080")
+    parser.add_argument("--frames", type=int, default=3)
+    args = parser.parse_args()
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    diff = validate(w, h, args.frames)
+    if diff > SSIM_TOLERANCE:
+        print(f"[ERROR] SSIM differs from skimage by {diff:.2e} (tolerance {SSIM_TOLERANCE:.0e})")
+        raise SystemExit(1)
+    print(f"[SUCCESS] PSNR exact, SSIM within {diff:.2e} of skimage")
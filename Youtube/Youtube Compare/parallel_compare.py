@@ -0,0 +1,188 @@
+"""
+parallel_compare.py
+Per-frame comparison loop shared by the compare scripts, serial or split over processes.
+
+compare_frames(original, uploaded, frame_metrics, workers=N) cuts the
+timeline into chunks of CHUNK_FRAMES frames. Every worker process runs its
+own pair of ffmpeg decoders, seeks both to the start of its chunk and
+measures each pair with the same `frame_metrics(original_frame, uploaded_frame)`
+the serial loop uses. Chunks come back in timeline order (Pool.imap), and the
+frame counts of both videos are still totalled for the mismatch check.
+
+cv2's CAP_PROP_POS_FRAMES seek is not frame-accurate on many inter-coded
+streams, so every path, serial included, is decoded by ffmpeg
+(cached_capture.ffmpeg_frames, bgr24 or luma), which seeks to the preceding
+keyframe and decodes forward to the exact frame; serial and chunked runs
+therefore see the same pixels. Each chunk also decodes the frame just before
+its start and hashes it; if that does not match the last frame the previous
+chunk decoded, a chunk landed on the wrong frame and a warning names the
+boundary.
+
+`python parallel_compare.py original uploaded` runs the serial and the
+chunked comparison and reports the first frame where they differ.
+
+`frame_metrics` must be a module-level function so it can be sent to the
+workers. With a frame mapping from temporal_align.py the chunks are slices
+of the mapping instead.
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+
+import cv2
+import numpy as np
+
+from cached_capture import FramePairs, ffmpeg_frames, luma_frames, video_frame_count, video_size
+from temporal_align import aligned_pairs
+
+CHUNK_FRAMES = 300      # 5-10 s of video: long enough to amortize the keyframe seek
+
+
+def frame_digest(frame):
+    return hashlib.blake2b(np.ascontiguousarray(frame).data, digest_size=16).digest()
+
+
+def chunk_frames_of(video_path, start, count, luma_size=None):
+    """Frames [start, start + count) of a video: ffmpeg bgr24 at its own size, or luma at `luma_size` (w, h)."""
+    if luma_size is not None:
+        return luma_frames(video_path, *luma_size, start=start, count=count)
+    return ffmpeg_frames(video_path, *video_size(video_path), start=start, count=count, pix_fmt="bgr24")
+
+
+def edge_frames(video_path, start, count, last, luma_size, stream, edges):
+    """chunk_frames_of(), also hashing frame start - 1 (decoded, not yielded) and frame `last` into `edges`."""
+    begin = max(start - 1, 0)
+    n = None if count is None else count + start - begin
+    for index, frame in enumerate(chunk_frames_of(video_path, begin, n, luma_size), begin):
+        if index == start - 1 or index == last:
+            edges[(stream, index)] = frame_digest(frame)
+        if index >= start:
+            yield frame
+
+
+def _init_worker():
+    # one process per core already; cv2's own thread pool would only oversubscribe
+    cv2.setNumThreads(1)
+
+
+def _compare_chunk(job):
+    original_path, uploaded_path, start, count, frame_metrics, mapping, luma_size = job
+    edges = {}
+    if mapping is not None:
+        (base_a, base_b), (last_a, last_b) = mapping[0], mapping[-1]
+        pairs = aligned_pairs(edge_frames(original_path, base_a, None, last_a, luma_size, "a", edges),
+                              edge_frames(uploaded_path, base_b, None, last_b, luma_size, "b", edges),
+                              mapping, base_a, base_b)
+        results = [frame_metrics(a, b) for a, b in pairs]
+        return results, len(results), len(results), edges
+    last = None if count is None else start + count - 1
+    pairs = FramePairs(edge_frames(original_path, start, count, last, luma_size, "a", edges),
+                       edge_frames(uploaded_path, start, count, last, luma_size, "b", edges))
+    results = [frame_metrics(a, b) for a, b in pairs]
+    return results, pairs.count_a, pairs.count_b, edges
+
+
+def chunk_jobs(original_path, uploaded_path, frame_metrics, chunk_frames=CHUNK_FRAMES, mapping=None,
+               luma_size=None):
+    """One job per chunk; without a mapping the last chunk runs to the end of both files."""
+    if mapping is not None:
+        return [(original_path, uploaded_path, None, None, frame_metrics, mapping[i:i + chunk_frames], luma_size)
+                for i in range(0, len(mapping), chunk_frames)]
+    estimate = min(video_frame_count(original_path), video_frame_count(uploaded_path))
+    starts = list(range(0, max(estimate, 1), chunk_frames))
+    return [(original_path, uploaded_path, start, chunk_frames if i < len(starts) - 1 else None, frame_metrics,
+             None, luma_size) for i, start in enumerate(starts)]
+
+
+def compare_frames(original_path, uploaded_path, frame_metrics, workers=1, chunk_frames=CHUNK_FRAMES,
+                   progress=None, mapping=None, luma=False):
+    """Per-frame results of `frame_metrics` over both videos, plus their frame counts.
+
+    Returns (results, original_count, uploaded_count); `results` covers the
+    frames both videos have. workers=0 uses one process per core. `progress`
+    (e.g. a tqdm bar) gets update(n) calls as frames are done.
+
+    `mapping` ([(original_index, uploaded_index), ...] from temporal_align)
+    measures exactly those pairs instead of pairing frames by index; the
+    counts are then the number of pairs measured.
+
+    BGR frames are each video's ffmpeg bgr24 at its own size; luma=True hands
+    `frame_metrics` 2-D luma planes, both at the original's size, instead.
+    """
+    workers = workers or os.cpu_count() or 1
+    luma_size = video_size(original_path) if luma else None
+    if workers <= 1:
+        frames_a = chunk_frames_of(original_path, 0, None, luma_size)
+        frames_b = chunk_frames_of(uploaded_path, 0, None, luma_size)
+        if mapping is not None:
+            pairs = aligned_pairs(frames_a, frames_b, mapping)
+        else:
+            pairs = FramePairs(frames_a, frames_b)
+        results = []
+        for a, b in pairs:
+            results.append(frame_metrics(a, b))
+            if progress is not None:
+                progress.update(1)
+        if mapping is not None:
+            return results, len(results), len(results)
+        return results, pairs.count_a, pairs.count_b
+
+    jobs = chunk_jobs(original_path, uploaded_path, frame_metrics, chunk_frames, mapping, luma_size)
+    if not jobs:
+        return [], 0, 0
+    results, count_a, count_b = [], 0, 0
+    seen, mismatched = {}, []
+    with multiprocessing.Pool(min(workers, len(jobs)), initializer=_init_worker) as pool:
+        for chunk, n_a, n_b, edges in pool.imap(_compare_chunk, jobs):
+            results.extend(chunk)
+            count_a += n_a
+            count_b += n_b
+            for key, digest in edges.items():
+                if seen.setdefault(key, digest) != digest:
+                    mismatched.append(key)
+            if progress is not None:
+                progress.update(len(chunk))
+    if mismatched:
+        where = ", ".join(f"{'original' if stream == 'a' else 'uploaded'} frame {index}"
+                          for stream, index in sorted(mismatched, key=lambda k: k[1]))
+        print(f"[WARN] Chunk boundaries decoded differently ({where}): a seek landed on the wrong frame, "
+              "so per-frame results may be offset. Re-run with --workers 1.")
+    return results, count_a, count_b
+
+
+def pair_digests(frame_a, frame_b):
+    """frame_metrics for check_chunks(): identical digests mean identical decoded frames."""
+    return frame_digest(frame_a), frame_digest(frame_b)
+
+
+def check_chunks(original_path, uploaded_path, workers=0, chunk_frames=CHUNK_FRAMES, luma=False):
+    """Compare the chunked comparison against the serial one (workers=1); True when they saw the same frames."""
+    expected, _, _ = compare_frames(original_path, uploaded_path, pair_digests, 1, luma=luma)
+    # workers=1 would take the serial path again; the check is about the chunked one
+    chunked, _, _ = compare_frames(original_path, uploaded_path, pair_digests, max(workers or os.cpu_count() or 2, 2),
+                                   chunk_frames, luma=luma)
+    for index, (want, got) in enumerate(zip(expected, chunked)):
+        if want != got:
+            side = "original" if want[0] != got[0] else "uploaded"
+            print(f"[ERROR] Chunked decode differs from serial at frame {index} ({side})")
+            return False
+    if len(expected) != len(chunked):
+        print(f"[ERROR] Chunked decode has {len(chunked)} frame pairs, serial {len(expected)}")
+        return False
+    print(f"[SUCCESS] {len(expected)} frame pairs identical in chunks of {chunk_frames} and in one pass")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check chunked (parallel) decoding against a serial pass")
+    parser.add_argument("original")
+    parser.add_argument("uploaded")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: one per core)")
+    parser.add_argument("--chunk-frames", type=int, default=CHUNK_FRAMES)
+    parser.add_argument("--luma", action="store_true", help="check the luma decode instead of bgr24")
+    args = parser.parse_args()
+
+    ok = check_chunks(args.original, args.uploaded, args.workers, args.chunk_frames, args.luma)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,117 @@
+"""
+plane_metrics.py
+PSNR / SSIM per Y, U and V plane at the source's own bit depth.
+
+The BGR -> gray path throws away exactly what the 10-bit 4:4:4 masters
+(yuv444p10le from the enhancers) add: the extra bits and the chroma. Here
+both videos are decoded by ffmpeg to the reference's planar YUV layout and
+depth (the upload is scaled to the reference size and its chroma brought to
+the same subsampling), read from a raw pipe into one reused buffer, and each
+plane is measured with its own metrics engine, with peak 2**bits - 1.
+
+    compare_planes(original, uploaded)
+        -> dict(pix_fmt, bits, frames, y/u/v: dict(psnr, ssim), psnr_yuv)
+
+psnr_yuv is the usual 6:1:1 weighted PSNR of the three planes.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+
+import metrics_engine
+from cached_capture import FramePairs
+from temporal_align import aligned_pairs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Cuda"))
+from decoder_select import decoder_args  # noqa: E402
+from frame_cache import pipe_frames  # noqa: E402
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+PLANES = ("y", "u", "v")
+# semi-planar and packed-depth formats -> (chroma layout, bits)
+ALIASES = {"nv12": ("420", 8), "nv21": ("420", 8), "nv16": ("422", 8), "nv24": ("444", 8),
+           "p010le": ("420", 10), "p016le": ("420", 16), "p210le": ("422", 10), "p410le": ("444", 10)}
+SUBSAMPLING = {"420": (2, 2), "422": (2, 1), "444": (1, 1)}
+
+
+def probe_stream(path):
+    cmd = [FFPROBE, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=width,height,pix_fmt", "-of", "json", path]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        raise RuntimeError("ffprobe failed: " + p.stderr)
+    s = json.loads(p.stdout)["streams"][0]
+    return int(s["width"]), int(s["height"]), s.get("pix_fmt", "yuv420p")
+
+
+def planar_format(pix_fmt):
+    """(ffmpeg planar pix_fmt, chroma layout, bits) to decode a source of `pix_fmt` without losing depth."""
+    m = re.match(r"^yuvj?(420|422|444)p(\d+)?(le|be)?$", pix_fmt)
+    if m:
+        layout, bits = m.group(1), int(m.group(2) or 8)
+    else:
+        layout, bits = ALIASES.get(pix_fmt, ("420", 8))
+    name = f"yuv{layout}p" + (f"{bits}le" if bits > 8 else "")
+    return name, layout, bits
+
+
+def plane_shapes(width, height, layout):
+    sx, sy = SUBSAMPLING[layout]
+    chroma = (-(-height // sy), -(-width // sx))
+    return [(height, width), chroma, chroma]
+
+
+def plane_frames(path, width, height, pix_fmt, shapes, dtype):
+    """Yield (y, u, v) views of each frame decoded to `pix_fmt` at width x height (buffer reused)."""
+    sizes = [h * w for h, w in shapes]
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin", *decoder_args(path), "-i", path,
+           "-map", "0:v:0", "-vf", f"scale={width}:{height}:flags=bicubic", "-vsync", "0",
+           "-f", "rawvideo", "-pix_fmt", pix_fmt, "-"]
+    for buf in pipe_frames(cmd, (sum(sizes),), dtype):
+        planes, offset = [], 0
+        for (h, w), n in zip(shapes, sizes):
+            planes.append(buf[offset:offset + n].reshape(h, w))
+            offset += n
+        yield planes
+
+
+def weighted_psnr(y, u, v):
+    return (6 * y + u + v) / 8
+
+
+def compare_planes(original_path, uploaded_path, mapping=None):
+    """Per-plane average PSNR/SSIM of `uploaded_path` against `original_path` at full bit depth.
+
+    `mapping` (temporal_align pairs) measures only those frame pairs.
+    """
+    width, height, source_fmt = probe_stream(original_path)
+    pix_fmt, layout, bits = planar_format(source_fmt)
+    dtype = np.uint8 if bits <= 8 else np.uint16
+    peak = float((1 << bits) - 1)
+    shapes = plane_shapes(width, height, layout)
+    frames_a = plane_frames(original_path, width, height, pix_fmt, shapes, dtype)
+    frames_b = plane_frames(uploaded_path, width, height, pix_fmt, shapes, dtype)
+    if mapping is not None:
+        pairs = aligned_pairs(frames_a, frames_b, mapping)
+    else:
+        pairs = FramePairs(frames_a, frames_b)
+    engines = [metrics_engine.engine_for(shape, dtype) for shape in shapes]
+    totals = np.zeros((3, 2))
+    n = 0
+    for planes_a, planes_b in pairs:
+        for i, engine in enumerate(engines):
+            totals[i, 0] += engine.psnr(planes_a[i], planes_b[i], peak)
+            totals[i, 1] += engine.ssim(planes_a[i], planes_b[i], peak)
+        n += 1
+    means = totals / max(n, 1)
+    result = dict(pix_fmt=pix_fmt, bits=bits, frames=n)
+    for i, plane in enumerate(PLANES):
+        result[plane] = dict(psnr=float(means[i, 0]), ssim=float(means[i, 1]))
+    result["psnr_yuv"] = float(weighted_psnr(*means[:, 0]))
+    return result
@@ -0,0 +1,114 @@
+"""
+sampled_compare.py
+Quick comparison from a sample of frames, with confidence intervals and early stop.
+
+Instead of measuring every frame pair, only sample points are measured
+(every Nth frame, or K random frames). Random points, and every-Nth points
+with a tolerance, are each read with ffmpeg's frame-accurate seek
+(cached_capture.ffmpeg_frames) in both videos and visited in random order, so
+the running mean is an unbiased estimate at every step; once the confidence
+interval of PSNR (and/or SSIM) is narrower than the requested tolerance the
+run stops. Every-Nth points without a tolerance are all measured anyway, so
+both videos are decoded once, front to back, and the other frames dropped.
+
+    every=N          candidate points 0, N, 2N, ...
+    samples=K        K distinct random points over the whole video
+    tolerance_psnr   stop when the PSNR interval is +/- this many dB
+    tolerance_ssim   stop when the SSIM interval is +/- this much
+"""
+
+import math
+import random
+import statistics
+
+from cached_capture import ffmpeg_frames, video_frame_count, video_size
+
+MIN_SAMPLES = 10        # the interval estimate is meaningless on a handful of frames
+
+
+class RunningMean:
+    """Welford mean/variance; `half_width(z)` is the normal-approximation confidence interval."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def half_width(self, z):
+        if self.n < 2:
+            return math.inf
+        return z * math.sqrt(self.m2 / (self.n - 1) / self.n)
+
+
+def sample_points(total, every=None, samples=None, seed=0):
+    """Frame indices to measure, in the (random) order they should be visited."""
+    rng = random.Random(seed)
+    if every:
+        points = list(range(0, total, every))
+    else:
+        points = rng.sample(range(total), min(samples, total))
+    rng.shuffle(points)
+    return points
+
+
+def read_at(video_path, size, index):
+    """BGR frame `index` of a video (None past its end), by a frame-accurate ffmpeg seek."""
+    for frame in ffmpeg_frames(video_path, *size, start=index, count=1, pix_fmt="bgr24"):
+        return frame.copy()
+    return None
+
+
+def seeked_pairs(original_path, uploaded_path, points):
+    """(frame_a, frame_b) at each point, in the order given; points past either end are skipped."""
+    size_a, size_b = video_size(original_path), video_size(uploaded_path)
+    for index in points:
+        frame_a = read_at(original_path, size_a, index)
+        frame_b = read_at(uploaded_path, size_b, index)
+        if frame_a is not None and frame_b is not None:
+            yield frame_a, frame_b
+
+
+def strided_pairs(original_path, uploaded_path, every):
+    """(frame_a, frame_b) at frames 0, every, 2 * every, ... from one sequential decode of each video."""
+    frames_a = ffmpeg_frames(original_path, *video_size(original_path), pix_fmt="bgr24")
+    frames_b = ffmpeg_frames(uploaded_path, *video_size(uploaded_path), pix_fmt="bgr24")
+    for index, (frame_a, frame_b) in enumerate(zip(frames_a, frames_b)):
+        if index % every == 0:
+            yield frame_a, frame_b
+
+
+def compare_sampled(original_path, uploaded_path, frame_metrics, every=None, samples=None,
+                    tolerance_psnr=None, tolerance_ssim=None, confidence=0.95, seed=0):
+    """Mean PSNR/SSIM over sampled frame pairs with their confidence half-widths.
+
+    Returns dict(avg_psnr, avg_ssim, psnr_ci, ssim_ci, sampled_frames, candidate_frames, stopped_early).
+    """
+    if not every and not samples:
+        raise ValueError("give every=N or samples=K")
+    total = min(video_frame_count(original_path), video_frame_count(uploaded_path))
+    points = sample_points(total, every, samples, seed)
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    psnr, ssim = RunningMean(), RunningMean()
+    stopped_early = False
+    if every and not (tolerance_psnr or tolerance_ssim):
+        pairs = strided_pairs(original_path, uploaded_path, every)
+    else:
+        # frames past the end (the container's count was an overestimate) are skipped
+        pairs = seeked_pairs(original_path, uploaded_path, points)
+    for frame_a, frame_b in pairs:
+        p, s = frame_metrics(frame_a, frame_b)
+        psnr.add(p)
+        ssim.add(s)
+        if psnr.n >= MIN_SAMPLES and (tolerance_psnr or tolerance_ssim) \
+                and (not tolerance_psnr or psnr.half_width(z) <= tolerance_psnr) \
+                and (not tolerance_ssim or ssim.half_width(z) <= tolerance_ssim):
+            stopped_early = psnr.n < len(points)
+            break
+    return dict(avg_psnr=psnr.mean, avg_ssim=ssim.mean, psnr_ci=psnr.half_width(z), ssim_ci=ssim.half_width(z),
+                sampled_frames=psnr.n, candidate_frames=len(points), stopped_early=stopped_early)
@@ -0,0 +1,211 @@
+"""
+temporal_align.py
+Match the frames of an uploaded rendition to the original before measuring them.
+
+YouTube renditions drop or repeat frames, change the frame rate or start a
+little earlier or later; pairing frames by index then compares unrelated
+pictures from the first mismatch on. align_videos() pairs them by content:
+
+  1. fingerprints: one cheap ffmpeg decode per video straight to 32x18 gray
+     (both at once), each normalized to zero mean / unit variance so level
+     shifts from the re-encode do not matter;
+  2. coarse offset: cross-correlation of the frame-to-frame activity of both
+     videos on the original's timeline;
+  3. mapping: dynamic programming over a band around that line. Every
+     uploaded frame picks an original frame; from one uploaded frame to the
+     next the original index may stay (duplicate), advance by the frame rate
+     ratio, or skip ahead (dropped frames), with a small penalty for anything
+     but the expected step.
+
+Pairs whose fingerprints still differ a lot (inserted black frames, cards)
+are left out, so the full-quality metrics only see matched pairs. The mapping
+is a list of (original_index, uploaded_index), increasing in both.
+"""
+
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Cuda"))
+from decoder_select import decoder_args  # noqa: E402
+from frame_cache import pipe_frames  # noqa: E402
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+FINGERPRINT_SIZE = (32, 18)     # width, height
+MAX_OFFSET_SECONDS = 10.0       # largest start shift searched for
+BAND_SECONDS = 1.5              # how far the mapping may wander from the coarse line
+STEP_PENALTY = 0.05             # cost per frame of deviation from the expected step
+UNMATCHED_FACTOR = 4.0          # pairs costing more than this times the median are dropped
+
+
+def probe_fps(path):
+    cmd = [FFPROBE, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=avg_frame_rate,r_frame_rate", "-of", "json", path]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        raise RuntimeError("ffprobe failed: " + p.stderr)
+    stream = json.loads(p.stdout)["streams"][0]
+    for key in ("avg_frame_rate", "r_frame_rate"):
+        num, _, den = stream.get(key, "0/0").partition("/")
+        if float(num or 0) > 0 and float(den or 1) > 0:
+            return float(num) / float(den or 1)
+    return 30.0
+
+
+def fingerprints(path, size=FINGERPRINT_SIZE):
+    """(frames, w*h) float32 array: every frame shrunk to `size` gray, normalized per frame."""
+    w, h = size
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin", *decoder_args(path), "-i", path,
+           "-map", "0:v:0", "-vf", f"scale={w}:{h}:flags=area", "-vsync", "0",
+           "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+    rows = [frame.reshape(-1).copy() for frame in pipe_frames(cmd, (h, w), np.uint8)]
+    fp = np.array(rows, dtype=np.float32).reshape(len(rows), w * h)
+    fp -= fp.mean(axis=1, keepdims=True)
+    fp /= fp.std(axis=1, keepdims=True) + 1.0     # +1: flat frames stay near zero instead of exploding
+    return fp
+
+
+def both_fingerprints(original_path, uploaded_path):
+    """Fingerprints of both videos, decoded concurrently."""
+    out = {}
+
+    def run(key, path):
+        try:
+            out[key] = fingerprints(path)
+        except Exception as e:      # re-raised in the caller's thread
+            out[key] = e
+
+    threads = [threading.Thread(target=run, args=(k, p)) for k, p in (("a", original_path), ("b", uploaded_path))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for value in out.values():
+        if isinstance(value, Exception):
+            raise value
+    return out["a"], out["b"]
+
+
+def activity(fp):
+    """Mean absolute change from the previous frame (0 for the first)."""
+    if len(fp) < 2:
+        return np.zeros(len(fp), dtype=np.float32)
+    return np.concatenate(([0.0], np.abs(np.diff(fp, axis=0)).mean(axis=1))).astype(np.float32)
+
+
+def coarse_offset(fp_a, fp_b, ratio, max_offset):
+    """Original-frame offset o such that uploaded frame i shows about original frame i * ratio + o."""
+    act_a = activity(fp_a)
+    act_b = activity(fp_b)
+    # uploaded activity on the original's timeline
+    t = np.arange(int(len(fp_b) * ratio)) / ratio
+    act_b = np.interp(t, np.arange(len(act_b)), act_b) if len(act_b) else act_b
+    if len(act_a) < 2 or len(act_b) < 2:
+        return 0
+    a = (act_a - act_a.mean()) / (act_a.std() + 1e-6)
+    b = (act_b - act_b.mean()) / (act_b.std() + 1e-6)
+    best, best_score = 0, -np.inf
+    for lag in range(-max_offset, max_offset + 1):
+        # compare a[lag + k] with b[k]
+        lo, hi = max(0, -lag), min(len(b), len(a) - lag)
+        if hi - lo < max(2, min(len(a), len(b)) // 4):
+            continue
+        score = float(np.dot(a[lo + lag:hi + lag], b[lo:hi])) / (hi - lo)
+        if score > best_score:
+            best, best_score = lag, score
+    return best
+
+
+def dp_mapping(fp_a, fp_b, ratio, offset, band):
+    """Monotonic original index per uploaded frame (-1 where out of range), and each pair's cost."""
+    n_a, n_b = len(fp_a), len(fp_b)
+    centers = np.rint(np.arange(n_b) * ratio + offset).astype(np.int64)
+    rows = np.nonzero((centers >= 0) & (centers < n_a))[0]
+    mapping = np.full(n_b, -1, dtype=np.int64)
+    costs = np.full(n_b, np.inf)
+    if len(rows) == 0:
+        return mapping, costs
+    width = 2 * band + 1
+    steps = np.arange(int(math.ceil(ratio)) + 3)          # 0 = duplicate, > ratio = dropped frames
+    penalty = STEP_PENALTY * np.abs(steps - ratio)
+    back = np.zeros((len(rows), width), dtype=np.uint8)
+    prev = prev_lo = None
+    for r, i in enumerate(rows):
+        lo = centers[i] - band
+        j = lo + np.arange(width)
+        valid = (j >= 0) & (j < n_a)
+        cost = np.full(width, np.inf, dtype=np.float64)
+        cost[valid] = np.abs(fp_a[j[valid]] - fp_b[i]).mean(axis=1)
+        if prev is None:
+            total = cost
+        else:
+            best = np.full(width, np.inf)
+            for k, pen in zip(steps, penalty):
+                idx = j - k - prev_lo
+                ok = (idx >= 0) & (idx < width)
+                cand = np.full(width, np.inf)
+                cand[ok] = prev[idx[ok]] + pen
+                better = cand < best
+                best[better] = cand[better]
+                back[r, better] = k
+            total = cost + best
+        prev, prev_lo = total, lo
+    # backtrack from the cheapest end
+    pos = int(np.argmin(prev))
+    for r in range(len(rows) - 1, -1, -1):
+        i = rows[r]
+        j = centers[i] - band + pos
+        mapping[i] = j
+        costs[i] = np.abs(fp_a[j] - fp_b[i]).mean()
+        if r:
+            prev_j = j - int(back[r, pos])
+            pos = int(prev_j - (centers[rows[r - 1]] - band))
+    return mapping, costs
+
+
+def align_videos(original_path, uploaded_path, verbose=True):
+    """[(original_index, uploaded_index), ...] of content-matched frame pairs."""
+    fps_a, fps_b = probe_fps(original_path), probe_fps(uploaded_path)
+    fp_a, fp_b = both_fingerprints(original_path, uploaded_path)
+    ratio = fps_a / fps_b
+    offset = coarse_offset(fp_a, fp_b, ratio, int(MAX_OFFSET_SECONDS * fps_a))
+    mapping, costs = dp_mapping(fp_a, fp_b, ratio, offset, max(2, int(BAND_SECONDS * fps_a)))
+    matched = np.isfinite(costs)
+    if matched.any():
+        limit = UNMATCHED_FACTOR * max(float(np.median(costs[matched])), 1e-3)
+        matched &= costs <= limit
+    pairs = [(int(mapping[i]), int(i)) for i in np.nonzero(matched)[0]]
+    if verbose:
+        steps = np.diff([j for j, _ in pairs]) if len(pairs) > 1 else np.array([])
+        print(f"[INFO] Alignment: {len(pairs)} of {len(fp_b)} uploaded frames matched to {len(fp_a)} original; "
+              f"offset {offset / fps_a:+.3f}s, fps {fps_a:.3f}/{fps_b:.3f}, "
+              f"{int(np.sum(steps == 0))} repeated, {int(np.sum(np.maximum(steps - math.ceil(ratio), 0)))} skipped")
+    return pairs
+
+
+def aligned_pairs(frames_a, frames_b, mapping, base_a=0, base_b=0):
+    """Yield (frame_a, frame_b) for each (index_a, index_b) in `mapping` from two sequential streams.
+
+    base_a / base_b are the indices of the first frame each stream yields.
+    """
+    it_a, it_b = iter(frames_a), iter(frames_b)
+    pos_a, pos_b = base_a - 1, base_b - 1
+    frame_a = frame_b = None
+    for index_a, index_b in mapping:
+        while pos_a < index_a:
+            frame_a = next(it_a, None)
+            if frame_a is None:
+                return
+            pos_a += 1
+        while pos_b < index_b:
+            frame_b = next(it_b, None)
+            if frame_b is None:
+                return
+            pos_b += 1
+        yield frame_a, frame_b